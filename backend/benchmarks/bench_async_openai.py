@@ -0,0 +1,92 @@
+"""
+Concurrency benchmark for the async Azure OpenAI path.
+
+Starts the local Azure OpenAI stub, points main.py at it and fires N parallel
+/assess-skin requests. With a non-blocking client, N requests should finish in
+roughly the time of one stub round trip instead of N times that.
+
+Usage:
+    python benchmarks/bench_async_openai.py --concurrency 20 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from load_test import make_photo
+
+
+def start_stub(latency: float) -> int:
+    """Run the Azure OpenAI stub on a free local port in a background thread"""
+    import uvicorn
+    from stubs import azure_openai_stub
+
+    azure_openai_stub.stub_latency = latency
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        stub_port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(azure_openai_stub.app, host="127.0.0.1", port=stub_port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return stub_port
+
+
+async def run(concurrency: int, path: str):
+    import httpx
+    import main
+
+    # Textured, so it passes the image quality gate like a real photo
+    image = make_photo()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+
+        async def one_request():
+            response = await http.post(path, files={"file": ("test.jpg", image, "image/jpeg")})
+            response.raise_for_status()
+
+        # Warm up the connection pool so both runs measure steady state
+        await one_request()
+
+        start = time.perf_counter()
+        await one_request()
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(concurrency)))
+        parallel = time.perf_counter() - start
+
+    await main.close_openai_client()
+    return single, parallel
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Async Azure OpenAI concurrency benchmark")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0, help="Stub latency per completion in seconds")
+    parser.add_argument("--path", default="/assess-skin")
+    args = parser.parse_args()
+
+    stub_port = start_stub(args.latency)
+    os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{stub_port}/"
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "stub-key")
+    # Every request must reach the stub, or the result cache and coalescing hide the concurrency
+    os.environ.setdefault("ASSESSMENT_CACHE_ENABLED", "False")
+    os.environ.setdefault("LLM_COALESCING_ENABLED", "False")
+
+    single, parallel = asyncio.run(run(args.concurrency, args.path))
+    print(f"📊 {args.path} against stub with {args.latency:.2f}s latency")
+    print(f"   - 1 request:  {single:.2f}s")
+    print(f"   - {args.concurrency} parallel requests: {parallel:.2f}s")
+    print(f"   - Speedup vs serial: {single * args.concurrency / parallel:.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,70 @@
+"""
+Per-request logging cost of the GCP insight extraction.
+
+Builds a synthetic AnnotateVideoResponse the size of a few minutes of real
+video and runs extract_gcp_insights under different logging setups. The
+"debug, unsampled" setup logs every per-object attribute dump, which is what
+the old unconditional print debugging did on every request.
+
+Usage:
+    python benchmarks/bench_logging.py --tracks 400 --labels 150 --requests 20
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# (label, log level, debug sample rate)
+SETUPS = [
+    ("debug, unsampled (old prints)", "DEBUG", 1.0),
+    ("debug, 1% sampled", "DEBUG", 0.01),
+    ("info (default)", "INFO", 0.01),
+]
+
+
+class CountingStream:
+    """Write sink that only counts what the log handler writes"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text: str):
+        self.bytes += len(text.encode("utf-8"))
+
+    def flush(self):
+        pass
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Logging cost benchmark")
+    parser.add_argument("--tracks", type=int, default=400, help="Face and person tracks each")
+    parser.add_argument("--labels", type=int, default=150)
+    parser.add_argument("--shots", type=int, default=60)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "bench-key")
+    import main
+    from stubs.fake_video_intelligence import make_annotate_response
+
+    result = make_annotate_response(args.tracks, args.labels, args.shots)
+    print(f"📊 extract_gcp_insights over {args.tracks} face + {args.tracks} person tracks, {args.labels} labels")
+
+    for label, level, sample_rate in SETUPS:
+        sink = CountingStream()
+        main.log_level, main.log_debug_sample_rate = level, sample_rate
+        main.configure_logging(stream=sink)
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            main.extract_gcp_insights(result)
+        per_request_ms = (time.perf_counter() - start) * 1000 / args.requests
+
+        print(f"   - {label:<30} {per_request_ms:8.2f} ms/request  {sink.bytes / args.requests / 1024:9.1f} KB logged/request")
+
+
+if __name__ == "__main__":
+    main_cli()
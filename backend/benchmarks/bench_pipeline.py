@@ -0,0 +1,299 @@
+"""
+Microbenchmarks for the CPU-bound pipeline stages, with saved baselines.
+
+Cases:
+- process_image on synthetic phone photos at several resolutions, as JPEG
+  and PNG (and HEIC when pillow-heif is installed)
+- extract_video_frames on synthetic clips of several lengths and codecs
+- extract_gcp_insights on an AnnotateVideoResponse (synthetic, or a real one
+  recorded with --record-annotation / passed with --annotation)
+- parse_llm_json on typical model replies
+
+Each case runs in its own subprocess and reports ops/sec, p50/p99 latency
+and peak RSS. Everything runs offline.
+
+Usage:
+    python benchmarks/bench_pipeline.py                        # run and compare with the saved baseline
+    python benchmarks/bench_pipeline.py --save-baseline        # run and overwrite the baseline
+    python benchmarks/bench_pipeline.py --cases process_image  # only cases whose name starts with this
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baselines", "pipeline.json")
+
+# Common phone camera outputs (width, height)
+IMAGE_RESOLUTIONS = {"1MP": (1280, 960), "3MP": (2048, 1536), "12MP": (4032, 3024)}
+IMAGE_FORMATS = ["JPEG", "PNG", "HEIC"]
+VIDEO_CLIPS = [(10, "h264"), (60, "h264"), (10, "mp4v")]
+
+LLM_REPLIES = {
+    "json": json.dumps({
+        "condition": "Mild eczema", "confidence": 0.82, "description": "Dry patches on both cheeks. " * 20,
+        "recommendations": ["Use fragrance-free moisturizer", "See a pediatrician if it spreads"], "severity": "mild",
+    }),
+}
+LLM_REPLIES["fenced"] = f"```json\n{LLM_REPLIES['json']}\n```"
+LLM_REPLIES["prose"] = f"Here is my assessment of the image.\n\n{LLM_REPLIES['json']}\n\nPlease consult a doctor if symptoms persist."
+
+
+def heif_available() -> bool:
+    try:
+        import pillow_heif  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_photo(resolution: str, image_format: str) -> str:
+    """Write (or reuse) a gradient with sensor-like noise, so encoders see a realistic amount of detail
+
+    Photos are generated by the parent process, so building them does not
+    count towards a case's peak RSS.
+    """
+    path = os.path.join(tempfile.gettempdir(), f"bench_photo_{resolution}.{image_format.lower()}")
+    if os.path.exists(path):
+        return path
+
+    import numpy as np
+    from PIL import Image
+
+    width, height = IMAGE_RESOLUTIONS[resolution]
+    rng = np.random.default_rng(0)
+    x = np.arange(width, dtype=np.int16)[None, :]
+    y = np.arange(height, dtype=np.int16)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = (x.astype(np.int32) * 255 // width).astype(np.uint8)
+    pixels[..., 1] = (y.astype(np.int32) * 255 // height).astype(np.uint8)
+    pixels[..., 2] = ((x.astype(np.int32) + y) * 127 // (width + height) + 64).astype(np.uint8)
+    pixels += rng.integers(0, 12, pixels.shape, dtype=np.uint8)
+
+    if image_format == "HEIC":
+        import pillow_heif
+
+        pillow_heif.from_bytes(mode="RGB", size=(width, height), data=pixels.tobytes()).save(path, quality=85)
+    else:
+        Image.fromarray(pixels).save(path, format=image_format, **({"quality": 92} if image_format == "JPEG" else {}))
+    return path
+
+
+def list_cases(annotation_path):
+    cases = []
+    for resolution in IMAGE_RESOLUTIONS:
+        for image_format in IMAGE_FORMATS:
+            if image_format == "HEIC" and not heif_available():
+                continue
+            cases.append(f"process_image/{image_format}/{resolution}")
+    for duration, codec in VIDEO_CLIPS:
+        cases.append(f"extract_video_frames/{codec}/{duration}s")
+    cases.append("extract_gcp_insights/recorded" if annotation_path else "extract_gcp_insights/synthetic")
+    for kind in LLM_REPLIES:
+        cases.append(f"parse_llm_json/{kind}")
+    return cases
+
+
+def setup_case(case: str, annotation_path):
+    """Build the inputs for a case and return the zero-argument function to time"""
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "bench-key")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import main
+
+    group, variant, *rest = case.split("/")
+    if group == "process_image":
+        if variant == "HEIC":
+            import pillow_heif
+
+            pillow_heif.register_heif_opener()
+        with open(make_photo(rest[0], variant), "rb") as photo:
+            image = photo.read()
+        return lambda: main.process_image(image, "assess-skin")
+
+    if group == "extract_video_frames":
+        from bench_frame_extraction import make_clip
+
+        clip = make_clip(int(rest[0].rstrip("s")), 1280, 720, 30, variant, 60)
+        return lambda: main.extract_video_frames(clip, num_frames=5, max_frames=main.video_llm_frames)
+
+    if group == "extract_gcp_insights":
+        if annotation_path:
+            from google.cloud import videointelligence_v1
+
+            with open(annotation_path) as annotation_file:
+                result = videointelligence_v1.AnnotateVideoResponse.from_json(annotation_file.read(), ignore_unknown_fields=True)
+        else:
+            from stubs.fake_video_intelligence import make_annotate_response
+
+            result = make_annotate_response(tracks=100, labels=60, shots=30)
+        return lambda: main.extract_gcp_insights(result)
+
+    if group == "parse_llm_json":
+        reply = LLM_REPLIES[variant]
+        return lambda: main.parse_llm_json(reply)
+
+    raise ValueError(f"Unknown case {case}")
+
+
+def worker(case: str, annotation_path, min_time: float, max_iterations: int):
+    func = setup_case(case, annotation_path)
+    func()  # warm-up: imports, codec init, lazy clients
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iterations and (time.perf_counter() - started < min_time or len(latencies) < 5):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    print(json.dumps({
+        "iterations": len(latencies),
+        "ops_per_sec": len(latencies) / sum(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def peak_rss_mb() -> float:
+    """High-water RSS of this process
+
+    Read from /proc rather than wait4(): Linux carries ru_maxrss over from the
+    forking parent, while VmHWM starts fresh with the exec'd image.
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_case(case: str, args) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--worker", case,
+               "--min-time", str(args.min_time), "--max-iterations", str(args.max_iterations)]
+    if args.annotation:
+        command += ["--annotation", args.annotation]
+    with tempfile.TemporaryFile(mode="w+") as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True)
+        output = process.stdout.read()
+        if process.wait():
+            errors.seek(0)
+            raise RuntimeError(f"{case} failed:\n{errors.read()}")
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list[str]:
+    regressions = []
+    for case, result in results.items():
+        previous = baseline.get("cases", {}).get(case)
+        if not previous:
+            continue
+        # Microsecond cases swing by more than the tolerance on noise alone, so a slowdown must also exceed min_delta_ms
+        slowdown = result["p50_ms"] - previous["p50_ms"]
+        if result["p50_ms"] > previous["p50_ms"] * (1 + tolerance) and slowdown > min_delta_ms:
+            regressions.append(f"{case}: p50 {previous['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms")
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{case}: peak RSS {previous['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def record_annotation(video_path: str, output_path: str):
+    """Run a real GCP annotation once and save the response for offline runs"""
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "bench-key")
+    import main
+    from google.cloud import videointelligence_v1
+
+    with open(video_path, "rb") as video_file:
+        request = videointelligence_v1.AnnotateVideoRequest(
+            input_content=video_file.read(),
+            features=[
+                videointelligence_v1.Feature.FACE_DETECTION,
+                videointelligence_v1.Feature.PERSON_DETECTION,
+                videointelligence_v1.Feature.LABEL_DETECTION,
+                videointelligence_v1.Feature.SHOT_CHANGE_DETECTION,
+            ],
+        )
+    result = main.get_video_intelligence_client().annotate_video(request=request).result(timeout=600)
+    with open(output_path, "w") as output_file:
+        output_file.write(videointelligence_v1.AnnotateVideoResponse.to_json(result))
+    print(f"💾 Saved AnnotateVideoResponse to {output_path}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Pipeline stage microbenchmarks")
+    parser.add_argument("--cases", nargs="*", help="Only run cases starting with these prefixes")
+    parser.add_argument("--min-time", type=float, default=2.0, help="Seconds to spend per case")
+    parser.add_argument("--max-iterations", type=int, default=1000)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write results to the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a case counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Smallest p50 slowdown in ms that counts as a regression")
+    parser.add_argument("--annotation", help="Recorded AnnotateVideoResponse JSON to use for extract_gcp_insights")
+    parser.add_argument("--record-annotation", metavar="VIDEO", help="Annotate VIDEO with GCP and save it to --annotation")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.annotation, args.min_time, args.max_iterations)
+        return
+    if args.record_annotation:
+        record_annotation(args.record_annotation, args.annotation or "annotate_video_response.json")
+        return
+
+    cases = [
+        case for case in list_cases(args.annotation)
+        if not args.cases or any(case.startswith(prefix) for prefix in args.cases)
+    ]
+    if not heif_available():
+        print("ℹ️ pillow-heif not installed, skipping HEIC cases")
+
+    # Build media up front so generation cost stays out of the per-case subprocesses
+    for case in cases:
+        group, variant, *rest = case.split("/")
+        if group == "process_image":
+            make_photo(rest[0], variant)
+        elif group == "extract_video_frames":
+            from bench_frame_extraction import make_clip
+
+            make_clip(int(rest[0].rstrip("s")), 1280, 720, 30, variant, 60)
+
+    results = {}
+    print(f"📊 {'case':<38} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS':>10}")
+    for case in cases:
+        result = results[case] = run_case(case, args)
+        print(
+            f"   {case:<38} {result['ops_per_sec']:9.1f} {result['p50_ms']:9.2f} "
+            f"{result['p99_ms']:9.2f} {result['peak_rss_mb']:8.1f} MB"
+        )
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(), "cases": results}, baseline_file, indent=2)
+        print(f"💾 Saved baseline to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%}, min {args.min_delta_ms:g} ms)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,214 @@
+"""
+Worker startup benchmark, tracked per release.
+
+Measures, in fresh subprocesses so nothing is cached between runs:
+- import time of main.py (python -X importtime), and the slowest modules it
+  imports directly
+- time from launching uvicorn until /health answers (ready)
+- time from launch to the first successful /assess-skin (first success), and
+  that first request's own latency, with PREWARM_ENABLED off and on
+
+The API runs against the local Azure OpenAI stub, so everything is offline.
+Before the first request the benchmark waits --idle seconds, like a load
+balancer adding a new instance after its health checks pass; that idle time
+is excluded from first success. Results are compared with the last entry of
+the history file; --record appends this run to it, tagged with the app
+version and git commit, once per release.
+
+Usage:
+    python benchmarks/bench_startup.py                         # run and compare with the last recorded release
+    python benchmarks/bench_startup.py --record                # run and append to the history
+    python benchmarks/bench_startup.py --runs 10 --idle 0      # first request right after /health
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from load_test import free_port, make_photo, start_process, wait_until_up
+
+DEFAULT_HISTORY = os.path.join(BENCHMARKS_DIR, "baselines", "startup.jsonl")
+
+# Lower is better for every tracked metric
+TRACKED_METRICS = ["import_ms", "cold/ready_ms", "cold/first_success_ms", "prewarm/ready_ms", "prewarm/first_request_ms"]
+
+
+def api_env(openai_port: int, prewarm: bool) -> dict:
+    return {
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{openai_port}/",
+        "AZURE_OPENAI_API_KEY": "startup-bench",
+        "ASSESSMENT_CACHE_ENABLED": "False",
+        "PREWARM_ENABLED": str(prewarm),
+        "PREWARM_DELAY": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def measure_import(openai_port: int) -> tuple[float, dict]:
+    """Import main.py once in a fresh interpreter; return its cumulative ms and ms per directly imported module"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env={**os.environ, **api_env(openai_port, False)},
+        capture_output=True, text=True, check=True,
+    )
+    # Lines look like "import time:  self [us] | cumulative | <indent>package"; children come before their parent
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            rows.append((len(match.group(3)), match.group(4), int(match.group(2)) / 1000))
+    main_index = next(i for i, (depth, name, _) in enumerate(rows) if name == "main" and depth == 1)
+    modules = {}
+    for depth, name, cumulative_ms in reversed(rows[:main_index]):
+        if depth == 3:
+            modules[name.split(".")[0]] = modules.get(name.split(".")[0], 0.0) + cumulative_ms
+        elif depth == 1:
+            break
+    return rows[main_index][2], modules
+
+
+async def measure_launch(openai_port: int, photo: bytes, prewarm: bool, idle: float) -> dict:
+    """Launch the API once; time /health, then the first successful /assess-skin"""
+    import httpx
+
+    api_port = free_port()
+    base_url = f"http://127.0.0.1:{api_port}"
+    launched = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **api_env(openai_port, prewarm)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        await wait_until_up(f"{base_url}/health")
+        ready = time.perf_counter() - launched
+        await asyncio.sleep(idle)
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+            request_started = time.perf_counter()
+            response = await http.post("/assess-skin", files={"file": ("startup.jpg", photo, "image/jpeg")})
+            finished = time.perf_counter()
+            response.raise_for_status()
+            worker = (await http.get("/startup-stats")).json()
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "ready_ms": ready * 1000,
+        "first_success_ms": (finished - launched - idle) * 1000,
+        "first_request_ms": (finished - request_started) * 1000,
+        "worker_milestones": worker["milestones"],
+        "prewarm_state": worker["prewarm"]["state"],
+    }
+
+
+def median_of(runs: list, key: str) -> float:
+    return round(statistics.median(run[key] for run in runs), 1)
+
+
+def release_info() -> dict:
+    """App version from main.py and the current git commit, without importing main"""
+    with open(os.path.join(BACKEND_DIR, "main.py")) as main_file:
+        version = re.search(r'version="([^"]+)"', main_file.read()).group(1)
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"version": version, "commit": commit}
+
+
+def compare(results: dict, previous: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for metric in TRACKED_METRICS:
+        before, after = previous.get("results", {}).get(metric), results.get(metric)
+        if before is not None and after is not None and after > before * (1 + tolerance):
+            regressions.append(f"{metric}: {before:.1f} -> {after:.1f} ms")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Worker startup benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement; medians are reported")
+    parser.add_argument("--idle", type=float, default=2.0, help="Seconds between /health answering and the first request")
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--record", action="store_true", help="Append this run to the history file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+
+    openai_port = free_port()
+    stub = start_process(
+        [sys.executable, "stubs/azure_openai_stub.py", "--port", str(openai_port), "--latency", "0.05", "--jitter", "0"],
+        {}, "Azure OpenAI stub",
+    )
+    try:
+        asyncio.run(wait_until_up(f"http://127.0.0.1:{openai_port}/stub-stats"))
+
+        imports = [measure_import(openai_port) for _ in range(args.runs)]
+        import_ms = statistics.median(total for total, _ in imports)
+        modules = {name: statistics.median(run[1].get(name, 0.0) for run in imports) for name in imports[0][1]}
+        print(f"📦 import main: {import_ms:.0f} ms (median of {args.runs})")
+        for name, ms in sorted(modules.items(), key=lambda item: -item[1])[:8]:
+            print(f"   - {name:<24} {ms:7.1f} ms")
+
+        photo = make_photo()
+        results = {"import_ms": round(import_ms, 1)}
+        for label, prewarm in (("cold", False), ("prewarm", True)):
+            launches = [asyncio.run(measure_launch(openai_port, photo, prewarm, args.idle)) for _ in range(args.runs)]
+            for key in ("ready_ms", "first_success_ms", "first_request_ms"):
+                results[f"{label}/{key}"] = median_of(launches, key)
+            print(
+                f"🚀 {label:<8} ready {results[f'{label}/ready_ms']:7.0f} ms  "
+                f"first success {results[f'{label}/first_success_ms']:7.0f} ms  "
+                f"first request {results[f'{label}/first_request_ms']:6.0f} ms  "
+                f"(worker milestones {launches[-1]['worker_milestones']}, prewarm {launches[-1]['prewarm_state']})"
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    previous = None
+    if os.path.exists(args.history):
+        with open(args.history) as history_file:
+            lines = [line for line in history_file if line.strip()]
+        previous = json.loads(lines[-1]) if lines else None
+
+    if args.record:
+        entry = {
+            **release_info(),
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "machine": platform.platform(),
+            "python": platform.python_version(),
+            "config": {"runs": args.runs, "idle": args.idle},
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, "a") as history_file:
+            history_file.write(json.dumps(entry) + "\n")
+        print(f"💾 Recorded {entry['version']} ({entry['commit']}) in {args.history}")
+        return
+
+    if previous is not None:
+        regressions = compare(results, previous, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {previous.get('version')} ({previous.get('commit')}):")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions against {previous.get('version')} ({previous.get('commit')}) (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,232 @@
+"""
+End-to-end load test against local stand-ins for every upstream.
+
+Starts the Azure OpenAI stub, the Video Indexer stub and the API itself
+(uvicorn, with the fake Video Intelligence client loaded through
+GCP_VIDEO_INTELLIGENCE_FACTORY) as subprocesses on free ports, then drives each
+endpoint with a fixed number of closed-loop workers for a fixed duration and
+reports throughput, tail latency and error rate. Pass --url to drive an
+already running server instead; upstream flags are then ignored.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1 8 32 --duration 20
+    python benchmarks/load_test.py --endpoints assess-skin analyze-video-health --openai-429-rate 0.1
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --output load.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# name -> (method, path, upload kind)
+ENDPOINTS = {
+    "assess-skin": ("POST", "/assess-skin", "image"),
+    "analyze-facial-dysmorphology": ("POST", "/analyze-facial-dysmorphology", "image"),
+    "analyze-posture": ("POST", "/analyze-posture", "image"),
+    "extract-medical-readings": ("POST", "/extract-medical-readings", "image"),
+    "analyze-combined": ("POST", "/analyze-combined", "image"),
+    "analyze-video-health": ("POST", "/analyze-video-health", "video"),
+    "test-video-indexer": ("GET", "/test-video-indexer", None),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_photo() -> bytes:
+    """A textured 1280x960 JPEG, so it looks like a real photo to the image pipeline"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:960, 0:1280]
+    base = np.stack([(x // 5) % 256, (y // 4) % 256, ((x + y) // 9) % 256], axis=-1)
+    pixels = (base + rng.integers(0, 40, base.shape)).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_video() -> bytes:
+    from bench_frame_extraction import make_clip
+
+    with open(make_clip(6, 640, 360, 30, "h264", 30), "rb") as clip_file:
+        return clip_file.read()
+
+
+def start_process(command: list, env: dict, name: str) -> subprocess.Popen:
+    print(f"🚀 Starting {name}: {' '.join(command)}")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_up(url: str, timeout: float = 60.0):
+    import httpx
+
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.time() < deadline:
+            try:
+                if (await http.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_stack(args) -> tuple[str, list]:
+    """Launch both stubs and the API; return the API base URL and the processes to stop"""
+    openai_port, indexer_port, api_port = free_port(), free_port(), free_port()
+    processes = [
+        start_process(
+            [sys.executable, "stubs/azure_openai_stub.py", "--port", str(openai_port),
+             "--latency", str(args.openai_latency), "--jitter", str(args.openai_jitter),
+             "--rate-limit-ratio", str(args.openai_429_rate)],
+            {}, "Azure OpenAI stub",
+        ),
+        start_process(
+            [sys.executable, "stubs/video_indexer_stub.py", "--port", str(indexer_port)],
+            {}, "Video Indexer stub",
+        ),
+    ]
+    for port in (openai_port, indexer_port):
+        asyncio.run(wait_until_up(f"http://127.0.0.1:{port}/stub-stats"))
+    api_env = {
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{openai_port}/",
+        "AZURE_OPENAI_API_KEY": "load-test",
+        "GCP_PROJECT_ID": "load-test",
+        "GCP_VIDEO_INTELLIGENCE_FACTORY": "stubs.fake_video_intelligence:FakeVideoIntelligenceClient",
+        "GCP_VIDEO_INPUT_MODE": "inline",
+        "FAKE_GCP_LATENCY": str(args.gcp_latency),
+        "FAKE_GCP_ERROR_RATE": str(args.gcp_error_rate),
+        "AZURE_VIDEO_INDEXER_ENDPOINT": f"http://127.0.0.1:{indexer_port}",
+        "AZURE_VIDEO_INDEXER_KEY": "load-test",
+        "AZURE_VIDEO_INDEXER_ACCOUNT_ID": "load-test-account",
+        "ASSESSMENT_CACHE_ENABLED": "False",
+        "LOG_LEVEL": "WARNING",
+    }
+    processes.append(start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port), "--log-level", "warning"],
+        api_env, "API",
+    ))
+    return f"http://127.0.0.1:{api_port}", processes
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def drive(http, method: str, path: str, upload, concurrency: int, duration: float) -> dict:
+    """Closed-loop load: each worker sends its next request as soon as the previous one returns"""
+    import httpx
+
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            files = {"file": upload} if upload else None
+            start = time.perf_counter()
+            try:
+                response = await http.request(method, path, files=files)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    total = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "statuses": dict(statuses),
+    }
+
+
+async def run(base_url: str, args) -> dict:
+    import httpx
+
+    photo, video = make_photo(), None
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as http:
+        for name in args.endpoints:
+            method, path, kind = ENDPOINTS[name]
+            if kind == "video" and video is None:
+                video = make_video()
+            upload = {"image": ("load.jpg", photo, "image/jpeg"), "video": ("load.mp4", video, "video/mp4"), None: None}[kind]
+
+            print(f"📊 {name}")
+            results[name] = []
+            for concurrency in args.concurrency:
+                result = await drive(http, method, path, upload, concurrency, args.duration)
+                results[name].append(result)
+                print(
+                    f"   - c={concurrency:<4} {result['requests']:6d} req  {result['throughput_rps']:8.2f} req/s  "
+                    f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+                    f"errors {result['error_rate']:6.1%}  {result['statuses']}"
+                )
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="End-to-end load test with stubbed upstreams")
+    parser.add_argument("--url", help="Drive an already running server instead of starting one")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Closed-loop workers per run")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per endpoint and concurrency level")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout in seconds")
+    parser.add_argument("--openai-latency", type=float, default=1.0, help="Stub seconds per completion")
+    parser.add_argument("--openai-jitter", type=float, default=0.2)
+    parser.add_argument("--openai-429-rate", type=float, default=0.0, help="Fraction of completions answered with 429")
+    parser.add_argument("--gcp-latency", type=float, default=2.0, help="Fake Video Intelligence seconds per annotation")
+    parser.add_argument("--gcp-error-rate", type=float, default=0.0, help="Fraction of annotations failing with ResourceExhausted")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            base_url, processes = start_stack(args)
+        asyncio.run(wait_until_up(f"{base_url}/health"))
+        results = asyncio.run(run(base_url, args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results}, output_file, indent=2)
+        print(f"💾 Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
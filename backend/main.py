@@ -1,29 +1,90 @@
+import time
+# Startup milestones are measured from here
+startup_started_at = time.perf_counter()
+
 import os
 import base64
 import io
-from typing import Optional
+from typing import Callable, Optional, Union
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from pydantic import BaseModel
-from openai import AzureOpenAI
-from PIL import Image
-import cv2
+from starlette.routing import Match
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, ValidationError, create_model
 import numpy as np
 from dotenv import load_dotenv
-import requests
 import json
-import time
-
-# Azure OpenAI imports
-from openai import AzureOpenAI
+import math
+import re
+import asyncio
+import hashlib
+import threading
+import uuid
+import random
+import resource
+import logging
+import contextvars
+import functools
+import importlib
+import importlib.util
+import itertools
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass, field
+from contextlib import contextmanager
 
-# GCP imports
-from google.cloud import videointelligence_v1
-from google.cloud import vision_v1
-from google.cloud import storage
+import httpx
 import tempfile
 
+# Heavy modules are imported on first use so a new worker starts serving sooner
+lazy_import_times = {}
+lazy_import_lock = threading.Lock()
+
+class LazyModule:
+    """Stand-in for a module global that imports the module on first attribute access"""
+
+    def __init__(self, module_name: str, alias: str):
+        self.module_name = module_name
+        self.alias = alias
+
+    def load(self):
+        with lazy_import_lock:
+            start = time.perf_counter()
+            module = importlib.import_module(self.module_name)
+            # Rebind the global so later lookups skip the proxy
+            if globals().get(self.alias) is self:
+                globals()[self.alias] = module
+                lazy_import_times[self.module_name] = round(time.perf_counter() - start, 4)
+                api_log.debug(f"📦 Imported {self.module_name} on first use", extra={
+                    "module": self.module_name,
+                    "import_seconds": lazy_import_times[self.module_name],
+                })
+        return module
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        return f"<lazy module {self.module_name!r}>"
+
+Image = LazyModule("PIL.Image", "Image")
+ImageOps = LazyModule("PIL.ImageOps", "ImageOps")
+cv2 = LazyModule("cv2", "cv2")
+requests = LazyModule("requests", "requests")
+openai = LazyModule("openai", "openai")
+videointelligence_v1 = LazyModule("google.cloud.videointelligence_v1", "videointelligence_v1")
+storage = LazyModule("google.cloud.storage", "storage")
+
+# Optional: PyAV enables keyframe-only frame extraction
+av = LazyModule("av", "av") if importlib.util.find_spec("av") is not None else None
+
+def load_lazy_modules() -> dict:
+    """Import every module still behind a LazyModule; return seconds per module"""
+    for value in list(globals().values()):
+        if isinstance(value, LazyModule):
+            value.load()
+    return dict(lazy_import_times)
+
 # Load environment variables
 load_dotenv()
 
@@ -33,16 +94,29 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=False,  # Changed to False for public API
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-    max_age=3600,
-)
+class RequestIdMiddleware:
+    """Give each request an id (the caller's X-Request-ID or a new one) for logs and the response header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
 
 # Azure OpenAI Configuration
 endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "https://eastus.api.cognitive.microsoft.com/")
@@ -50,38 +124,636 @@ model_name = os.getenv("AZURE_OPENAI_MODEL", "gpt-4o")
 deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
 subscription_key = os.getenv("AZURE_OPENAI_API_KEY")
 api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview")
+openai_timeout = float(os.getenv("AZURE_OPENAI_TIMEOUT", "120"))
+openai_connect_timeout = float(os.getenv("AZURE_OPENAI_CONNECT_TIMEOUT", "10"))
+openai_max_connections = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "100"))
+openai_max_keepalive = int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE", "20"))
+openai_max_retries = int(os.getenv("AZURE_OPENAI_MAX_RETRIES", "2"))
+
+# Client-side Azure OpenAI rate limiting; 0 leaves a budget unlimited
+openai_requests_per_minute = float(os.getenv("AZURE_OPENAI_RPM", "0"))
+openai_tokens_per_minute = float(os.getenv("AZURE_OPENAI_TPM", "0"))
+openai_image_token_estimate = int(os.getenv("AZURE_OPENAI_IMAGE_TOKEN_ESTIMATE", "1105"))  # 720p high-detail image (6 tiles)
+openai_max_concurrency = int(os.getenv("AZURE_OPENAI_MAX_CONCURRENCY", "32"))
+openai_min_concurrency = int(os.getenv("AZURE_OPENAI_MIN_CONCURRENCY", "1"))
+openai_queue_timeout = float(os.getenv("AZURE_OPENAI_QUEUE_TIMEOUT", "30"))
+openai_max_retry_wait = float(os.getenv("AZURE_OPENAI_MAX_RETRY_WAIT", "20"))
 
 # GCP Configuration
 gcp_project_id = os.getenv("GCP_PROJECT_ID")
 gcp_bucket_name = os.getenv("GCP_BUCKET_NAME", "infant-health-videos")
 gcp_credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+gcp_video_input_mode = os.getenv("GCP_VIDEO_INPUT_MODE", "auto")  # auto / inline / bucket
+gcp_inline_max_bytes = int(os.getenv("GCP_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+gcp_upload_chunk_size = int(os.getenv("GCP_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+gcp_delete_uploaded_videos = os.getenv("GCP_DELETE_UPLOADED_VIDEOS", "True").lower() == "true"
+# Optional "module:callable" building the Video Intelligence client, e.g. the local stand-in for load tests
+gcp_video_intelligence_factory = os.getenv("GCP_VIDEO_INTELLIGENCE_FACTORY")
 
 # Azure Video Indexer Configuration (keeping for fallback)
 video_indexer_key = os.getenv("AZURE_VIDEO_INDEXER_KEY")
 video_indexer_location = os.getenv("AZURE_VIDEO_INDEXER_LOCATION", "trial")
+video_indexer_endpoint = os.getenv("AZURE_VIDEO_INDEXER_ENDPOINT", "https://api.videoindexer.ai").rstrip("/")
 video_indexer_account_id = os.getenv("AZURE_VIDEO_INDEXER_ACCOUNT_ID")
+video_indexer_callback_url = os.getenv("AZURE_VIDEO_INDEXER_CALLBACK_URL")
+video_indexer_poll_base_delay = float(os.getenv("AZURE_VIDEO_INDEXER_POLL_BASE_DELAY", "2"))
+video_indexer_poll_max_delay = float(os.getenv("AZURE_VIDEO_INDEXER_POLL_MAX_DELAY", "60"))
+video_indexer_token_refresh_margin = float(os.getenv("AZURE_VIDEO_INDEXER_TOKEN_REFRESH_MARGIN", "300"))
+video_indexer_max_connections = int(os.getenv("AZURE_VIDEO_INDEXER_MAX_CONNECTIONS", "10"))
+
+# Assessment result cache Configuration
+assessment_cache_enabled = os.getenv("ASSESSMENT_CACHE_ENABLED", "True").lower() == "true"
+assessment_cache_dir = os.getenv("ASSESSMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "infant-health-cache"))
+assessment_cache_memory_entries = int(os.getenv("ASSESSMENT_CACHE_MEMORY_ENTRIES", "256"))
+assessment_cache_disk_entries = int(os.getenv("ASSESSMENT_CACHE_DISK_ENTRIES", "5000"))
+assessment_cache_ttl = int(os.getenv("ASSESSMENT_CACHE_TTL", "86400"))
+# Bump when prompts or response parsing change in a way that invalidates cached results
+ASSESSMENT_PROMPT_VERSION = "3"
+
+# Structured LLM output Configuration
+llm_output_mode = os.getenv("LLM_OUTPUT_MODE", "json_object").lower()  # json_schema / json_object / text
+llm_repair_enabled = os.getenv("LLM_REPAIR_ENABLED", "True").lower() == "true"
+# Share one upstream call between concurrent requests for the same endpoint and normalized image
+llm_coalescing_enabled = os.getenv("LLM_COALESCING_ENABLED", "True").lower() == "true"
+
+# Image normalization Configuration
+image_normalization_enabled = os.getenv("IMAGE_NORMALIZATION_ENABLED", "True").lower() == "true"
+
+# Image quality gate Configuration
+image_quality_gate_enabled = os.getenv("IMAGE_QUALITY_GATE_ENABLED", "True").lower() == "true"
+image_quality_min_edge = int(os.getenv("IMAGE_QUALITY_MIN_EDGE", "320"))  # Shorter side, in pixels
+image_quality_min_brightness = float(os.getenv("IMAGE_QUALITY_MIN_BRIGHTNESS", "40"))  # Mean gray level (0-255)
+image_quality_max_brightness = float(os.getenv("IMAGE_QUALITY_MAX_BRIGHTNESS", "225"))
+IMAGE_QUALITY_ANALYSIS_EDGE = 512  # Scores are computed on a grayscale copy this size
+IMAGE_QUALITY_GLARE_LEVEL = 250  # Gray level treated as a blown-out highlight
+
+# Video upload ingestion Configuration
+video_max_upload_bytes = int(os.getenv("VIDEO_MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+video_spool_dir = os.getenv("VIDEO_SPOOL_DIR", tempfile.gettempdir())
+VIDEO_SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Video frame extraction Configuration
+video_frame_mode = os.getenv("VIDEO_FRAME_MODE", "keyframe")  # keyframe / motion / sequential / seek
+# Motion mode: frame differencing on a downscaled grayscale pass
+video_motion_sample_fps = float(os.getenv("VIDEO_MOTION_SAMPLE_FPS", "10"))
+video_motion_width = int(os.getenv("VIDEO_MOTION_WIDTH", "160"))
+
+# Local breathing and movement signals
+video_analysis_mode = os.getenv("VIDEO_ANALYSIS_MODE", "gcp").lower()  # gcp (GCP plus local signals) / local (skip GCP)
+video_signals_enabled = os.getenv("VIDEO_SIGNALS_ENABLED", "True").lower() == "true"
+video_signals_sample_fps = float(os.getenv("VIDEO_SIGNALS_SAMPLE_FPS", "10"))
+video_signals_max_seconds = float(os.getenv("VIDEO_SIGNALS_MAX_SECONDS", "60"))
+# 18-90 breaths/min covers newborns through toddlers
+BREATHING_BAND_HZ = (0.3, 1.5)
+BREATHING_BLOCK_PX = 8  # ROI granularity on the analysis frame
+video_llm_frames = int(os.getenv("VIDEO_LLM_FRAMES", "3"))
+# Drop near-duplicate frames (perceptual hash) and backfill with later distinct ones
+video_frame_dedup_enabled = os.getenv("VIDEO_FRAME_DEDUP_ENABLED", "True").lower() == "true"
+video_frame_hash = os.getenv("VIDEO_FRAME_HASH", "dhash").lower()  # dhash / phash
+video_frame_dedup_threshold = int(os.getenv("VIDEO_FRAME_DEDUP_THRESHOLD", "6"))  # Max differing bits of 64
+
+# Video analysis job Configuration
+video_job_workers = int(os.getenv("VIDEO_JOB_WORKERS", "2"))
+video_job_queue_size = int(os.getenv("VIDEO_JOB_QUEUE_SIZE", "20"))
+video_job_retention = int(os.getenv("VIDEO_JOB_RETENTION", "3600"))
+
+# Batch endpoint Configuration
+batch_max_files = int(os.getenv("BATCH_MAX_FILES", "30"))
+batch_max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "6"))
+
+# Combined analysis Configuration
+combined_analysis_mode = os.getenv("COMBINED_ANALYSIS_MODE", "fanout").lower()  # fanout (one call per section) / merged (one multi-section call)
+
+# Startup Configuration
+# After startup, import the lazily loaded modules and create upstream clients in the background
+prewarm_enabled = os.getenv("PREWARM_ENABLED", "False").lower() == "true"
+prewarm_delay = float(os.getenv("PREWARM_DELAY", "0"))  # Seconds to wait before pre-warming starts
 
 # Server Configuration
 host = os.getenv("HOST", "0.0.0.0")
 port = int(os.getenv("PORT", "8000"))
 debug = os.getenv("DEBUG", "False").lower() == "true"
 
+# Logging Configuration
+log_level = os.getenv("LOG_LEVEL", "DEBUG" if debug else "INFO").upper()
+log_levels = os.getenv("LOG_LEVELS", "")  # Per-component overrides, e.g. "gcp=DEBUG,video_indexer=WARNING"
+log_format = os.getenv("LOG_FORMAT", "text").lower()  # text / json
+log_debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+
+# Id of the request being handled, attached to every log line
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed through extra=
+STANDARD_LOG_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the current request id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+def log_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in STANDARD_LOG_ATTRIBUTES}
+
+class TextLogFormatter(logging.Formatter):
+    """Human-readable line with the request id and any extra fields as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = log_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": record.request_id,
+            "message": record.getMessage(),
+            **log_fields(record),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+def configure_logging(stream=None):
+    """Attach the handler to the app's logger tree and apply global and per-component levels"""
+    app_logger = logging.getLogger("infant_health")
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JsonLogFormatter() if log_format == "json" else TextLogFormatter())
+    app_logger.addHandler(handler)
+    app_logger.setLevel(log_level)
+    app_logger.propagate = False
+    for override in filter(None, (part.strip() for part in log_levels.split(","))):
+        component, _, level = override.partition("=")
+        logging.getLogger(f"infant_health.{component.strip()}").setLevel(level.strip().upper())
+
+def get_logger(component: str) -> logging.Logger:
+    return logging.getLogger(f"infant_health.{component}")
+
+def debug_sampled(logger: logging.Logger) -> bool:
+    """True for a sampled fraction of calls when debug logging is on; guard high-volume debug events with it"""
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < log_debug_sample_rate
+
+configure_logging()
+api_log = get_logger("api")
+llm_log = get_logger("llm")
+cache_log = get_logger("cache")
+image_log = get_logger("images")
+gcp_log = get_logger("gcp")
+video_log = get_logger("video")
+video_indexer_log = get_logger("video_indexer")
+jobs_log = get_logger("jobs")
+
+# Latency buckets in seconds, from cached image answers up to full video analyses
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+class Metric:
+    """A labeled Prometheus metric kept in process memory"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = label_names
+        self.values: dict = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def format_labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{self.format_labels(key)} {value}"]
+
+class Counter(Metric):
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        super().__init__(name, help_text, "counter", label_names)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        super().__init__(name, help_text, "gauge", label_names)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(Metric):
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, "histogram", label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render_value(self, key: tuple, series: list) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            bucket_labels = self.format_labels(key, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        inf_labels = self.format_labels(key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+        lines.append(f"{self.name}_sum{self.format_labels(key)} {series[-2]}")
+        lines.append(f"{self.name}_count{self.format_labels(key)} {series[-1]}")
+        return lines
+
+metrics_registry: list[Metric] = []
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status", ("endpoint", "method", "status", "deployment"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("endpoint", "method", "deployment"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled", ("endpoint", "deployment"))
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to Azure OpenAI, GCP and Video Indexer",
+    ("upstream", "operation", "endpoint", "deployment")
+)
+upstream_errors_total = Counter(
+    "upstream_errors_total",
+    "Failed upstream calls; kind is rate_limited for 429s and error otherwise",
+    ("upstream", "operation", "kind", "endpoint", "deployment")
+)
+llm_tokens_total = Counter("llm_tokens_total", "Azure OpenAI tokens from response.usage", ("type", "endpoint", "deployment"))
+llm_image_tokens_saved_total = Counter(
+    "llm_image_tokens_saved_total",
+    "Estimated image tokens not sent to Azure OpenAI because near-duplicate video frames were dropped",
+    ("endpoint", "deployment")
+)
+llm_calls_coalesced_total = Counter(
+    "llm_calls_coalesced_total",
+    "Requests that shared an identical in-flight Azure OpenAI analysis instead of making their own",
+    ("endpoint", "deployment")
+)
+image_quality_rejections_total = Counter(
+    "image_quality_rejections_total",
+    "Uploads rejected by the local quality gate before any upstream call; reason is the first failed check",
+    ("reason", "endpoint", "deployment")
+)
+llm_concurrency_limit = Gauge("llm_concurrency_limit", "Current adaptive ceiling on concurrent Azure OpenAI calls", ("deployment",))
+llm_throttled_total = Counter(
+    "llm_throttled_total",
+    "Azure OpenAI calls delayed or refused by the client-side limiter; reason is retry or rejected",
+    ("reason", "endpoint", "deployment")
+)
+startup_seconds = Gauge(
+    "startup_seconds",
+    "Seconds from the start of main.py's import to each startup phase (import, ready, prewarm, first_success)",
+    ("phase", "deployment")
+)
+
+# Requests to these routes do not count as the first successful request
+STARTUP_PROBE_ROUTES = {"/", "/health", "/metrics", "/startup-stats"}
+startup_milestones = {}
+
+def record_startup_milestone(phase: str):
+    """Record the first time this worker reaches phase"""
+    if phase not in startup_milestones:
+        startup_milestones[phase] = round(time.perf_counter() - startup_started_at, 4)
+        startup_seconds.set(startup_milestones[phase], phase=phase, deployment=deployment)
+        api_log.info(f"⏱️ Startup phase {phase} reached after {startup_milestones[phase]:.3f}s")
+
+# Route template of the request being handled, used as the endpoint label
+metrics_endpoint_var = contextvars.ContextVar("metrics_endpoint", default="background")
+
+def upstream_error_kind(error) -> str:
+    """rate_limited for 429 responses and quota errors, error for anything else"""
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429 or getattr(error, "code", None) == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return "rate_limited"
+    return "error"
+
+@contextmanager
+def upstream_call(upstream: str, operation: str):
+    """Time an upstream call and count its failures
+
+    Callers making plain HTTP requests set call["status"] so non-2xx responses
+    count as errors too.
+    """
+    call = {"status": None}
+    labels = {"upstream": upstream, "operation": operation, "endpoint": metrics_endpoint_var.get(), "deployment": deployment}
+    start = time.perf_counter()
+    try:
+        with span(f"{upstream}.{operation}"):
+            yield call
+    except Exception as e:
+        upstream_errors_total.inc(kind=upstream_error_kind(e), **labels)
+        raise
+    finally:
+        upstream_request_duration.observe(time.perf_counter() - start, **labels)
+    if call["status"] is not None and call["status"] >= 400:
+        upstream_errors_total.inc(kind="rate_limited" if call["status"] == 429 else "error", **labels)
+
+class MetricsMiddleware:
+    """Record latency, status and in-flight counts per route template"""
+
+    def __init__(self, app):
+        self.app = app
+        self.route_labels: dict = {}
+
+    def endpoint_label(self, scope) -> str:
+        # The same path can match different routes per method (OPTIONS hits the CORS catch-all)
+        cache_key = (scope["method"], scope["path"])
+        label = self.route_labels.get(cache_key)
+        if label is None:
+            for route in app.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    label = route.path
+                    break
+            else:
+                # Not cached, so unknown paths cannot fill the cache
+                return "unmatched"
+            # Paths with ids in them (job ids) would otherwise grow this without bound
+            if len(self.route_labels) >= 1024:
+                self.route_labels.clear()
+            self.route_labels[cache_key] = label
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint_label = self.endpoint_label(scope)
+        token = metrics_endpoint_var.set(endpoint_label)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(endpoint=endpoint_label, deployment=deployment)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec(endpoint=endpoint_label, deployment=deployment)
+            http_request_duration.observe(elapsed, endpoint=endpoint_label, method=scope["method"], deployment=deployment)
+            http_requests_total.inc(endpoint=endpoint_label, method=scope["method"], status=status["code"], deployment=deployment)
+            if "first_success" not in startup_milestones and 200 <= status["code"] < 300 and endpoint_label not in STARTUP_PROBE_ROUTES:
+                record_startup_milestone("first_success")
+            metrics_endpoint_var.reset(token)
+
+# Tracing Configuration
+tracing_enabled = os.getenv("TRACING_ENABLED", "False").lower() == "true"
+trace_file = os.getenv("TRACE_FILE")  # Optional path; one OTLP/JSON export request per line
+
+@dataclass
+class Span:
+    """One timed stage of a request"""
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+@dataclass
+class Trace:
+    """Spans collected for one request or background job"""
+    root: Span
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    spans: list = field(default_factory=list)
+
+current_trace_var = contextvars.ContextVar("current_trace", default=None)
+current_span_var = contextvars.ContextVar("current_span", default=None)
+trace_file_lock = threading.Lock()
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; does nothing unless a trace is active"""
+    trace = current_trace_var.get()
+    if trace is None:
+        yield None
+        return
+    record = Span(name, new_span_id(), current_span_var.get(), time.time_ns(), attributes=attributes)
+    token = current_span_var.set(record.span_id)
+    try:
+        yield record
+    except BaseException as e:
+        record.error = str(e) or type(e).__name__
+        raise
+    finally:
+        record.end_ns = time.time_ns()
+        current_span_var.reset(token)
+        trace.spans.append(record)
+
+def traced(name: str):
+    """Decorator form of span() for pipeline stage functions, sync or async"""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if current_trace_var.get() is None:
+                    return await func(*args, **kwargs)
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_trace_var.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def start_trace(name: str, **attributes) -> tuple:
+    """Make a new trace current; returns it with the tokens finish_trace needs"""
+    root = Span(name, new_span_id(), None, time.time_ns(), attributes=attributes)
+    trace = Trace(root=root)
+    return trace, (current_trace_var.set(trace), current_span_var.set(root.span_id))
+
+def finish_trace(trace: Trace, tokens: tuple):
+    current_span_var.reset(tokens[1])
+    current_trace_var.reset(tokens[0])
+    trace.root.end_ns = time.time_ns()
+    if trace_file:
+        export_trace(trace)
+
+def server_timing_header(trace: Trace) -> str:
+    """Server-Timing value with the request's top-level stages and its total so far"""
+    entries = [
+        f"{span_record.name};dur={span_record.duration_ms:.1f}"
+        for span_record in sorted(trace.spans, key=lambda span_record: span_record.start_ns)
+        if span_record.parent_id == trace.root.span_id
+    ]
+    entries.append(f"total;dur={(time.time_ns() - trace.root.start_ns) / 1e6:.1f}")
+    return ", ".join(entries)
+
+def otlp_attributes(attributes: dict) -> list:
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            converted.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            converted.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            converted.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            converted.append({"key": key, "value": {"stringValue": str(value)}})
+    return converted
+
+def export_trace(trace: Trace):
+    """Append the trace to TRACE_FILE as an OTLP/JSON ExportTraceServiceRequest"""
+    spans = []
+    for span_record in [trace.root, *trace.spans]:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": span_record.span_id,
+            "name": span_record.name,
+            "kind": 2 if span_record is trace.root else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(span_record.start_ns),
+            "endTimeUnixNano": str(span_record.end_ns),
+            "attributes": otlp_attributes(span_record.attributes),
+            "status": {"code": 2, "message": span_record.error} if span_record.error else {"code": 0},
+        }
+        if span_record.parent_id:
+            otlp_span["parentSpanId"] = span_record.parent_id
+        spans.append(otlp_span)
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": "infant-health-api", "deployment": deployment})},
+            "scopeSpans": [{"scope": {"name": "infant_health"}, "spans": spans}],
+        }]
+    })
+    try:
+        with trace_file_lock, open(trace_file, "a") as trace_output:
+            trace_output.write(line + "\n")
+    except OSError as e:
+        api_log.warning(f"⚠️ Could not write trace file: {str(e)}")
+
+class TracingMiddleware:
+    """Trace each request and report its top-level stages in a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace, tokens = start_trace(
+            f"{scope['method']} {metrics_endpoint_var.get()}",
+            **{"http.method": scope["method"], "http.target": scope["path"], "request_id": request_id_var.get()}
+        )
+
+        async def send_with_server_timing(message):
+            if message["type"] == "http.response.start":
+                trace.root.attributes["http.status_code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", server_timing_header(trace).encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            finish_trace(trace, tokens)
+
 # Validate required environment variables
 if not subscription_key or subscription_key == "your-azure-openai-api-key-here":
-    print("⚠️  WARNING: AZURE_OPENAI_API_KEY not set or using default value!")
-    print("   Please create a .env file with your actual Azure OpenAI API key.")
+    api_log.warning("⚠️ AZURE_OPENAI_API_KEY not set or using default value! Please create a .env file with your actual Azure OpenAI API key.")
 
 if not video_indexer_key:
-    print("⚠️  WARNING: AZURE_VIDEO_INDEXER_KEY not set!")
-    print("   Video analysis features will not be available.")
-
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
+    api_log.warning("⚠️ AZURE_VIDEO_INDEXER_KEY not set! Video analysis features will not be available.")
+
+# Shared connection pool for all Azure OpenAI calls
+openai_http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(openai_timeout, connect=openai_connect_timeout),
+    limits=httpx.Limits(
+        max_connections=openai_max_connections,
+        max_keepalive_connections=openai_max_keepalive,
+    ),
 )
 
+# Azure OpenAI client (async so GPT-4o calls never block the event loop), created on first use
+client = None
+
+def get_openai_client():
+    """Return the shared Azure OpenAI client, creating it once"""
+    global client
+    if client is None:
+        client = openai.AsyncAzureOpenAI(
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            api_key=subscription_key,
+            http_client=openai_http_client,
+            # Retries happen in create_chat_completion so the rate limiter sees every 429
+            max_retries=0,
+        )
+    return client
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    """Release pooled Azure OpenAI connections"""
+    if client is not None:
+        await client.close()
+    else:
+        await openai_http_client.aclose()
+
 class AssessmentResponse(BaseModel):
     condition: str
     confidence: float
@@ -117,6 +789,9 @@ class VideoAnalysisResponse(BaseModel):
     severity: str
     video_insights: dict
     processing_time: float
+    stage_timings: dict = {}
+    memory_usage: dict = {}
+    frame_selection: dict = {}
 
 class MedicalDeviceReadingResponse(BaseModel):
     device_type: str
@@ -130,475 +805,2647 @@ class MedicalDeviceReadingResponse(BaseModel):
     is_normal_range: bool
     alert_level: str
 
-def encode_image_to_base64(image_path: str) -> str:
-    """Convert image to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+class AssessmentCache:
+    """Content-addressed result cache: in-memory LRU in front of a bounded on-disk store with TTL eviction"""
 
-def process_image(image_data: bytes) -> str:
-    """Process image and return base64 encoded string"""
-    # Convert bytes to PIL Image
-    image = Image.open(io.BytesIO(image_data))
-    
-    # Convert to RGB if necessary
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    # Save to bytes buffer
-    buffer = io.BytesIO()
-    image.save(buffer, format='JPEG')
-    buffer.seek(0)
-    
-    # Convert to base64
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    def __init__(self, cache_dir: str, memory_entries: int, disk_entries: int, ttl: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_sweep = 0
+        self._sweep_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
 
-def analyze_video_with_gcp(video_data: bytes, filename: str):
-    """Analyze video using Google Cloud Video Intelligence API"""
-    try:
-        print(f"🔍 Starting GCP video analysis for: {filename}")
-        
-        # Initialize Video Intelligence client
-        video_client = videointelligence_v1.VideoIntelligenceServiceClient()
-        
-        # Create temporary file for video
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            temp_file.write(video_data)
-            temp_file_path = temp_file.name
-        
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key: str, expires_at: float, value: dict):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the cached result for key, or None on a miss
+
+        Memory hits are answered inline; the disk tier is read in a worker thread.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+        entry = await asyncio.to_thread(self._read, key, now)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        self._remember(key, entry["expires_at"], entry["value"])
+        self.stats["disk_hits"] += 1
+        return entry["value"]
+
+    def _read(self, key: str, now: float) -> Optional[dict]:
+        """Load an unexpired disk entry, removing it if it has expired"""
+        path = self._path(key)
         try:
-            # Read video file
-            with open(temp_file_path, 'rb') as video_file:
-                input_content = video_file.read()
-            
-            # Configure the request
-            features = [
-                videointelligence_v1.Feature.FACE_DETECTION,
-                videointelligence_v1.Feature.PERSON_DETECTION,
-                videointelligence_v1.Feature.LABEL_DETECTION,
-                videointelligence_v1.Feature.SHOT_CHANGE_DETECTION,
-            ]
-            
-            # Create the request
-            request = videointelligence_v1.AnnotateVideoRequest(
-                input_content=input_content,
-                features=features,
-            )
-            
-            print(f"📡 Sending video to GCP Video Intelligence API...")
-            
-            # Make the request
-            operation = video_client.annotate_video(request=request)
-            
-            print(f"⏳ Waiting for video analysis to complete...")
-            
-            # Wait for the operation to complete
-            result = operation.result(timeout=600)
-            
-            print(f"✅ GCP video analysis completed")
-            
-            # Debug: Print the structure
-            print(f"🔍 Debug: Result structure:")
-            print(f"   - Type: {type(result)}")
-            print(f"   - Has annotation_results: {hasattr(result, 'annotation_results')}")
-            if hasattr(result, 'annotation_results'):
-                print(f"   - Number of annotations: {len(result.annotation_results)}")
-                for i, annotation in enumerate(result.annotation_results):
-                    print(f"   - Annotation {i}: {type(annotation)}")
-                    print(f"     - Available attributes: {dir(annotation)}")
-            
-            # Extract insights
-            insights = {
-                "faces": [],
-                "persons": [],
-                "shots": [],
-                "labels": [],
-                "duration": 0
-            }
-            
-            # Process annotation results
-            for annotation in result.annotation_results:
-                # Get duration from segment if available
-                if hasattr(annotation, 'segment'):
-                    insights["duration"] = 0  # We'll calculate this from shot annotations
-                
-                # Face detection
-                if hasattr(annotation, 'face_detection_annotations'):
-                    print(f"🔍 Debug: Found {len(annotation.face_detection_annotations)} face detection annotations")
-                    for face_detection in annotation.face_detection_annotations:
-                        print(f"   - Face detection tracks: {len(face_detection.tracks)}")
-                        for track in face_detection.tracks:
-                            print(f"     - Track confidence: {track.confidence}")
-                            print(f"     - Track attributes: {dir(track)}")
-                            face_info = {
-                                "confidence": track.confidence,
-                                "timestamps": []
-                            }
-                            if hasattr(track, 'timestamped_objects'):
-                                for timestamped_object in track.timestamped_objects:
-                                    face_info["timestamps"].append({
-                                        "time": timestamped_object.normalized_bounding_box.left,
-                                        "confidence": timestamped_object.confidence
-                                    })
-                            insights["faces"].append(face_info)
-                
-                # Person detection
-                if hasattr(annotation, 'person_detection_annotations'):
-                    print(f"🔍 Debug: Found {len(annotation.person_detection_annotations)} person detection annotations")
-                    for person_detection in annotation.person_detection_annotations:
-                        print(f"   - Person detection tracks: {len(person_detection.tracks)}")
-                        for track in person_detection.tracks:
-                            print(f"     - Track confidence: {track.confidence}")
-                            person_info = {
-                                "confidence": track.confidence,
-                                "timestamps": []
-                            }
-                            if hasattr(track, 'timestamped_objects'):
-                                for timestamped_object in track.timestamped_objects:
-                                    person_info["timestamps"].append({
-                                        "time": timestamped_object.normalized_bounding_box.left,
-                                        "confidence": timestamped_object.confidence
-                                    })
-                            insights["persons"].append(person_info)
-                
-                # Shot change detection
-                if hasattr(annotation, 'shot_annotations'):
-                    print(f"🔍 Debug: Found {len(annotation.shot_annotations)} shot annotations")
-                    for shot_change in annotation.shot_annotations:
-                        shot_info = {
-                            "start_time": shot_change.start_time_offset.total_seconds(),
-                            "end_time": shot_change.end_time_offset.total_seconds()
-                        }
-                        insights["shots"].append(shot_info)
-                        # Update duration based on the last shot
-                        insights["duration"] = max(insights["duration"], shot_info["end_time"])
-                
-                # Label detection
-                if hasattr(annotation, 'segment_label_annotations'):
-                    print(f"🔍 Debug: Found {len(annotation.segment_label_annotations)} label annotations")
-                    for label_detection in annotation.segment_label_annotations:
-                        print(f"   - Label detection attributes: {dir(label_detection)}")
-                        # LabelAnnotation has 'segments' not 'entities'
-                        if hasattr(label_detection, 'segments'):
-                            print(f"     - Entity attributes: {dir(label_detection.entity)}")
-                            for segment in label_detection.segments:
-                                print(f"       - Segment attributes: {dir(segment)}")
-                                label_info = {
-                                    "description": label_detection.entity.description,
-                                    "confidence": segment.confidence if hasattr(segment, 'confidence') else 0.0,
-                                    "start_time": segment.start_time.total_seconds() if hasattr(segment, 'start_time') else 0.0,
-                                    "end_time": segment.end_time.total_seconds() if hasattr(segment, 'end_time') else 0.0
-                                }
-                                insights["labels"].append(label_info)
-            
-            print(f"📊 GCP Analysis Results:")
-            print(f"   - Duration: {insights['duration']} seconds")
-            print(f"   - Faces detected: {len(insights['faces'])}")
-            print(f"   - Persons detected: {len(insights['persons'])}")
-            print(f"   - Shot changes: {len(insights['shots'])}")
-            print(f"   - Labels detected: {len(insights['labels'])}")
-            
-            return insights
-            
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_file_path)
-            
-    except Exception as e:
-        print(f"❌ GCP video analysis error: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"GCP video analysis failed: {str(e)}"
-        )
+            with open(path, "r") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
 
-def extract_video_frames(video_data: bytes, num_frames: int = 5):
-    """Extract frames from video for detailed analysis"""
-    try:
-        print(f"🎬 Extracting {num_frames} frames from video...")
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            temp_file.write(video_data)
-            temp_file_path = temp_file.name
-        
+        if entry.get("expires_at", 0) <= now:
+            self._remove(path)
+            return None
+        return entry
+
+    async def set(self, key: str, value: dict):
+        """Store a result in both tiers; the disk write and any sweep run off the event loop"""
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+        if not await asyncio.to_thread(self._write, key, expires_at, value):
+            return
+
+        self.stats["writes"] += 1
+        self._writes_since_sweep += 1
+        if self._writes_since_sweep >= 50 and (self._sweep_task is None or self._sweep_task.done()):
+            self._writes_since_sweep = 0
+            self._sweep_task = asyncio.create_task(asyncio.to_thread(self.sweep))
+
+    def _write(self, key: str, expires_at: float, value: dict) -> bool:
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
-            # Use OpenCV to extract frames (if available)
-            try:
-                import cv2
-                cap = cv2.VideoCapture(temp_file_path)
-                frames = []
-                
-                total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                duration = total_frames / fps if fps > 0 else 0
-                
-                # Extract frames at regular intervals
-                frame_indices = [int(total_frames * i / num_frames) for i in range(num_frames)]
-                
-                for frame_idx in frame_indices:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                    ret, frame = cap.read()
-                    if ret:
-                        # Convert BGR to RGB
-                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        # Convert to PIL Image
-                        pil_image = Image.fromarray(frame_rgb)
-                        # Convert to base64
-                        buffer = io.BytesIO()
-                        pil_image.save(buffer, format='JPEG', quality=85)
-                        frame_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                        frames.append({
-                            "frame_number": frame_idx,
-                            "timestamp": frame_idx / fps if fps > 0 else 0,
-                            "image": frame_base64
-                        })
-                
-                cap.release()
-                print(f"✅ Extracted {len(frames)} frames successfully")
-                return frames
-                
-            except ImportError:
-                print("⚠️ OpenCV not available, using fallback method")
-                # Fallback: return empty frames list
-                return []
-                
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_file_path)
-            
-    except Exception as e:
-        print(f"❌ Frame extraction error: {str(e)}")
-        return []
+            with open(temp_path, "w") as cache_file:
+                json.dump({"expires_at": expires_at, "value": value}, cache_file)
+            os.replace(temp_path, path)
+        except OSError as e:
+            cache_log.warning(f"⚠️ Could not write assessment cache entry: {str(e)}")
+            self._remove(temp_path)
+            return False
+        return True
 
-def get_video_indexer_access_token():
-    """Get access token for Azure Video Indexer"""
-    if not video_indexer_key:
-        raise HTTPException(
-            status_code=500,
-            detail="Azure Video Indexer key not configured. Please set AZURE_VIDEO_INDEXER_KEY in your .env file."
-        )
-    
-    if not video_indexer_account_id:
-        raise HTTPException(
-            status_code=500,
-            detail="Azure Video Indexer account ID not configured. Please set AZURE_VIDEO_INDEXER_ACCOUNT_ID in your .env file."
-        )
-    
-    # Check if this is a paid account (not trial)
-    is_paid_account = video_indexer_location != "trial"
-    
-    if is_paid_account:
-        # For paid accounts, use the provided access token directly
-        print(f"✅ Using provided access token for paid account")
-        print(f"📍 Location: {video_indexer_location}")
-        print(f"🆔 Account ID: {video_indexer_account_id}")
-        print(f"💰 Account Type: Paid")
-        return video_indexer_key
-    else:
-        # For trial accounts, use the API to get token
-        url = f"https://api.videoindexer.ai/auth/{video_indexer_location}/Accounts/{video_indexer_account_id}/AccessToken"
-        headers = {
-            "Ocp-Apim-Subscription-Key": video_indexer_key
-        }
-        params = {
-            "allowEdit": "true"
-        }
-        
-        print(f"🔑 Getting Video Indexer access token from: {url}")
-        print(f"📍 Location: {video_indexer_location}")
-        print(f"🆔 Account ID: {video_indexer_account_id}")
-        print(f"💰 Account Type: Trial")
-        
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+    def sweep(self):
+        """Drop expired disk entries, then the oldest ones beyond the size bound"""
+        now = time.time()
+        entries = []
         try:
-            response = requests.get(url, headers=headers, params=params)
-            
-            print(f"📡 Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                token_data = response.json()
-                print(f"✅ Access token obtained successfully")
-                return token_data
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if mtime + self.ttl <= now:
+                self._remove(path)
+                self.stats["evictions"] += 1
             else:
-                print(f"❌ Failed to get access token. Status: {response.status_code}")
-                print(f"📄 Response text: {response.text}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to get Video Indexer access token: {response.text}"
-                )
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error getting access token: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Network error getting Video Indexer access token: {str(e)}"
-            )
+                entries.append((mtime, path))
 
-def upload_video_to_indexer(video_data: bytes, filename: str):
-    """Upload video to Azure Video Indexer"""
-    access_token = get_video_indexer_access_token()
-    
-    url = f"https://api.videoindexer.ai/{video_indexer_location}/Accounts/{video_indexer_account_id}/Videos"
-    headers = {
-        "Authorization": f"Bearer {access_token}"
+        if len(entries) > self.disk_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.disk_entries]:
+                self._remove(path)
+                self.stats["evictions"] += 1
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "ttl_seconds": self.ttl,
+        }
+
+assessment_cache = AssessmentCache(
+    cache_dir=assessment_cache_dir,
+    memory_entries=assessment_cache_memory_entries,
+    disk_entries=assessment_cache_disk_entries,
+    ttl=assessment_cache_ttl,
+    enabled=assessment_cache_enabled,
+)
+
+def assessment_cache_key(endpoint_name: str, base64_image: str, system_prompt: str) -> str:
+    """Hash the normalized image, endpoint, model deployment and prompt version into a cache key"""
+    digest = hashlib.sha256()
+    for part in (endpoint_name, ASSESSMENT_PROMPT_VERSION, deployment, llm_output_mode, system_prompt, base64_image):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class SingleFlight:
+    """Coalesce concurrent identical calls onto one in-flight task
+
+    The first caller for a key starts the call; callers arriving while it runs
+    await the same task and get its result or exception. The task is shielded,
+    so a caller that goes away does not cancel it for the others.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.stats: dict = {}
+
+    def _count(self, group: str, outcome: str):
+        stats = self.stats.setdefault(group, {"upstream_calls": 0, "coalesced": 0})
+        stats[outcome] += 1
+
+    async def run(self, group: str, key: str, call):
+        """Return await call(), sharing it with concurrent callers of the same group and key"""
+        if not self.enabled:
+            return await call()
+
+        flight_key = f"{group}:{key}"
+        task = self._in_flight.get(flight_key)
+        if task is None or task.done():
+            self._count(group, "upstream_calls")
+            task = asyncio.ensure_future(call())
+            self._in_flight[flight_key] = task
+
+            def landed(done: asyncio.Task):
+                if self._in_flight.get(flight_key) is done:
+                    del self._in_flight[flight_key]
+                # Mark the exception retrieved even if every caller went away
+                if not done.cancelled():
+                    done.exception()
+
+            task.add_done_callback(landed)
+        else:
+            self._count(group, "coalesced")
+            llm_calls_coalesced_total.inc(endpoint=metrics_endpoint_var.get(), deployment=deployment)
+            cache_log.debug("🔗 Joined in-flight analysis", extra={"endpoint": group})
+        return await asyncio.shield(task)
+
+    def snapshot(self) -> dict:
+        return {"enabled": self.enabled, "in_flight": len(self._in_flight), "endpoints": self.stats}
+
+llm_single_flight = SingleFlight(enabled=llm_coalescing_enabled)
+
+class TokenBucket:
+    """Budget that refills continuously at rate_per_minute, holding at most capacity"""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken; 0 for an unlimited bucket"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        # A single call larger than the whole bucket waits for a full bucket instead of forever
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.rate > 0:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+class LLMRateLimiter:
+    """Client-side limiter shared by every Azure OpenAI call
+
+    Calls need a concurrency slot plus room in a requests bucket and an
+    estimated-tokens bucket. Buckets hold 10 seconds of quota, the window Azure
+    enforces RPM/TPM over. The concurrency ceiling adapts AIMD-style: +1 per
+    ceiling's worth of successes, halved on a 429 (once per round of in-flight
+    calls). A 429's Retry-After also pauses every caller until it has passed.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 min_concurrency: int, max_concurrency: int, queue_timeout: float):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 6)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 6)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self.stats = {"calls": 0, "rate_limited": 0, "limit_decreases": 0, "rejected": 0, "queued_seconds": 0.0}
+        llm_concurrency_limit.set(self.limit, deployment=deployment)
+
+    def _grant_slots(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._grant_slots()
+
+    def _rejected(self, retry_after: float) -> HTTPException:
+        self.stats["rejected"] += 1
+        llm_throttled_total.inc(reason="rejected", endpoint=metrics_endpoint_var.get(), deployment=deployment)
+        return throttled_error(503, retry_after, "Azure OpenAI capacity is saturated, retry later")
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """Wait for a slot and bucket room, or raise 503 if that would take longer than queue_timeout
+
+        Returns the monotonic start time to pass back to release().
+        """
+        queued_at = time.monotonic()
+        deadline = queued_at + self.queue_timeout
+
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=max(0.0, deadline - time.monotonic()))
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we gave up
+                    self._release_slot()
+                else:
+                    waiter.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._rejected(self.queue_timeout)
+                raise
+
+        try:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(estimated_tokens, now),
+                )
+                if wait <= 0:
+                    self.requests.take(1, now)
+                    self.tokens.take(estimated_tokens, now)
+                    break
+                if now + wait > deadline:
+                    raise self._rejected(wait)
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._release_slot()
+            raise
+
+        started_at = time.monotonic()
+        self.stats["calls"] += 1
+        self.stats["queued_seconds"] += started_at - queued_at
+        return started_at
+
+    def release(self, started_at: float, rate_limited: bool = False, retry_after: float = 0.0, succeeded: bool = True):
+        """Return the slot and adapt the ceiling to how the call went"""
+        if rate_limited:
+            self.stats["rate_limited"] += 1
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + retry_after)
+            # Calls started before the last decrease were sent at the old ceiling; don't halve twice for them
+            if started_at >= self._decreased_at:
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                self._decreased_at = now
+                self.stats["limit_decreases"] += 1
+        elif succeeded:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        llm_concurrency_limit.set(self.limit, deployment=deployment)
+        self._release_slot()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "queued_seconds": round(self.stats["queued_seconds"], 3),
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+llm_rate_limiter = LLMRateLimiter(
+    requests_per_minute=openai_requests_per_minute,
+    tokens_per_minute=openai_tokens_per_minute,
+    min_concurrency=openai_min_concurrency,
+    max_concurrency=openai_max_concurrency,
+    queue_timeout=openai_queue_timeout,
+)
+
+def throttled_error(status_code: int, retry_after: float, detail: str) -> HTTPException:
+    """429/503 for callers, with a whole-second Retry-After"""
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """Rough prompt size for the tokens bucket: ~4 characters per token plus a flat cost per image"""
+    tokens = 0
+    for message in messages:
+        content = message.get("content") or ""
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                tokens += openai_image_token_estimate
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return tokens
+
+def retry_after_seconds(response) -> Optional[float]:
+    """Delay requested by a 429 response (retry-after-ms, then Retry-After seconds or HTTP date)"""
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter: up to 0.5s, 1s, 2s, ... capped at the retry wait limit"""
+    return random.uniform(0, min(openai_max_retry_wait, 0.5 * (2 ** attempt)))
+
+@traced("llm")
+async def create_chat_completion(messages: list, temperature: float = 0.3, max_tokens: int = 2048, response_format: Optional[dict] = None):
+    """Call Azure OpenAI chat completions on the shared async client
+
+    Goes through the shared rate limiter and retries 429s (honoring
+    Retry-After), connection errors and 5xx up to AZURE_OPENAI_MAX_RETRIES
+    times. Throttling that outlasts the retries becomes a 429 or 503
+    HTTPException with Retry-After.
+    """
+    extra_args = {"response_format": response_format} if response_format else {}
+    # Azure counts max_tokens against TPM when admitting a request, so the estimate does too
+    estimated_tokens = estimate_prompt_tokens(messages) + max_tokens
+    attempt = 0
+    while True:
+        started_at = await llm_rate_limiter.acquire(estimated_tokens)
+        try:
+            with upstream_call("azure_openai", "chat_completions"):
+                response = await get_openai_client().chat.completions.create(
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=0.9,
+                    model=deployment,
+                    **extra_args
+                )
+        except openai.RateLimitError as e:
+            retry_after = retry_after_seconds(e.response)
+            wait = retry_after if retry_after is not None else retry_backoff(attempt)
+            llm_rate_limiter.release(started_at, rate_limited=True, retry_after=wait)
+            if attempt >= openai_max_retries or wait > openai_max_retry_wait:
+                llm_log.warning(f"🚦 Azure OpenAI rate limited, giving up after {attempt + 1} attempts", extra={"retry_after": wait})
+                raise throttled_error(429, wait, "Azure OpenAI rate limit reached, retry later")
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            llm_rate_limiter.release(started_at, succeeded=False)
+            if attempt >= openai_max_retries:
+                raise
+            wait = retry_backoff(attempt)
+            llm_log.warning(f"🔁 Azure OpenAI call failed ({type(e).__name__}), retrying in {wait:.2f}s")
+        except BaseException:
+            llm_rate_limiter.release(started_at, succeeded=False)
+            raise
+        else:
+            llm_rate_limiter.release(started_at)
+            break
+        attempt += 1
+        llm_throttled_total.inc(reason="retry", endpoint=metrics_endpoint_var.get(), deployment=deployment)
+        await asyncio.sleep(wait)
+
+    if response.usage is not None:
+        endpoint_label = metrics_endpoint_var.get()
+        llm_tokens_total.inc(response.usage.prompt_tokens, type="prompt", endpoint=endpoint_label, deployment=deployment)
+        llm_tokens_total.inc(response.usage.completion_tokens, type="completion", endpoint=endpoint_label, deployment=deployment)
+    return response
+
+# Outermost {...} in free-text replies; JSON-mode replies parse without it
+LLM_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+class LLMOutputError(ValueError):
+    """The model reply did not contain a JSON object matching the response model"""
+
+def parse_llm_json(response_text: str) -> dict:
+    """Parse the JSON object in a model reply"""
+    text = (response_text or "").strip()
+    try:
+        result = json.loads(text)
+    except json.JSONDecodeError:
+        match = LLM_JSON_OBJECT.search(text)
+        if not match:
+            raise LLMOutputError("no JSON object in reply")
+        try:
+            result = json.loads(match.group())
+        except json.JSONDecodeError as e:
+            raise LLMOutputError(f"invalid JSON: {e}")
+    if not isinstance(result, dict):
+        raise LLMOutputError("reply is not a JSON object")
+    return result
+
+llm_schemas: dict = {}
+
+def llm_output_schema(response_model, server_fields: tuple = ()) -> dict:
+    """JSON schema of a response model without the fields the server fills in itself"""
+    key = (response_model.__name__, server_fields)
+    if key not in llm_schemas:
+        schema = response_model.model_json_schema()
+        for name in server_fields:
+            schema["properties"].pop(name, None)
+        schema["required"] = [name for name in schema.get("required", []) if name not in server_fields]
+        llm_schemas[key] = schema
+    return llm_schemas[key]
+
+def llm_response_format(response_model, server_fields: tuple = ()) -> Optional[dict]:
+    """response_format argument for the configured output mode"""
+    if llm_output_mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": response_model.__name__,
+                "schema": llm_output_schema(response_model, server_fields),
+                "strict": False,
+            },
+        }
+    if llm_output_mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+llm_parse_stats: dict = {}
+
+def record_llm_parse(endpoint_name: str, outcome: str):
+    """Count how each endpoint's model replies were turned into a response"""
+    stats = llm_parse_stats.setdefault(endpoint_name, {"replies": 0, "parsed": 0, "repaired": 0, "failed": 0, "repair_calls": 0})
+    stats[outcome] += 1
+    if outcome != "repair_calls":
+        stats["replies"] += 1
+
+async def complete_structured(endpoint_name: str, response_model, messages: list, temperature: float = 0.3,
+                              server_fields: tuple = (), prepare_result=None, max_tokens: int = 2048):
+    """Ask the model for a reply matching response_model, with one repair attempt on malformed output
+
+    Returns (model instance or None, reply text). prepare_result can fill in
+    server-side fields on the parsed dict before validation.
+    """
+    schema = llm_output_schema(response_model, server_fields)
+    if llm_output_mode == "json_object":
+        # JSON mode only guarantees syntax, so spell out the shape in the prompt
+        messages = [
+            {**messages[0], "content": f"{messages[0]['content']}\n\nReply with only a JSON object matching this JSON schema:\n{json.dumps(schema)}"},
+            *messages[1:],
+        ]
+    response_format = llm_response_format(response_model, server_fields)
+
+    response = await create_chat_completion(messages=messages, temperature=temperature, max_tokens=max_tokens, response_format=response_format)
+    response_text = response.choices[0].message.content or ""
+    llm_log.debug("📝 Raw response", extra={"endpoint": endpoint_name, "chars": len(response_text)})
+
+    def validate(text: str):
+        result = parse_llm_json(text)
+        if prepare_result:
+            prepare_result(result)
+        try:
+            return response_model(**result)
+        except ValidationError as e:
+            raise LLMOutputError(f"schema mismatch: {e.error_count()} errors, first: {e.errors()[0]['msg']} at {e.errors()[0]['loc']}")
+
+    try:
+        parsed = validate(response_text)
+        record_llm_parse(endpoint_name, "parsed")
+        llm_log.debug("✅ Successfully parsed JSON response")
+        return parsed, response_text
+    except LLMOutputError as e:
+        llm_log.warning(f"❌ JSON parsing failed: {str(e)}", extra={"endpoint": endpoint_name})
+        llm_log.debug(f"📄 Raw response: {response_text[:500]}...")
+        if not llm_repair_enabled:
+            record_llm_parse(endpoint_name, "failed")
+            return None, response_text
+        error = e
+
+    # One text-only repair call: the image is not sent again
+    record_llm_parse(endpoint_name, "repair_calls")
+    repair_response = await create_chat_completion(
+        messages=[
+            {
+                "role": "system",
+                "content": f"You convert text into a JSON object matching this JSON schema. Reply with only the JSON object.\n{json.dumps(schema)}",
+            },
+            {
+                "role": "user",
+                "content": f"This reply could not be used ({error}). Rewrite it as the JSON object, keeping its findings:\n\n{response_text}",
+            },
+        ],
+        temperature=0.0,
+        max_tokens=1024,
+        response_format=response_format,
+    )
+    repaired_text = repair_response.choices[0].message.content or ""
+    try:
+        parsed = validate(repaired_text)
+        record_llm_parse(endpoint_name, "repaired")
+        llm_log.info("🩹 Repaired JSON response")
+        return parsed, response_text
+    except LLMOutputError as e:
+        record_llm_parse(endpoint_name, "failed")
+        llm_log.error(f"❌ JSON repair failed: {str(e)}")
+        return None, response_text
+
+class VideoJobStatus(BaseModel):
+    job_id: str
+    filename: Optional[str] = None
+    status: str
+    stage: str
+    events: list[dict]
+    stage_timings: dict
+    result: Optional[VideoAnalysisResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None
+
+class CombinedAnalysisResponse(BaseModel):
+    mode: str
+    skin: Optional[AssessmentResponse] = None
+    facial: Optional[FacialDysmorphologyResponse] = None
+    posture: Optional[PostureAnalysisResponse] = None
+    errors: dict[str, str] = {}
+    section_timings: dict[str, float] = {}
+    stage_timings: dict[str, float] = {}
+    processing_time: float
+
+class BatchItemResult(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    status: str
+    status_code: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    error_detail: Optional[dict] = None
+    retry_after: Optional[int] = None  # Seconds, from the item's 429/503 Retry-After
+    processing_time: float
+
+class BatchResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: list[BatchItemResult]
+    processing_time: float
+
+def encode_image_to_base64(image_path: str) -> str:
+    """Convert image to base64 string"""
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+@dataclass
+class ImageProfile:
+    """Size budget for images sent to GPT-4o from one endpoint"""
+    max_edge: int
+    max_bytes: int
+
+def load_image_profile(name: str, max_edge: int, max_bytes: int) -> ImageProfile:
+    """Build a profile, allowing IMAGE_PROFILE_<NAME>=max_edge:max_bytes to override the defaults"""
+    override = os.getenv(f"IMAGE_PROFILE_{name.upper().replace('-', '_')}")
+    if override:
+        edge, _, size = override.partition(":")
+        max_edge = int(edge)
+        max_bytes = int(size) if size else max_bytes
+    return ImageProfile(max_edge=max_edge, max_bytes=max_bytes)
+
+# Per-endpoint size profiles. Reading device displays needs the most detail, posture the least.
+IMAGE_PROFILES = {
+    "default": load_image_profile("default", 1536, 450_000),
+    "assess-skin": load_image_profile("assess-skin", 1536, 450_000),
+    "analyze-facial-dysmorphology": load_image_profile("analyze-facial-dysmorphology", 1536, 450_000),
+    "analyze-posture": load_image_profile("analyze-posture", 1024, 250_000),
+    "extract-medical-readings": load_image_profile("extract-medical-readings", 2048, 600_000),
+    # Same as assess-skin and facial, so their cache entries are shared with /analyze-combined
+    "analyze-combined": load_image_profile("analyze-combined", 1536, 450_000),
+}
+
+JPEG_QUALITY_STEPS = (85, 75, 65, 55, 45)
+
+@dataclass
+class NormalizedImage:
+    """Result of the normalization pipeline for one image"""
+    base64: str
+    original_bytes: int
+    output_bytes: int
+    width: int
+    height: int
+    quality: Optional[int]
+    passthrough: bool
+    elapsed_ms: float
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.output_bytes
+
+image_normalization_stats = {
+    "images": 0,
+    "passthrough": 0,
+    "original_bytes": 0,
+    "output_bytes": 0,
+    "total_ms": 0.0,
+}
+
+def normalize_image(image_data: bytes, profile: ImageProfile,
+                    quality_check: Optional[Callable[[np.ndarray], None]] = None) -> NormalizedImage:
+    """Fix EXIF orientation, downscale to the profile's max edge and re-encode within its byte budget
+
+    quality_check, if given, is called with a grayscale copy of the decoded
+    image (at most IMAGE_QUALITY_ANALYSIS_EDGE pixels) before it is re-encoded,
+    so a photo it rejects is never encoded. Passthrough images are never
+    decoded and are not passed to it.
+    """
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(image_data))
+
+    orientation = image.getexif().get(0x0112, 1)
+    fits = max(image.size) <= profile.max_edge and len(image_data) <= profile.max_bytes
+
+    # Already a small, upright RGB JPEG: send the original bytes untouched
+    if image.format == "JPEG" and image.mode == "RGB" and orientation == 1 and fits:
+        return NormalizedImage(
+            base64=base64.b64encode(image_data).decode('utf-8'),
+            original_bytes=len(image_data),
+            output_bytes=len(image_data),
+            width=image.width,
+            height=image.height,
+            quality=None,
+            passthrough=True,
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    # Let libjpeg decode at a reduced scale instead of decoding all 12 MP
+    if image.format == "JPEG":
+        image.draft("RGB", (profile.max_edge, profile.max_edge))
+
+    image = ImageOps.exif_transpose(image)
+
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if max(image.size) > profile.max_edge:
+        image.thumbnail((profile.max_edge, profile.max_edge), Image.LANCZOS)
+
+    if quality_check:
+        quality_check(shrink_gray(np.asarray(image.convert("L")), IMAGE_QUALITY_ANALYSIS_EDGE))
+
+    # Step quality down until the encoded image fits the byte budget
+    for quality in JPEG_QUALITY_STEPS:
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        if buffer.tell() <= profile.max_bytes:
+            break
+
+    encoded = buffer.getvalue()
+    return NormalizedImage(
+        base64=base64.b64encode(encoded).decode('utf-8'),
+        original_bytes=len(image_data),
+        output_bytes=len(encoded),
+        width=image.width,
+        height=image.height,
+        quality=quality,
+        passthrough=False,
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+    )
+
+@dataclass
+class QualityGate:
+    """Lowest photo quality one endpoint sends to GPT-4o"""
+    min_sharpness: float
+    max_glare: float
+
+def load_quality_gate(name: str, min_sharpness: float, max_glare: float) -> QualityGate:
+    """Build a gate, allowing IMAGE_QUALITY_<NAME>=min_sharpness:max_glare to override the defaults"""
+    override = os.getenv(f"IMAGE_QUALITY_{name.upper().replace('-', '_')}")
+    if override:
+        sharpness, _, glare = override.partition(":")
+        min_sharpness = float(sharpness)
+        max_glare = float(glare) if glare else max_glare
+    return QualityGate(min_sharpness=min_sharpness, max_glare=max_glare)
+
+# Per-endpoint gates. Device displays must be sharp and glare-free; skin close-ups
+# and posture photos have little fine texture, so their blur floor is lower.
+QUALITY_GATES = {
+    "assess-skin": load_quality_gate("assess-skin", 20.0, 0.15),
+    "analyze-posture": load_quality_gate("analyze-posture", 15.0, 0.20),
+    "extract-medical-readings": load_quality_gate("extract-medical-readings", 40.0, 0.08),
+}
+
+image_quality_stats = {
+    "checked": 0,
+    "rejected": 0,
+    "total_ms": 0.0,
+}
+
+def shrink_gray(gray: np.ndarray, max_edge: int) -> np.ndarray:
+    scale = max_edge / max(gray.shape)
+    if scale >= 1:
+        return gray
+    return cv2.resize(gray, (round(gray.shape[1] * scale), round(gray.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+
+def load_quality_gray(image_data: bytes, width: int, height: int) -> np.ndarray:
+    """Decode a grayscale copy of at most IMAGE_QUALITY_ANALYSIS_EDGE pixels
+
+    Used when normalization did not decode the image. JPEGs are decoded luma
+    only at 1/2, 1/4 or 1/8 scale by libjpeg.
+    """
+    reduction = next((factor for factor in (8, 4, 2) if max(width, height) // factor >= IMAGE_QUALITY_ANALYSIS_EDGE), 1)
+    flag = {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }[reduction]
+    gray = cv2.imdecode(np.frombuffer(image_data, np.uint8), flag)
+    if gray is None:
+        # Formats OpenCV cannot decode but Pillow can
+        image = Image.open(io.BytesIO(image_data))
+        image.draft("L", (IMAGE_QUALITY_ANALYSIS_EDGE, IMAGE_QUALITY_ANALYSIS_EDGE))
+        gray = np.asarray(image.convert("L"))
+    return shrink_gray(gray, IMAGE_QUALITY_ANALYSIS_EDGE)
+
+def score_image_quality(gray: np.ndarray) -> dict:
+    """Sharpness (variance of the Laplacian), mean brightness and glare fraction of a grayscale image"""
+    histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+    return {
+        "sharpness": round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 1),
+        "brightness": round(float(np.dot(histogram, np.arange(256))), 1),
+        "glare_fraction": round(float(histogram[IMAGE_QUALITY_GLARE_LEVEL:].sum()), 3),
     }
-    
-    # Create multipart form data
-    files = {
-        'file': (filename, video_data, 'video/mp4')
+
+def check_image_quality(image_data: bytes, endpoint: str, gray: Optional[np.ndarray] = None, gate: Optional[QualityGate] = None):
+    """Reject a photo too small, blurred, badly exposed or glare-washed to analyze, before any upstream call
+
+    gray is a grayscale copy already decoded by normalize_image, if any; gate
+    replaces the endpoint's own. Raises a 422 whose detail lists each failed
+    check with a hint for retaking the photo, plus the measured scores and the
+    thresholds they were held to.
+    """
+    gate = gate or QUALITY_GATES.get(endpoint)
+    if not image_quality_gate_enabled or gate is None:
+        return
+
+    start = time.perf_counter()
+    # Reads only the header
+    width, height = Image.open(io.BytesIO(image_data)).size
+    if gray is None:
+        gray = load_quality_gray(image_data, width, height)
+    scores = {"width": width, "height": height, **score_image_quality(gray)}
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    scores["elapsed_ms"] = round(elapsed_ms, 2)
+    thresholds = {
+        "min_edge": image_quality_min_edge,
+        "min_sharpness": gate.min_sharpness,
+        "min_brightness": image_quality_min_brightness,
+        "max_brightness": image_quality_max_brightness,
+        "max_glare_fraction": gate.max_glare,
     }
-    
-    params = {
-        "name": filename,
-        "privacy": "private"
+
+    problems = []
+    if min(scores["width"], scores["height"]) < image_quality_min_edge:
+        problems.append({
+            "check": "resolution",
+            "message": f"Photo is too small ({scores['width']}x{scores['height']}). Use at least {image_quality_min_edge} pixels on the shorter side, and do not send a thumbnail or screenshot.",
+        })
+    if scores["brightness"] < image_quality_min_brightness:
+        problems.append({
+            "check": "underexposed",
+            "message": "Photo is too dark. Turn on a light or move near a window, then retake it.",
+        })
+    elif scores["brightness"] > image_quality_max_brightness:
+        problems.append({
+            "check": "overexposed",
+            "message": "Photo is washed out. Move away from direct sunlight or turn off the flash, then retake it.",
+        })
+    if scores["glare_fraction"] > gate.max_glare:
+        problems.append({
+            "check": "glare",
+            "message": f"Glare covers {scores['glare_fraction']:.0%} of the photo. Tilt the camera so lights and windows do not reflect off the skin or screen.",
+        })
+    # Badly exposed photos have little measurable detail whatever the focus
+    exposure_ok = image_quality_min_brightness <= scores["brightness"] <= image_quality_max_brightness
+    if exposure_ok and scores["sharpness"] < gate.min_sharpness:
+        problems.append({
+            "check": "blur",
+            "message": "Photo is blurred. Hold the camera steady, tap the subject to focus and retake it.",
+        })
+
+    image_quality_stats["checked"] += 1
+    image_quality_stats["total_ms"] += elapsed_ms
+    if not problems:
+        image_log.debug("✅ Image passed quality gate", extra={"endpoint": endpoint, **scores})
+        return
+
+    image_quality_stats["rejected"] += 1
+    image_quality_rejections_total.inc(reason=problems[0]["check"], endpoint=metrics_endpoint_var.get(), deployment=deployment)
+    image_log.info(f"🚫 Rejected {endpoint} upload: {', '.join(problem['check'] for problem in problems)}", extra=scores)
+    raise HTTPException(
+        status_code=422,
+        detail={
+            "message": "Image quality too low for a reliable analysis: " + " ".join(problem["message"] for problem in problems),
+            "problems": problems,
+            "scores": scores,
+            "thresholds": thresholds,
+        }
+    )
+
+@traced("process_image")
+def process_image(image_data: bytes, profile_name: str = "default", gate: Optional[QualityGate] = None) -> str:
+    """Process image and return base64 encoded string
+
+    Photos failing the profile's quality gate (or gate, when given) raise a 422
+    instead (see check_image_quality).
+    """
+    gate = gate or QUALITY_GATES.get(profile_name)
+    gated = image_quality_gate_enabled and gate is not None
+    if not image_normalization_enabled:
+        if gated:
+            check_image_quality(image_data, profile_name, gate=gate)
+
+        # Convert bytes to PIL Image
+        image = Image.open(io.BytesIO(image_data))
+
+        # Convert to RGB if necessary
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        # Save to bytes buffer
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG')
+        buffer.seek(0)
+
+        # Convert to base64
+        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+    # The gate reuses the normalization decode and runs before the JPEG re-encode,
+    # so it costs a few milliseconds and a rejected photo is never encoded
+    normalized = normalize_image(
+        image_data,
+        IMAGE_PROFILES.get(profile_name, IMAGE_PROFILES["default"]),
+        quality_check=functools.partial(check_image_quality, image_data, profile_name, gate=gate) if gated else None
+    )
+
+    image_normalization_stats["images"] += 1
+    image_normalization_stats["passthrough"] += int(normalized.passthrough)
+    image_normalization_stats["original_bytes"] += normalized.original_bytes
+    image_normalization_stats["output_bytes"] += normalized.output_bytes
+    image_normalization_stats["total_ms"] += normalized.elapsed_ms
+
+    image_log.debug("🖼️ Normalized image", extra={
+        "profile": profile_name,
+        "original_bytes": normalized.original_bytes,
+        "output_bytes": normalized.output_bytes,
+        "size": f"{normalized.width}x{normalized.height}",
+        "elapsed_ms": round(normalized.elapsed_ms, 1),
+        "passthrough": normalized.passthrough,
+    })
+    if gated and normalized.passthrough:
+        check_image_quality(image_data, profile_name, gate=gate)
+    return normalized.base64
+
+# Long-lived GCP clients, created on first use and shared by all requests
+gcp_clients = {}
+gcp_clients_lock = threading.Lock()
+
+def get_gcp_client(name: str, factory):
+    """Return the shared GCP client called name, creating it once"""
+    client_instance = gcp_clients.get(name)
+    if client_instance is None:
+        with gcp_clients_lock:
+            client_instance = gcp_clients.get(name)
+            if client_instance is None:
+                client_instance = factory()
+                gcp_clients[name] = client_instance
+    return client_instance
+
+def load_factory(path: str):
+    """Resolve a "module:callable" configuration value"""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+def get_video_intelligence_client():
+    if gcp_video_intelligence_factory:
+        return get_gcp_client("video_intelligence", load_factory(gcp_video_intelligence_factory))
+    return get_gcp_client("video_intelligence", videointelligence_v1.VideoIntelligenceServiceClient)
+
+def get_storage_client():
+    return get_gcp_client("storage", lambda: storage.Client(project=gcp_project_id))
+
+def select_gcp_input_mode(video_size: int) -> str:
+    """Send small videos inline; stream large ones to the bucket to stay under gRPC message limits"""
+    if gcp_video_input_mode in ("inline", "bucket"):
+        return gcp_video_input_mode
+    return "bucket" if video_size > gcp_inline_max_bytes else "inline"
+
+def upload_video_to_bucket(video_file, filename: str, content_type: str = "video/mp4"):
+    """Stream a video to the configured bucket with a chunked resumable upload and return the blob"""
+    bucket = get_storage_client().bucket(gcp_bucket_name)
+    blob = bucket.blob(f"uploads/{uuid.uuid4().hex}-{os.path.basename(filename or 'video.mp4')}")
+    # Setting a chunk size makes the client use a resumable upload in chunks of this size
+    blob.chunk_size = gcp_upload_chunk_size
+    with upstream_call("gcp_storage", "upload"):
+        blob.upload_from_file(video_file, content_type=content_type, rewind=True)
+    gcp_log.info(f"☁️ Uploaded video to gs://{gcp_bucket_name}/{blob.name}")
+    return blob
+
+def delete_bucket_video(blob):
+    try:
+        blob.delete()
+    except Exception as e:
+        gcp_log.warning(f"⚠️ Could not delete gs://{gcp_bucket_name}/{blob.name}: {str(e)}")
+
+@traced("gcp_insights")
+def extract_gcp_insights(result) -> dict:
+    """Flatten an AnnotateVideoResponse into the faces/persons/shots/labels summary sent to the model"""
+    # Per-object attribute dumps are only worth their cost while debugging, and even then only for a sample
+    if gcp_log.isEnabledFor(logging.DEBUG):
+        gcp_log.debug("🔍 Result structure", extra={
+            "result_type": type(result).__name__,
+            "annotations": len(getattr(result, "annotation_results", [])),
+        })
+        for i, annotation in enumerate(getattr(result, "annotation_results", [])):
+            if debug_sampled(gcp_log):
+                gcp_log.debug(f"🔍 Annotation {i}", extra={"attributes": dir(annotation)})
+
+    # Extract insights
+    insights = {
+        "faces": [],
+        "persons": [],
+        "shots": [],
+        "labels": [],
+        "duration": 0
     }
     
-    print(f"📤 Uploading video to: {url}")
-    print(f"📁 Filename: {filename}")
-    print(f"📏 Video size: {len(video_data)} bytes")
+    # Process annotation results
+    for annotation in result.annotation_results:
+        # Get duration from segment if available
+        if hasattr(annotation, 'segment'):
+            insights["duration"] = 0  # We'll calculate this from shot annotations
+        
+        # Face detection
+        if hasattr(annotation, 'face_detection_annotations'):
+            gcp_log.debug(f"🔍 Found {len(annotation.face_detection_annotations)} face detection annotations")
+            for face_detection in annotation.face_detection_annotations:
+                for track in face_detection.tracks:
+                    if debug_sampled(gcp_log):
+                        gcp_log.debug("🔍 Face track", extra={"confidence": track.confidence, "attributes": dir(track)})
+                    face_info = {
+                        "confidence": track.confidence,
+                        "timestamps": []
+                    }
+                    if hasattr(track, 'timestamped_objects'):
+                        for timestamped_object in track.timestamped_objects:
+                            face_info["timestamps"].append({
+                                "time": timestamped_object.normalized_bounding_box.left,
+                                "confidence": track.confidence  # TimestampedObject has no confidence of its own
+                            })
+                    insights["faces"].append(face_info)
+        
+        # Person detection
+        if hasattr(annotation, 'person_detection_annotations'):
+            gcp_log.debug(f"🔍 Found {len(annotation.person_detection_annotations)} person detection annotations")
+            for person_detection in annotation.person_detection_annotations:
+                for track in person_detection.tracks:
+                    if debug_sampled(gcp_log):
+                        gcp_log.debug("🔍 Person track", extra={"confidence": track.confidence})
+                    person_info = {
+                        "confidence": track.confidence,
+                        "timestamps": []
+                    }
+                    if hasattr(track, 'timestamped_objects'):
+                        for timestamped_object in track.timestamped_objects:
+                            person_info["timestamps"].append({
+                                "time": timestamped_object.normalized_bounding_box.left,
+                                "confidence": track.confidence  # TimestampedObject has no confidence of its own
+                            })
+                    insights["persons"].append(person_info)
+        
+        # Shot change detection
+        if hasattr(annotation, 'shot_annotations'):
+            gcp_log.debug(f"🔍 Found {len(annotation.shot_annotations)} shot annotations")
+            for shot_change in annotation.shot_annotations:
+                shot_info = {
+                    "start_time": shot_change.start_time_offset.total_seconds(),
+                    "end_time": shot_change.end_time_offset.total_seconds()
+                }
+                insights["shots"].append(shot_info)
+                # Update duration based on the last shot
+                insights["duration"] = max(insights["duration"], shot_info["end_time"])
+        
+        # Label detection
+        if hasattr(annotation, 'segment_label_annotations'):
+            gcp_log.debug(f"🔍 Found {len(annotation.segment_label_annotations)} label annotations")
+            for label_detection in annotation.segment_label_annotations:
+                # LabelAnnotation has 'segments' not 'entities'
+                if hasattr(label_detection, 'segments'):
+                    if debug_sampled(gcp_log):
+                        gcp_log.debug("🔍 Label", extra={
+                            "label_attributes": dir(label_detection),
+                            "entity_attributes": dir(label_detection.entity),
+                        })
+                    for segment in label_detection.segments:
+                        if debug_sampled(gcp_log):
+                            gcp_log.debug("🔍 Label segment", extra={"attributes": dir(segment)})
+                        label_info = {
+                            "description": label_detection.entity.description,
+                            "confidence": segment.confidence if hasattr(segment, 'confidence') else 0.0,
+                            "start_time": segment.start_time.total_seconds() if hasattr(segment, 'start_time') else 0.0,
+                            "end_time": segment.end_time.total_seconds() if hasattr(segment, 'end_time') else 0.0
+                        }
+                        insights["labels"].append(label_info)
     
+    gcp_log.info("📊 GCP analysis results", extra={
+        "duration": insights["duration"],
+        "faces": len(insights["faces"]),
+        "persons": len(insights["persons"]),
+        "shots": len(insights["shots"]),
+        "labels": len(insights["labels"]),
+    })
+    return insights
+
+def analyze_video_with_gcp(video: Union[bytes, str], filename: str):
+    """Analyze video using Google Cloud Video Intelligence API
+
+    video is either the raw bytes or the path of a spooled upload.
+    """
     try:
-        response = requests.post(url, headers=headers, params=params, files=files)
-        print(f"📡 Upload response status: {response.status_code}")
+        gcp_log.debug(f"🔍 Starting GCP video analysis for: {filename}")
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Video uploaded successfully")
-            print(f"📄 Upload response: {result}")
-            return result
+        # Shared Video Intelligence client
+        video_client = get_video_intelligence_client()
+        
+        # Configure the request
+        features = [
+            videointelligence_v1.Feature.FACE_DETECTION,
+            videointelligence_v1.Feature.PERSON_DETECTION,
+            videointelligence_v1.Feature.LABEL_DETECTION,
+            videointelligence_v1.Feature.SHOT_CHANGE_DETECTION,
+        ]
+        
+        # Create the request: inline content for small videos, a bucket URI for large ones
+        video_size = len(video) if isinstance(video, bytes) else os.path.getsize(video)
+        input_mode = select_gcp_input_mode(video_size)
+        gcs_blob = None
+        if input_mode == "bucket":
+            if isinstance(video, bytes):
+                gcs_blob = upload_video_to_bucket(io.BytesIO(video), filename)
+            else:
+                with open(video, "rb") as video_file:
+                    gcs_blob = upload_video_to_bucket(video_file, filename)
+            request = videointelligence_v1.AnnotateVideoRequest(
+                input_uri=f"gs://{gcp_bucket_name}/{gcs_blob.name}",
+                features=features,
+            )
         else:
-            print(f"❌ Failed to upload video. Status: {response.status_code}")
-            print(f"📄 Response text: {response.text}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to upload video to Video Indexer: {response.text}"
+            request = videointelligence_v1.AnnotateVideoRequest(
+                input_content=read_video_bytes(video),
+                features=features,
             )
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Network error uploading video: {str(e)}")
+        
+        gcp_log.debug(f"📡 Sending video to GCP Video Intelligence API ({input_mode})...")
+        
+        try:
+            with upstream_call("gcp_video_intelligence", "annotate_video"):
+                # Make the request
+                operation = video_client.annotate_video(request=request)
+                
+                gcp_log.debug("⏳ Waiting for video analysis to complete...")
+                
+                # Wait for the operation to complete
+                result = operation.result(timeout=600)
+        finally:
+            if gcs_blob is not None and gcp_delete_uploaded_videos:
+                delete_bucket_video(gcs_blob)
+        
+        gcp_log.info("✅ GCP video analysis completed")
+        return extract_gcp_insights(result)
+            
+    except Exception as e:
+        gcp_log.error(f"❌ GCP video analysis error: {str(e)}")
         raise HTTPException(
             status_code=500,
-            detail=f"Network error uploading video: {str(e)}"
+            detail=f"GCP video analysis failed: {str(e)}"
         )
 
-def get_video_analysis(video_id: str):
-    """Get analysis results from Azure Video Indexer"""
-    access_token = get_video_indexer_access_token()
-    
-    url = f"https://api.videoindexer.ai/{video_indexer_location}/Accounts/{video_indexer_account_id}/Videos/{video_id}/Index"
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to get video analysis: {response.text}"
-        )
+async def run_timed_stage(stage_timings: dict, stage: str, func, *args, **kwargs):
+    """Run a blocking pipeline stage in a worker thread and record its wall time"""
+    stage_start = time.time()
+    try:
+        with span(stage):
+            return await asyncio.to_thread(func, *args, **kwargs)
+    finally:
+        stage_timings[stage] = round(time.time() - stage_start, 3)
+
+def read_video_bytes(video: Union[bytes, str]) -> bytes:
+    """Return the video's bytes, reading a spooled upload from disk only when a stage needs them in memory"""
+    if isinstance(video, bytes):
+        return video
+    with open(video, "rb") as video_file:
+        return video_file.read()
+
+@contextmanager
+def video_source(video: Union[bytes, str]):
+    """Expose a video to OpenCV as a readable path
+
+    Spooled uploads are read straight from their file; raw bytes are backed by
+    an in-memory memfd where the OS supports it.
+    """
+    if isinstance(video, str):
+        yield video
+    elif hasattr(os, "memfd_create"):
+        fd = os.memfd_create("video-upload", 0)
+        try:
+            with os.fdopen(os.dup(fd), "wb") as memfd_file:
+                memfd_file.write(video)
+            yield f"/proc/self/fd/{fd}"
+        finally:
+            os.close(fd)
+    else:
+        # Fallback for platforms without memfd (macOS, Windows)
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
+            temp_file.write(video)
+            temp_file_path = temp_file.name
+        try:
+            yield temp_file_path
+        finally:
+            os.unlink(temp_file_path)
+
+def encode_frame(frame, frame_idx: int, fps: float) -> dict:
+    """JPEG-encode a BGR frame straight from OpenCV into the frame payload"""
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        raise ValueError(f"Could not encode frame {frame_idx}")
+    return {
+        "frame_number": frame_idx,
+        "timestamp": frame_idx / fps if fps > 0 else 0,
+        "image": base64.b64encode(buffer.tobytes()).decode('utf-8')
+    }
+
+def nearest_keyframes(keyframes, target_times: list):
+    """Yield the keyframe closest to each sampling point, in order, consuming keyframes only as far as needed"""
+    resolved = 0
+    previous = None
+    for keyframe in keyframes:
+        if keyframe.time is None:
+            continue
+        # Resolve every sampling point that this keyframe has passed
+        while resolved < len(target_times) and keyframe.time >= target_times[resolved]:
+            target = target_times[resolved]
+            resolved += 1
+            if previous is not None and target - previous.time < keyframe.time - target:
+                yield previous
+            else:
+                yield keyframe
+        if resolved == len(target_times):
+            return
+        previous = keyframe
+
+    # Sampling points past the last keyframe get the last keyframe
+    while previous is not None and resolved < len(target_times):
+        resolved += 1
+        yield previous
+
+def extract_keyframes(video: Union[bytes, str], num_frames: int, max_frames: Optional[int], distinct_frames: Optional[int] = None,
+                      backfill: bool = False):
+    """Pick the keyframe closest to each sampling point, decoding keyframes only (PyAV)
+
+    Returns an iterator of (frame_idx, fps, BGR frame) tuples, or None when the
+    clip has too few keyframes to give the first distinct_frames sampling points
+    (default: all of them) a keyframe each, so the caller can fall back to a full
+    decode. With backfill, the sampling points after max_frames follow from the
+    same decode pass, decoded only if the caller keeps iterating.
+    """
+    container = av.open(video if isinstance(video, str) else io.BytesIO(video))
+    try:
+        stream = container.streams.video[0]
+        stream.codec_context.skip_frame = "NONKEY"
+        fps = float(stream.average_rate or 0)
+
+        if stream.duration is not None and stream.time_base is not None:
+            duration = float(stream.duration * stream.time_base)
+        else:
+            duration = (container.duration or 0) / av.time_base
+
+        target_times = [duration * i / num_frames for i in range(num_frames)]
+        first_count = len(target_times) if max_frames is None else min(max_frames, len(target_times))
+        if not backfill:
+            target_times = target_times[:first_count]
+
+        resolved = nearest_keyframes(container.decode(stream), target_times)
+        chosen = list(itertools.islice(resolved, first_count))
+
+        required = first_count if distinct_frames is None else min(distinct_frames, first_count)
+        if len({id(frame) for frame in chosen[:required]}) < required:
+            container.close()
+            return None
+    except BaseException:
+        container.close()
+        raise
+
+    return keyframe_arrays(container, itertools.chain(chosen, resolved), fps)
+
+def keyframe_arrays(container, keyframes, fps: float):
+    """Convert keyframes to BGR arrays as they are consumed, closing the container when done"""
+    with container:
+        for keyframe in keyframes:
+            yield int(round(keyframe.time * fps)), fps, keyframe.to_ndarray(format="bgr24")
+
+def decode_frames(video: Union[bytes, str], num_frames: int, max_frames: Optional[int], mode: str):
+    """Yield (frame_idx, fps, BGR frame) at regular sampling points with OpenCV, decoding lazily
+
+    "seek" seeks to each frame; "sequential" makes one forward pass.
+    """
+    with video_source(video) as video_path:
+        cap = cv2.VideoCapture(video_path)
+        try:
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS)
+
+            # Extract frames at regular intervals
+            frame_indices = [int(total_frames * i / num_frames) for i in range(num_frames)]
+            if max_frames is not None:
+                frame_indices = frame_indices[:max_frames]
+
+            if mode == "seek":
+                for frame_idx in frame_indices:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                    ret, frame = cap.read()
+                    if ret:
+                        yield frame_idx, fps, frame
+            else:
+                position = 0
+                for frame_idx in sorted(set(frame_indices)):
+                    # grab() advances without converting the frame to BGR
+                    while position < frame_idx and cap.grab():
+                        position += 1
+                    if position < frame_idx:
+                        break
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    position += 1
+                    yield frame_idx, fps, frame
+        finally:
+            cap.release()
+
+def downscaled_gray_frames(video: Union[bytes, str], sample_fps: float, width: int, info: dict):
+    """Yield (pts, time, grayscale frame) at about sample_fps, scaled to width pixels by libswscale (PyAV)
+
+    Deblocking is skipped, which speeds up H.264 decoding and does not matter
+    at this size. The stream's fps, duration and the number of frames decoded
+    go into info.
+    """
+    with av.open(video if isinstance(video, str) else io.BytesIO(video)) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        stream.codec_context.options = {"skip_loop_filter": "all"}
+        fps = float(stream.average_rate or 0)
+        step = max(1, round(fps / sample_fps)) if fps > 0 else 1
+        height = max(2, round(width * stream.height / stream.width / 2) * 2)
+        if stream.duration is not None and stream.time_base is not None:
+            duration = float(stream.duration * stream.time_base)
+        else:
+            duration = (container.duration or 0) / av.time_base
+        info.update({"fps": fps, "sample_fps": fps / step if fps > 0 else sample_fps, "duration": duration, "frames_decoded": 0})
+
+        for index, frame in enumerate(container.decode(stream)):
+            info["frames_decoded"] = index + 1
+            if index % step or frame.pts is None:
+                continue
+            yield frame.pts, frame.time, frame.reformat(width=width, height=height, format="gray").to_ndarray()
+
+@dataclass
+class GrayPass:
+    """A whole downscaled grayscale decode pass, kept in memory so several analyses can read it"""
+    samples: list  # (pts, time, grayscale frame)
+    info: dict  # As filled in by downscaled_gray_frames, plus decode_seconds
+
+def decode_gray_pass(video: Union[bytes, str], sample_fps: float, width: int) -> GrayPass:
+    decode_start = time.perf_counter()
+    info = {}
+    samples = list(downscaled_gray_frames(video, sample_fps, width, info))
+    info["decode_seconds"] = time.perf_counter() - decode_start
+    return GrayPass(samples=samples, info=info)
+
+def score_motion(video: Union[bytes, str], sample_fps: float, width: int, gray: Optional[GrayPass] = None) -> dict:
+    """Score motion across the clip in one downscaled decode pass, or in gray if it was already decoded
+
+    Each sampled frame's score is the mean absolute difference from the
+    previous sample, smoothed over half a second so sustained movement outranks
+    single noisy frames.
+    """
+    analysis_start = time.perf_counter()
+    info = gray.info if gray is not None else {}
+    if gray is not None:
+        sample_fps = info["sample_fps"]
+    pts, times, scores = [], [], []
+    previous = None
+    for frame_pts, frame_time, small in gray.samples if gray is not None else downscaled_gray_frames(video, sample_fps, width, info):
+        if previous is not None:
+            pts.append(frame_pts)
+            times.append(frame_time)
+            scores.append(cv2.absdiff(small, previous).mean())
+        previous = small
+    fps = info.get("fps", 0.0)
+
+    scores = np.asarray(scores, dtype=np.float32)
+    window = max(1, round(sample_fps / 2))
+    if len(scores) >= window:
+        scores = np.convolve(scores, np.ones(window, dtype=np.float32) / window, mode="same")
+    elapsed = time.perf_counter() - analysis_start + info.get("decode_seconds", 0.0)
+    duration = times[-1] if times else 0.0
+    return {
+        "pts": np.asarray(pts),
+        "times": np.asarray(times, dtype=np.float64),
+        "scores": scores,
+        "fps": fps,
+        "stats": {
+            "frames_decoded": info.get("frames_decoded", 0),
+            "frames_scored": len(scores),
+            "analysis_seconds": round(elapsed, 3),
+            "realtime_factor": round(duration / elapsed, 1) if elapsed > 0 else 0.0,
+        },
+    }
+
+def rank_motion_peaks(times: np.ndarray, scores: np.ndarray, count: int, min_gap: float) -> list:
+    """Indices of the highest-motion samples, most active first, each at least min_gap seconds from the others"""
+    picked = []
+    for index in np.argsort(-scores, kind="stable"):
+        if not picked or np.min(np.abs(times[picked] - times[index])) >= min_gap:
+            picked.append(int(index))
+            if len(picked) == count:
+                break
+    return picked
+
+def decode_frames_at(video: Union[bytes, str], pts_list: list, fps: float):
+    """Yield (frame_idx, fps, BGR frame) for each presentation timestamp, seeking to the keyframe before it"""
+    with av.open(video if isinstance(video, str) else io.BytesIO(video)) as container:
+        stream = container.streams.video[0]
+        for target in pts_list:
+            container.seek(int(target), stream=stream, backward=True)
+            for frame in container.decode(stream):
+                if frame.pts is not None and frame.pts >= target:
+                    yield int(round(frame.time * fps)), fps, frame.to_ndarray(format="bgr24")
+                    break
+
+def motion_candidates(video: Union[bytes, str], num_frames: int, selection: dict, gray: Optional[GrayPass] = None,
+                      decode_limit: Optional[int] = None):
+    """Rank up to num_frames temporally spread motion peaks and return a lazy generator of their frames
+
+    Only the decode_limit most active peaks are decoded when it is set.
+    """
+    motion = score_motion(video, video_motion_sample_fps, video_motion_width, gray)
+    times, scores = motion["times"], motion["scores"]
+    if not len(scores):
+        return None
+    # Spread picks so they are not all taken from one burst of movement
+    min_gap = (times[-1] - times[0]) / (2 * num_frames)
+    ranked = rank_motion_peaks(times, scores, num_frames, min_gap)
+    selection["motion"] = {
+        **motion["stats"],
+        "peaks": [{"time": round(float(times[i]), 2), "score": round(float(scores[i]), 2)} for i in ranked],
+        "median_score": round(float(np.median(scores)), 2),
+    }
+    return decode_frames_at(video, [motion["pts"][i] for i in ranked[:decode_limit]], motion["fps"])
+
+def extract_breathing_signals(video: Union[bytes, str], gray: Optional[GrayPass] = None) -> dict:
+    """Estimate respiratory rate and movement from the video on the CPU
+
+    One downscaled pass (see downscaled_gray_frames, or gray when motion frame
+    selection already decoded it) reduces each sample to
+    8-pixel block means. Frame differences of every block are transformed at
+    once; the blocks with most of their power in the breathing band form the
+    chest/abdomen ROI, sign-aligned so opposite edges of a rising chest add
+    up. The ROI signal's spectral peak gives the rate, its autocorrelation at
+    one breath period the regularity, and whole-frame differences the share of
+    the clip with gross body movement.
+    """
+    analysis_start = time.perf_counter()
+    if av is None:
+        return {"status": "unavailable", "reason": "PyAV not installed"}
+
+    info = gray.info if gray is not None else {}
+    blocks, times, gross = [], [], []
+    previous = None
+    samples = gray.samples if gray is not None else downscaled_gray_frames(video, video_signals_sample_fps, video_motion_width, info)
+    for _, frame_time, small in samples:
+        if frame_time > video_signals_max_seconds:
+            break
+        grid = (max(1, small.shape[1] // BREATHING_BLOCK_PX), max(1, small.shape[0] // BREATHING_BLOCK_PX))
+        blocks.append(cv2.resize(small, grid, interpolation=cv2.INTER_AREA).astype(np.float32))
+        times.append(frame_time)
+        if previous is not None:
+            gross.append(cv2.absdiff(small, previous).mean())
+        previous = small
+
+    seconds = times[-1] - times[0] if len(times) > 1 else 0.0
+    video_duration = round(info.get("duration", 0.0), 2)
+    # At least two breaths at the slowest rate in the band
+    if seconds < 2 / BREATHING_BAND_HZ[0]:
+        return {"status": "too_short", "seconds_analyzed": round(seconds, 2), "video_duration": video_duration}
+
+    rate = (len(times) - 1) / seconds
+    grid_h, grid_w = blocks[0].shape
+    gross = np.asarray(gross, dtype=np.float32)
+    moving = gross > 3 * np.median(gross) + 1.0
+    diffs = np.diff(np.stack(blocks).reshape(len(blocks), -1), axis=0)
+    # Repositioning and startle bursts would swamp the spectrum; drop them
+    diffs[moving] = 0.0
+    diffs -= diffs.mean(axis=0)
+    window = np.hanning(len(diffs)).astype(np.float32)[:, None]
+    power = np.abs(np.fft.rfft(diffs * window, axis=0)) ** 2
+    freqs = np.fft.rfftfreq(len(diffs), d=1 / rate)
+    band = (freqs >= BREATHING_BAND_HZ[0]) & (freqs <= BREATHING_BAND_HZ[1])
+    band_fraction = power[band].sum(axis=0) / (power[1:].sum(axis=0) + 1e-9)
+
+    roi_size = max(4, len(band_fraction) // 20)
+    roi = np.argsort(-band_fraction)[:roi_size]
+    reference = diffs[:, roi[0]]
+    signs = np.sign(diffs[:, roi].T @ reference)
+    signs[signs == 0] = 1
+    signal = (diffs[:, roi] * signs).mean(axis=1)
+
+    # Zero-pad so the peak is located to well under one breath per minute
+    padded = max(4096, len(signal))
+    spectrum = np.abs(np.fft.rfft(signal * window[:, 0], n=padded)) ** 2
+    padded_freqs = np.fft.rfftfreq(padded, d=1 / rate)
+    padded_band = (padded_freqs >= BREATHING_BAND_HZ[0]) & (padded_freqs <= BREATHING_BAND_HZ[1])
+    peak = np.flatnonzero(padded_band)[np.argmax(spectrum[padded_band])]
+    breathing_hz = float(padded_freqs[peak])
+    near_peak = np.abs(padded_freqs - breathing_hz) <= 0.1
+    signal_quality = float(spectrum[near_peak].sum() / (spectrum[1:].sum() + 1e-9))
+
+    lag = int(round(rate / breathing_hz))
+    centered = signal - signal.mean()
+    regularity = 0.0
+    if 0 < lag < len(centered):
+        regularity = float(np.dot(centered[:-lag], centered[lag:]) / (np.dot(centered, centered) + 1e-9))
+
+    gross_motion_fraction = float(moving.mean())
+
+    rows, cols = np.divmod(roi, grid_w)
+    return {
+        "status": "ok",
+        "respiratory_rate_bpm": round(breathing_hz * 60, 1),
+        "signal_quality": round(signal_quality, 3),
+        "regularity": round(max(0.0, regularity), 3),
+        "gross_motion_fraction": round(gross_motion_fraction, 3),
+        "reliable": signal_quality >= 0.3 and gross_motion_fraction < 0.3,
+        "roi": {
+            "left": round(float(cols.min()) / grid_w, 3),
+            "top": round(float(rows.min()) / grid_h, 3),
+            "right": round(float(cols.max() + 1) / grid_w, 3),
+            "bottom": round(float(rows.max() + 1) / grid_h, 3),
+        },
+        "motion_series": {"fps": round(rate, 2), "values": [round(float(value), 3) for value in signal]},
+        "seconds_analyzed": round(seconds, 2),
+        "video_duration": video_duration,
+        "analysis_seconds": round(time.perf_counter() - analysis_start, 3),
+    }
+
+def frame_hash(frame) -> np.ndarray:
+    """64-bit perceptual hash of a BGR frame as a boolean array
+
+    dhash compares neighbouring pixels of a 9x8 thumbnail; phash thresholds the
+    lowest 8x8 DCT coefficients of a 32x32 thumbnail at their median.
+    """
+    # Subsample first: area-resizing a full 720p frame costs several times the rest of the hash
+    step = max(1, min(frame.shape[0], frame.shape[1]) // 90)
+    gray = cv2.cvtColor(np.ascontiguousarray(frame[::step, ::step]), cv2.COLOR_BGR2GRAY)
+    if video_frame_hash == "phash":
+        coefficients = cv2.dct(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))[:8, :8].flatten()
+        return coefficients > np.median(coefficients[1:])
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+
+def image_token_cost(width: int, height: int) -> int:
+    """GPT-4o high-detail image tokens: 85 plus 170 per 512px tile after fitting 2048px and a 768px short side"""
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    return 85 + 170 * math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+
+def select_distinct_frames(candidates, budget: int, selection: dict) -> list:
+    """Take candidates in time order, skipping near-duplicates of frames already taken, until budget is met
+
+    Hashes are compared against every kept frame at once; a candidate within
+    video_frame_dedup_threshold bits of any of them is dropped and the next
+    candidate backfills its slot. Counts go into selection.
+    """
+    kept, kept_hashes = [], np.empty((0, 64), dtype=bool)
+    decoded = duplicates = 0
+    for frame_idx, fps, frame in candidates:
+        decoded += 1
+        frame_bits = frame_hash(frame)
+        if len(kept) and np.count_nonzero(kept_hashes != frame_bits, axis=1).min() <= video_frame_dedup_threshold:
+            duplicates += 1
+            continue
+        kept.append((frame_idx, fps, frame))
+        kept_hashes = np.vstack([kept_hashes, frame_bits])
+        if len(kept) == budget:
+            break
+
+    # Without dedup the first min(budget, decodable) candidates would have been sent
+    frames_saved = min(budget, decoded) - len(kept)
+    tokens_saved = frames_saved * image_token_cost(kept[0][2].shape[1], kept[0][2].shape[0]) if kept else 0
+    selection.update({
+        "hash": video_frame_hash,
+        "threshold": video_frame_dedup_threshold,
+        "candidates_decoded": decoded,
+        "duplicates_dropped": duplicates,
+        "frames_sent": len(kept),
+        "frames_saved": frames_saved,
+        "image_tokens_saved": tokens_saved,
+    })
+    if tokens_saved:
+        llm_image_tokens_saved_total.inc(tokens_saved, endpoint=metrics_endpoint_var.get(), deployment=deployment)
+    return kept
+
+def extract_video_frames(video: Union[bytes, str], num_frames: int = 5, max_frames: Optional[int] = None, mode: Optional[str] = None,
+                         selection: Optional[dict] = None, gray: Optional[GrayPass] = None):
+    """Extract frames from video for detailed analysis
+
+    Frames are sampled at regular intervals across the clip; only the first
+    max_frames of them are encoded. Modes:
+    - "keyframe": decode keyframes only and use the nearest one per sampling point (needs PyAV)
+    - "motion": score motion in a downscaled pass and take the most active, temporally
+      spread frames instead of evenly spaced ones (needs PyAV)
+    - "seek": seek to each frame with OpenCV (fallback when keyframes are too sparse)
+    - "sequential": one forward OpenCV decode pass that stops after the last needed frame,
+      for containers where seeking is unreliable
+
+    With frame dedup enabled the later sampling points are kept as candidates:
+    near-duplicate frames are dropped and replaced by the next distinct one.
+    Selection counts, including image tokens saved, go into selection. Motion
+    mode scores gray instead of decoding its own pass when it is given.
+    """
+    mode = mode or video_frame_mode
+    selection = selection if selection is not None else {}
+    budget = max_frames if max_frames is not None else num_frames
+    # With dedup the later sampling points are backfill candidates, decoded only if a duplicate was dropped
+    decode_limit = None if video_frame_dedup_enabled else max_frames
+    try:
+        candidates = None
+        if mode == "motion":
+            if av is None:
+                video_log.warning("⚠️ PyAV not available, falling back to seek-based frame extraction")
+            else:
+                video_log.debug(f"🎬 Ranking {num_frames} motion peaks in video...")
+                candidates = motion_candidates(video, num_frames, selection, gray, decode_limit)
+            if candidates is None:
+                mode = "seek"
+
+        if mode == "keyframe":
+            if av is None:
+                video_log.warning("⚠️ PyAV not available, falling back to seek-based frame extraction")
+            else:
+                video_log.debug(f"🎬 Extracting {num_frames} keyframes from video...")
+                # With dedup, backfill candidates come from the same keyframe pass
+                candidates = extract_keyframes(video, num_frames, max_frames, backfill=video_frame_dedup_enabled)
+                if candidates is None:
+                    video_log.warning("⚠️ Too few keyframes in video, falling back to seek-based frame extraction")
+            if candidates is None:
+                mode = "seek"
+
+        if candidates is None:
+            video_log.debug(f"🎬 Extracting {num_frames} frames from video ({mode})...")
+            candidates = decode_frames(video, num_frames, decode_limit, mode)
+
+        try:
+            if video_frame_dedup_enabled:
+                chosen = select_distinct_frames(candidates, budget, selection)
+            else:
+                chosen = list(itertools.islice(candidates, budget))
+        finally:
+            if hasattr(candidates, "close"):
+                candidates.close()
+
+        # Motion mode ranks frames by activity; send them in time order
+        chosen.sort(key=lambda candidate: candidate[0])
+        frames = [encode_frame(frame, frame_idx, fps) for frame_idx, fps, frame in chosen]
+        video_log.info(f"✅ Extracted {len(frames)} frames successfully", extra=selection)
+        return frames
+
+    except Exception as e:
+        video_log.error(f"❌ Frame extraction error: {str(e)}")
+        return []
+
+# Pooled connections shared by every Video Indexer call, created on first use
+video_indexer_session = None
+video_indexer_session_lock = threading.Lock()
+
+def get_video_indexer_session():
+    """Return the shared Video Indexer requests session, creating it once"""
+    global video_indexer_session
+    if video_indexer_session is None:
+        with video_indexer_session_lock:
+            if video_indexer_session is None:
+                session = requests.Session()
+                session.mount(
+                    "https://",
+                    requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=video_indexer_max_connections)
+                )
+                video_indexer_session = session
+    return video_indexer_session
+
+video_indexer_http_client = httpx.AsyncClient(
+    base_url=video_indexer_endpoint,
+    timeout=30,
+    limits=httpx.Limits(max_connections=video_indexer_max_connections)
+)
+video_indexer_async_stats = {"requests": 0, "new_connections": 0}
+
+async def count_video_indexer_connection(event_name: str, info: dict):
+    """httpx trace hook: count TCP connects so reuse is visible"""
+    if event_name == "connection.connect_tcp.complete":
+        video_indexer_async_stats["new_connections"] += 1
+
+def video_indexer_token_expiry(token: str) -> float:
+    """Read the exp claim from a Video Indexer JWT, assuming the documented 1 hour lifetime if absent"""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, ValueError, TypeError, AttributeError):
+        return time.time() + 3600
+
+class VideoIndexerTokenCache:
+    """Thread-safe access token cache that refreshes ahead of expiry"""
+
+    def __init__(self, refresh_margin: float):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self.stats = {"fetches": 0, "hits": 0, "fetch_errors": 0}
+
+    def _fresh(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    def get(self, fetch) -> str:
+        if self._fresh():
+            self.stats["hits"] += 1
+            return self._token
+
+        # Only one caller refreshes; the rest wait and reuse its token
+        with self._lock:
+            if self._fresh():
+                self.stats["hits"] += 1
+                return self._token
+            try:
+                token = fetch()
+            except HTTPException:
+                self.stats["fetch_errors"] += 1
+                # Inside the refresh margin the old token is still usable
+                if self._token is not None and time.time() < self._expires_at:
+                    video_indexer_log.warning("⚠️ Video Indexer token refresh failed, using cached token until it expires")
+                    return self._token
+                raise
+            self.stats["fetches"] += 1
+            self._token = token
+            self._expires_at = video_indexer_token_expiry(token)
+            return token
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "cached": self._token is not None,
+            "expires_in": max(0.0, self._expires_at - time.time()) if self._token else 0.0,
+        }
+
+video_indexer_token_cache = VideoIndexerTokenCache(refresh_margin=video_indexer_token_refresh_margin)
+
+def video_indexer_connection_stats() -> dict:
+    """Requests and new connections on the pooled sync session and async client"""
+    sync_requests = 0
+    sync_connections = 0
+    adapters = video_indexer_session.adapters.values() if video_indexer_session is not None else []
+    for adapter in adapters:
+        for pool_key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(pool_key)
+            if pool is not None:
+                sync_requests += pool.num_requests
+                sync_connections += pool.num_connections
+    async_requests = video_indexer_async_stats["requests"]
+    async_connections = video_indexer_async_stats["new_connections"]
+    return {
+        "sync_requests": sync_requests,
+        "sync_new_connections": sync_connections,
+        "async_requests": async_requests,
+        "async_new_connections": async_connections,
+        "reused_connections": max(0, sync_requests - sync_connections) + max(0, async_requests - async_connections),
+    }
+
+def get_video_indexer_access_token():
+    """Get access token for Azure Video Indexer"""
+    if not video_indexer_key:
+        raise HTTPException(
+            status_code=500,
+            detail="Azure Video Indexer key not configured. Please set AZURE_VIDEO_INDEXER_KEY in your .env file."
+        )
+    
+    if not video_indexer_account_id:
+        raise HTTPException(
+            status_code=500,
+            detail="Azure Video Indexer account ID not configured. Please set AZURE_VIDEO_INDEXER_ACCOUNT_ID in your .env file."
+        )
+    
+    # Check if this is a paid account (not trial)
+    is_paid_account = video_indexer_location != "trial"
+    
+    if is_paid_account:
+        # For paid accounts, use the provided access token directly
+        video_indexer_log.debug("✅ Using provided access token for paid account", extra={
+            "location": video_indexer_location,
+            "account_id": video_indexer_account_id,
+        })
+        return video_indexer_key
+    else:
+        # For trial accounts, reuse the cached token and refresh it shortly before expiry
+        return video_indexer_token_cache.get(fetch_video_indexer_access_token)
+
+def fetch_video_indexer_access_token():
+    """Request a new trial-account access token from Video Indexer"""
+    # For trial accounts, use the API to get token
+    url = f"{video_indexer_endpoint}/auth/{video_indexer_location}/Accounts/{video_indexer_account_id}/AccessToken"
+    headers = {
+        "Ocp-Apim-Subscription-Key": video_indexer_key
+    }
+    params = {
+        "allowEdit": "true"
+    }
+    
+    video_indexer_log.info(f"🔑 Getting Video Indexer access token from: {url}", extra={
+        "location": video_indexer_location,
+        "account_id": video_indexer_account_id,
+    })
+    
+    try:
+        with upstream_call("video_indexer", "access_token") as call:
+            response = get_video_indexer_session().get(url, headers=headers, params=params, timeout=30)
+            call["status"] = response.status_code
+        
+        video_indexer_log.debug(f"📡 Response status: {response.status_code}")
+        
+        if response.status_code == 200:
+            token_data = response.json()
+            video_indexer_log.info("✅ Access token obtained successfully")
+            return token_data
+        else:
+            video_indexer_log.error(f"❌ Failed to get access token. Status: {response.status_code}", extra={"response_text": response.text[:500]})
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to get Video Indexer access token: {response.text}"
+            )
+    except requests.exceptions.RequestException as e:
+        video_indexer_log.error(f"❌ Network error getting access token: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Network error getting Video Indexer access token: {str(e)}"
+        )
+
+def upload_video_to_indexer(video_data: bytes, filename: str):
+    """Upload video to Azure Video Indexer"""
+    access_token = get_video_indexer_access_token()
+    
+    url = f"{video_indexer_endpoint}/{video_indexer_location}/Accounts/{video_indexer_account_id}/Videos"
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    
+    # Create multipart form data
+    files = {
+        'file': (filename, video_data, 'video/mp4')
+    }
+    
+    params = {
+        "name": filename,
+        "privacy": "private"
+    }
+    
+    # Let Video Indexer push completion to us instead of waiting for the next poll
+    if video_indexer_callback_url:
+        params["callbackUrl"] = video_indexer_callback_url
+    
+    video_indexer_log.info(f"📤 Uploading video to: {url}", extra={"filename": filename, "bytes": len(video_data)})
+    
+    try:
+        with upstream_call("video_indexer", "upload") as call:
+            response = get_video_indexer_session().post(url, headers=headers, params=params, files=files)
+            call["status"] = response.status_code
+        video_indexer_log.debug(f"📡 Upload response status: {response.status_code}")
+        
+        if response.status_code == 200:
+            result = response.json()
+            video_indexer_log.info("✅ Video uploaded successfully")
+            video_indexer_log.debug(f"📄 Upload response: {result}")
+            return result
+        else:
+            video_indexer_log.error(f"❌ Failed to upload video. Status: {response.status_code}", extra={"response_text": response.text[:500]})
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to upload video to Video Indexer: {response.text}"
+            )
+    except requests.exceptions.RequestException as e:
+        video_indexer_log.error(f"❌ Network error uploading video: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Network error uploading video: {str(e)}"
+        )
+
+def get_video_analysis(video_id: str):
+    """Get analysis results from Azure Video Indexer"""
+    access_token = get_video_indexer_access_token()
+    
+    url = f"{video_indexer_endpoint}/{video_indexer_location}/Accounts/{video_indexer_account_id}/Videos/{video_id}/Index"
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    
+    with upstream_call("video_indexer", "index") as call:
+        response = get_video_indexer_session().get(url, headers=headers, timeout=30)
+        call["status"] = response.status_code
+    if response.status_code == 200:
+        return response.json()
+    else:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get video analysis: {response.text}"
+        )
+
+@dataclass
+class PendingVideo:
+    """A Video Indexer video some caller is waiting on"""
+    video_id: str
+    future: asyncio.Future
+    deadline: float
+    next_poll_at: float
+    attempt: int = 0
+
+class VideoIndexerPoller:
+    """One scheduler task that polls every pending Video Indexer video
+
+    Each video is checked with the lightweight Search API (state only) on an
+    exponential backoff with full jitter; the full Index JSON is fetched once,
+    after the video reports Processed. Callbacks from Video Indexer (see
+    /video-indexer/callback) pull the next check forward.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, http_client: httpx.AsyncClient):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pending: dict[str, list[PendingVideo]] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._http = http_client
+        self.stats = {"state_checks": 0, "index_fetches": 0, "callbacks": 0}
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            # Run outside the request that happened to start the poller so its logs carry no request id
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(self.base_delay, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def wait(self, video_id: str, max_wait_time: int) -> dict:
+        """Wait until the video is processed and return its full index"""
+        self._ensure_started()
+        now = time.time()
+        waiter = PendingVideo(
+            video_id=video_id,
+            future=asyncio.get_running_loop().create_future(),
+            deadline=now + max_wait_time,
+            next_poll_at=now
+        )
+        self.pending.setdefault(video_id, []).append(waiter)
+        self._wake.set()
+        try:
+            return await waiter.future
+        finally:
+            # Drop waiters whose caller gave up (e.g. client disconnected)
+            waiters = self.pending.get(video_id)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self.pending[video_id]
+
+    def notify(self, video_id: str):
+        """Check a video right away, e.g. after a Video Indexer callback"""
+        self.stats["callbacks"] += 1
+        for waiter in self.pending.get(video_id, []):
+            waiter.next_poll_at = time.time()
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _get(self, path: str, params: dict, operation: str) -> dict:
+        access_token = await asyncio.to_thread(get_video_indexer_access_token)
+        video_indexer_async_stats["requests"] += 1
+        with upstream_call("video_indexer", operation) as call:
+            response = await self._http.get(
+                f"/{video_indexer_location}/Accounts/{video_indexer_account_id}{path}",
+                params=params,
+                headers={"Authorization": f"Bearer {access_token}"},
+                extensions={"trace": count_video_indexer_connection}
+            )
+            call["status"] = response.status_code
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to check video status: {response.text}"
+            )
+        try:
+            return response.json()
+        except ValueError:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Video Indexer returned a non-JSON {operation} response: {response.text[:500]}"
+            )
+
+    async def _check(self, video_id: str, waiters: list[PendingVideo]):
+        try:
+            self.stats["state_checks"] += 1
+            search = await self._get("/Videos/Search", {"id": video_id}, "state")
+            try:
+                results = search["results"]
+                # An empty result list means the video isn't searchable yet
+                state = results[0]["state"] if results else "Unknown"
+            except (KeyError, IndexError, TypeError):
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Video Indexer returned a state response without a state: {json.dumps(search)[:500]}"
+                )
+            video_indexer_log.debug(f"📊 Video {video_id} state: {state}")
+
+            if state == "Processed":
+                self.stats["index_fetches"] += 1
+                index = await self._get(f"/Videos/{video_id}/Index", {}, "index")
+                self._resolve(video_id, result=index)
+            elif state == "Failed":
+                error_message = results[0].get("errorMessage", "Unknown error") if results else "Unknown error"
+                self._resolve(video_id, error=HTTPException(
+                    status_code=500,
+                    detail=f"Video processing failed: {error_message}"
+                ))
+            else:
+                self._back_off(waiters)
+        except (httpx.HTTPError, HTTPException) as e:
+            video_indexer_log.error(f"❌ Error checking video status: {str(e)}")
+            error = e if isinstance(e, HTTPException) else HTTPException(
+                status_code=500,
+                detail=f"Network error checking video status: {str(e)}"
+            )
+            self._resolve(video_id, error=error)
+
+    def _back_off(self, waiters: list[PendingVideo]):
+        for waiter in waiters:
+            waiter.attempt += 1
+            waiter.next_poll_at = time.time() + self._backoff(waiter.attempt)
+
+    def _resolve(self, video_id: str, result: Optional[dict] = None, error: Optional[Exception] = None):
+        for waiter in self.pending.pop(video_id, []):
+            if waiter.future.done():
+                continue
+            if error is not None:
+                waiter.future.set_exception(error)
+            else:
+                waiter.future.set_result(result)
+
+    async def _run(self):
+        while True:
+            now = time.time()
+
+            # Time out waiters past their deadline
+            for video_id, waiters in list(self.pending.items()):
+                for waiter in [w for w in waiters if w.deadline <= now]:
+                    waiters.remove(waiter)
+                    if not waiter.future.done():
+                        video_indexer_log.warning(f"⏰ Video processing timeout for {video_id}")
+                        waiter.future.set_exception(HTTPException(status_code=408, detail="Video processing timeout"))
+                if not waiters:
+                    del self.pending[video_id]
+
+            due = {
+                video_id: waiters for video_id, waiters in self.pending.items()
+                if min(w.next_poll_at for w in waiters) <= now
+            }
+            if due:
+                results = await asyncio.gather(
+                    *(self._check(video_id, list(waiters)) for video_id, waiters in due.items()),
+                    return_exceptions=True
+                )
+                for (video_id, waiters), result in zip(due.items(), results):
+                    # Unexpected, possibly transient: keep waiting, on the same backoff as a video still processing
+                    if isinstance(result, Exception):
+                        video_indexer_log.error(f"❌ Video Indexer poller error for {video_id}: {str(result)}")
+                        self._back_off(waiters)
+                continue
+
+            self._wake.clear()
+            next_wakeup = min(
+                (min(min(w.next_poll_at, w.deadline) for w in waiters) for waiters in self.pending.values()),
+                default=now + 3600
+            )
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, next_wakeup - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        await self._http.aclose()
+        if video_indexer_session is not None:
+            video_indexer_session.close()
+
+video_indexer_poller = VideoIndexerPoller(
+    base_delay=video_indexer_poll_base_delay,
+    max_delay=video_indexer_poll_max_delay,
+    http_client=video_indexer_http_client
+)
+
+@app.on_event("shutdown")
+async def stop_video_indexer_poller():
+    """Stop the shared Video Indexer polling task"""
+    await video_indexer_poller.close()
+
+async def wait_for_video_processing(video_id: str, max_wait_time: int = 300):
+    """Wait for video processing to complete"""
+    video_indexer_log.info("⏳ Waiting for video processing", extra={"video_id": video_id, "max_wait_time": max_wait_time})
+    
+    data = await video_indexer_poller.wait(video_id, max_wait_time)
+    video_indexer_log.info("✅ Video processing completed successfully")
+    return data
+
+@app.get("/")
+async def root():
+    return {"message": "Infant Health Assessment API", "status": "running"}
+
+@app.options("/{full_path:path}")
+async def options_handler(full_path: str):
+    """Handle OPTIONS requests for CORS preflight"""
+    return Response(
+        content="",
+        status_code=200,
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Max-Age": "3600",
+        }
+    )
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy", "service": "health-assessment-api"}
+
+prewarm_status = {"state": "disabled", "steps": {}}
+prewarm_task = None
+
+async def prewarm_step(name: str, work):
+    """Run one pre-warm step, recording its time and any error instead of raising"""
+    start = time.perf_counter()
+    try:
+        await work()
+        prewarm_status["steps"][name] = {"status": "ok", "seconds": round(time.perf_counter() - start, 4)}
+    except Exception as e:
+        error = getattr(e, "detail", None) or str(e)
+        prewarm_status["steps"][name] = {"status": "failed", "seconds": round(time.perf_counter() - start, 4), "error": str(error)[:200]}
+        api_log.warning(f"⚠️ Pre-warm step {name} failed: {error}")
+
+async def prewarm_openai():
+    get_openai_client()
+    # Any reply leaves a connected (TLS) connection in the pool for the first completion
+    await openai_http_client.head(endpoint, timeout=openai_connect_timeout)
+
+async def prewarm_gcp():
+    await asyncio.to_thread(get_video_intelligence_client)
+    if gcp_video_input_mode != "inline":
+        await asyncio.to_thread(get_storage_client)
+
+async def prewarm_video_indexer():
+    # Trial accounts fetch and cache a token, which also opens a pooled connection
+    await asyncio.to_thread(get_video_indexer_access_token)
+
+async def prewarm():
+    """Import the lazily loaded modules and create upstream clients before the first request needs them"""
+    if prewarm_delay > 0:
+        await asyncio.sleep(prewarm_delay)
+    prewarm_status["state"] = "running"
+    start = time.perf_counter()
+
+    await prewarm_step("imports", lambda: asyncio.to_thread(load_lazy_modules))
+    steps = {"azure_openai": prewarm_openai}
+    if gcp_project_id and video_analysis_mode != "local":
+        steps["gcp"] = prewarm_gcp
+    if video_indexer_key and video_indexer_account_id:
+        steps["video_indexer"] = prewarm_video_indexer
+    await asyncio.gather(*(prewarm_step(name, work) for name, work in steps.items()))
+
+    prewarm_status["state"] = "done"
+    prewarm_status["seconds"] = round(time.perf_counter() - start, 4)
+    record_startup_milestone("prewarm")
+    api_log.info(f"🔥 Pre-warm finished in {prewarm_status['seconds']:.2f}s", extra={
+        "steps": {name: step["status"] for name, step in prewarm_status["steps"].items()},
+    })
+
+@app.on_event("startup")
+async def start_prewarm():
+    """Mark the worker ready and, if enabled, pre-warm in the background so startup is not delayed"""
+    global prewarm_task
+    record_startup_milestone("ready")
+    if prewarm_enabled:
+        prewarm_status["state"] = "pending"
+        prewarm_task = asyncio.create_task(prewarm(), context=contextvars.Context())
+
+@app.on_event("shutdown")
+async def stop_prewarm():
+    """Cancel a pre-warm that is still running"""
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+
+@app.get("/startup-stats")
+async def get_startup_stats():
+    """
+    Get this worker's startup timeline, lazy import times and pre-warm progress
+    """
+    pending = sorted(value.module_name for value in list(globals().values()) if isinstance(value, LazyModule))
+    return {
+        "milestones": startup_milestones,
+        "lazy_imports": {"loaded": lazy_import_times, "pending": pending},
+        "prewarm": {"enabled": prewarm_enabled, "delay": prewarm_delay, **prewarm_status},
+    }
+
+@app.get("/config")
+async def get_config():
+    """
+    Get current configuration (without sensitive data)
+    """
+    return {
+        "azure_endpoint": endpoint,
+        "model": model_name,
+        "deployment": deployment,
+        "api_version": api_version,
+        "openai_timeout": openai_timeout,
+        "openai_max_connections": openai_max_connections,
+        "api_key_configured": bool(subscription_key and subscription_key != "your-azure-openai-api-key-here"),
+        "video_indexer_configured": bool(video_indexer_key),
+        "video_indexer_location": video_indexer_location,
+        "server_host": host,
+        "server_port": port,
+        "debug_mode": debug
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus text exposition of request, upstream and token metrics
+    """
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """
+    Get assessment result cache hit/miss counters
+    """
+    return assessment_cache.snapshot()
+
+@app.get("/llm-stats")
+async def get_llm_stats():
+    """
+    Get per-endpoint counts of model replies parsed, repaired and failed, plus rate limiter and coalescing state
+    """
+    endpoints = {}
+    for endpoint_name, stats in llm_parse_stats.items():
+        replies = stats["replies"]
+        endpoints[endpoint_name] = {
+            **stats,
+            "parse_failure_rate": (stats["repaired"] + stats["failed"]) / replies if replies else 0.0,
+            "fallback_rate": stats["failed"] / replies if replies else 0.0,
+        }
+    return {
+        "output_mode": llm_output_mode,
+        "repair_enabled": llm_repair_enabled,
+        "endpoints": endpoints,
+        "rate_limiter": llm_rate_limiter.snapshot(),
+        "coalescing": llm_single_flight.snapshot(),
+    }
+
+@app.get("/image-stats")
+async def get_image_stats():
+    """
+    Get image normalization and quality gate totals (bytes saved, photos rejected and time spent)
+    """
+    images = image_normalization_stats["images"]
+    return {
+        "enabled": image_normalization_enabled,
+        **image_normalization_stats,
+        "bytes_saved": image_normalization_stats["original_bytes"] - image_normalization_stats["output_bytes"],
+        "average_ms": image_normalization_stats["total_ms"] / images if images else 0.0,
+        "profiles": {name: vars(profile) for name, profile in IMAGE_PROFILES.items()},
+        "quality_gate": {
+            "enabled": image_quality_gate_enabled,
+            **image_quality_stats,
+            "average_ms": image_quality_stats["total_ms"] / image_quality_stats["checked"] if image_quality_stats["checked"] else 0.0,
+            "gates": {name: vars(gate) for name, gate in QUALITY_GATES.items()},
+        },
+    }
+
+SKIN_SYSTEM_PROMPT = """You are a specialized pediatric dermatologist AI assistant. Your task is to analyze infant skin conditions from images and provide accurate assessments.
+
+Please analyze the image and provide:
+1. The most likely skin condition (e.g., rash, jaundice, eczema, diaper rash, etc.)
+2. Confidence level (0-100%)
+3. Detailed description of what you observe
+4. Specific recommendations for parents/caregivers
+5. Severity level (mild, moderate, severe)
+
+Important guidelines:
+- Be thorough but use simple language
+- Focus on common infant skin conditions
+- Always recommend consulting a pediatrician for serious concerns
+- Consider the infant's age and skin sensitivity
+- Mention any urgent signs that require immediate medical attention
+
+Format your response as JSON with these fields:
+{
+    "condition": "identified condition",
+    "confidence": confidence_percentage,
+    "description": "detailed observation",
+    "recommendations": ["recommendation1", "recommendation2", ...],
+    "severity": "mild/moderate/severe"
+}"""
+
+FACIAL_SYSTEM_PROMPT = """You are a specialized clinical geneticist AI assistant. Your task is to analyze facial features in images to screen for potential genetic conditions and dysmorphology.
+
+CRITICAL: You MUST identify and name the specific genetic condition or issue. If you detect any facial features that suggest a genetic condition, you MUST provide the specific name of the condition (e.g., "Down syndrome", "Williams syndrome", "Noonan syndrome", "Fragile X syndrome", etc.). Do not be vague - if you see features that suggest a condition, name it explicitly.
+
+Please analyze the facial features and provide:
+1. The SPECIFIC NAME of the genetic condition detected (e.g., "Down syndrome", "Williams syndrome", "Noonan syndrome") or "No specific genetic condition detected" if none are apparent
+2. Confidence level (0-100%)
+3. Specific facial features observed that are relevant to genetic assessment
+4. Detailed description of facial morphology analysis
+5. Recommendations for further evaluation
+6. Urgency level (low, moderate, high, critical)
+7. Risk factors and associated conditions
+
+Important guidelines:
+- ALWAYS name the specific genetic condition if you detect features suggesting one
+- Focus on clinically significant facial features
+- Consider common genetic syndromes (Down syndrome, Williams syndrome, Noonan syndrome, Fragile X syndrome, etc.)
+- Be thorough but use accessible language
+- Always recommend professional genetic evaluation
+- Consider age-appropriate facial development
+- Mention any urgent features requiring immediate attention
+- Include both common and rare genetic conditions when relevant
+- If you see features suggesting a condition, DO NOT be hesitant to name it
+
+Format your response as JSON with these fields:
+{
+    "genetic_condition": "SPECIFIC CONDITION NAME (e.g., 'Down syndrome', 'Williams syndrome') or 'No specific genetic condition detected'",
+    "confidence": confidence_percentage,
+    "facial_features": ["feature1", "feature2", ...],
+    "description": "detailed analysis of facial morphology",
+    "recommendations": ["recommendation1", "recommendation2", ...],
+    "urgency_level": "low/moderate/high/critical",
+    "risk_factors": ["risk_factor1", "risk_factor2", ...]
+}"""
+
+POSTURE_SYSTEM_PROMPT = """You are a specialized pediatric orthopedic AI assistant. Your task is to analyze posture and detect spine, head, or postural abnormalities from images.
+
+Please analyze the posture and provide:
+1. Potential posture condition(s) or abnormalities detected
+2. Confidence level (0-100%)
+3. Specific postural abnormalities observed
+4. Detailed description of posture analysis
+5. Recommendations for further evaluation or intervention
+6. Severity level (mild, moderate, severe)
+7. Risk factors and associated conditions
+8. Body regions affected
+
+Important guidelines:
+- Focus on clinically significant postural abnormalities
+- Consider common conditions like scoliosis, kyphosis, lordosis, torticollis, etc.
+- Be thorough but use accessible language
+- Always recommend professional orthopedic evaluation
+- Consider age-appropriate postural development
+- Mention any urgent features requiring immediate attention
+- Include both common and rare postural conditions when relevant
+- Pay attention to spine alignment, head position, shoulder level, pelvic tilt
+
+Format your response as JSON with these fields:
+{
+    "posture_condition": "identified condition or 'Normal posture'",
+    "confidence": confidence_percentage,
+    "abnormalities": ["abnormality1", "abnormality2", ...],
+    "description": "detailed analysis of posture and alignment",
+    "recommendations": ["recommendation1", "recommendation2", ...],
+    "severity": "mild/moderate/severe",
+    "risk_factors": ["risk_factor1", "risk_factor2", ...],
+    "body_regions": ["region1", "region2", ...]
+}"""
+
+MEDICAL_READINGS_SYSTEM_PROMPT = """You are a specialized medical device reading extraction AI assistant. Your task is to analyze photos of medical devices and extract accurate numerical readings and values.
+
+SUPPORTED DEVICES:
+1. GLUCOMETER (Blood Glucose Monitor):
+   - Extract blood glucose level (mg/dL or mmol/L)
+   - Look for numbers like 120, 85, 200, etc.
+   - Note if it's fasting or post-meal reading
+
+2. BLOOD PRESSURE MONITOR:
+   - Extract systolic pressure (top number)
+   - Extract diastolic pressure (bottom number)
+   - Extract pulse/heart rate if shown
+   - Look for numbers like 120/80, 140/90, etc.
+
+3. THERMOMETER:
+   - Extract temperature reading (Fahrenheit or Celsius)
+   - Look for numbers like 98.6°F, 37°C, etc.
+
+4. PULSE OXIMETER:
+   - Extract oxygen saturation percentage
+   - Extract pulse rate
+   - Look for numbers like 98%, 95%, etc.
+
+5. WEIGHT SCALE:
+   - Extract weight measurement
+   - Note units (kg, lbs, etc.)
+
+6. OTHER MEDICAL DEVICES:
+   - Extract any numerical readings visible
+   - Note device type and units
+
+CRITICAL REQUIREMENTS:
+- Extract ONLY numerical values that are clearly visible
+- Do NOT guess or estimate values
+- If a reading is unclear or partially visible, mark it as such
+- Always specify the units (mg/dL, mmHg, °F, °C, %, etc.)
+- Determine if readings are within normal ranges
+- Provide appropriate medical recommendations based on readings
+- For timestamp field: If a timestamp is visible on the device, extract it as a string; if not visible, use an empty string ""
+
+NORMAL RANGES:
+- Blood Glucose: 70-140 mg/dL (fasting: 70-100 mg/dL)
+- Blood Pressure: <120/80 mmHg (normal), 120-129/<80 (elevated), 130-139/80-89 (stage 1), ≥140/≥90 (stage 2)
+- Temperature: 97-99°F (36.1-37.2°C)
+- Oxygen Saturation: 95-100%
+- Pulse: 60-100 bpm (adults), 80-120 bpm (children)
+
+Format your response as JSON with these fields:
+{
+    "device_type": "glucometer/blood_pressure/thermometer/pulse_oximeter/weight_scale/other",
+    "extracted_values": {
+        "primary_reading": "numerical_value",
+        "secondary_reading": "numerical_value_if_applicable",
+        "additional_readings": {}
+    },
+    "confidence": confidence_percentage,
+    "description": "detailed description of what was extracted",
+    "recommendations": ["recommendation1", "recommendation2", ...],
+    "reading_quality": "clear/unclear/partial/error",
+    "units": {
+        "primary_unit": "mg/dL/mmHg/°F/°C/%/kg/lbs",
+        "secondary_unit": "unit_if_applicable"
+    },
+    "timestamp": "extracted_timestamp_if_visible_or_empty_string",
+    "is_normal_range": true/false,
+    "alert_level": "normal/elevated/high/critical/low"
+}"""
+
+def fill_missing_timestamp(result: dict):
+    # Ensure timestamp is a string, not None
+    if result.get("timestamp") is None:
+        result["timestamp"] = ""
 
-def wait_for_video_processing(video_id: str, max_wait_time: int = 300):
-    """Wait for video processing to complete"""
-    access_token = get_video_indexer_access_token()
-    
-    url = f"https://api.videoindexer.ai/{video_indexer_location}/Accounts/{video_indexer_account_id}/Videos/{video_id}/Index"
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-    
-    print(f"⏳ Waiting for video processing...")
-    print(f"🎬 Video ID: {video_id}")
-    print(f"⏰ Max wait time: {max_wait_time} seconds")
-    
-    start_time = time.time()
-    while time.time() - start_time < max_wait_time:
-        try:
-            response = requests.get(url, headers=headers)
-            print(f"📡 Processing check status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                state = data.get("state", "Unknown")
-                print(f"📊 Video state: {state}")
-                
-                if state == "Processed":
-                    print(f"✅ Video processing completed successfully")
-                    return data
-                elif state == "Failed":
-                    error_message = data.get("errorMessage", "Unknown error")
-                    print(f"❌ Video processing failed: {error_message}")
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Video processing failed: {error_message}"
-                    )
-                elif state == "Uploaded":
-                    print(f"📤 Video uploaded, waiting for processing...")
-                elif state == "Processing":
-                    print(f"⚙️ Video is being processed...")
-                else:
-                    print(f"⏳ Video state: {state}, continuing to wait...")
-            else:
-                print(f"❌ Failed to check video status. Status: {response.status_code}")
-                print(f"📄 Response text: {response.text}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to check video status: {response.text}"
-                )
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error checking video status: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Network error checking video status: {str(e)}"
-            )
-        
-        time.sleep(5)
-    
-    print(f"⏰ Video processing timeout after {max_wait_time} seconds")
-    raise HTTPException(
-        status_code=408,
-        detail="Video processing timeout"
-    )
+@dataclass
+class ImageAnalysis:
+    """Prompts, response model and parse-failure fallback of one single-image analysis"""
+    endpoint: str
+    response_model: type
+    system_prompt: str
+    user_prompt: str
+    fallback: dict  # Response fields used when the reply cannot be parsed; description gets the reply text
+    sections: tuple = ()  # Set on a merged analysis: the IMAGE_ANALYSES it answers in one reply
+    max_tokens: int = 2048
+    temperature: float = 0.3
+    prepare_result: Optional[Callable] = None  # Fills server-side fields on the parsed reply (see complete_structured)
 
-@app.get("/")
-async def root():
-    return {"message": "Infant Health Assessment API", "status": "running"}
+    def fallback_response(self, response_text: str):
+        if self.sections:
+            return self.response_model(**{name: IMAGE_ANALYSES[name].fallback_response(response_text) for name in self.sections})
+        return self.response_model(**self.fallback, description=response_text)
 
-@app.options("/{full_path:path}")
-async def options_handler(full_path: str):
-    """Handle OPTIONS requests for CORS preflight"""
-    return Response(
-        content="",
-        status_code=200,
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Max-Age": "3600",
-        }
-    )
+# Every single-image analysis, keyed by the section name /analyze-combined uses
+IMAGE_ANALYSES = {
+    "skin": ImageAnalysis(
+        endpoint="assess-skin",
+        response_model=AssessmentResponse,
+        system_prompt=SKIN_SYSTEM_PROMPT,
+        user_prompt="""Please analyze this infant skin image and provide a comprehensive assessment.""",
+        fallback={
+            "condition": "Analysis completed",
+            "confidence": 0.8,
+            "recommendations": ["Please consult a pediatrician for professional assessment"],
+            "severity": "moderate",
+        },
+    ),
+    "facial": ImageAnalysis(
+        endpoint="analyze-facial-dysmorphology",
+        response_model=FacialDysmorphologyResponse,
+        system_prompt=FACIAL_SYSTEM_PROMPT,
+        user_prompt="""Please analyze this facial image for potential genetic conditions and dysmorphology.""",
+        fallback={
+            "genetic_condition": "Analysis completed",
+            "confidence": 0.8,
+            "facial_features": ["Analysis performed"],
+            "recommendations": ["Please consult a geneticist for professional evaluation"],
+            "urgency_level": "moderate",
+            "risk_factors": ["Professional evaluation recommended"],
+        },
+    ),
+    "posture": ImageAnalysis(
+        endpoint="analyze-posture",
+        response_model=PostureAnalysisResponse,
+        system_prompt=POSTURE_SYSTEM_PROMPT,
+        user_prompt="""Please analyze this image for posture and detect any spine, head, or postural abnormalities.""",
+        fallback={
+            "posture_condition": "Analysis completed",
+            "confidence": 0.8,
+            "abnormalities": ["Analysis performed"],
+            "recommendations": ["Please consult an orthopedic specialist for professional evaluation"],
+            "severity": "moderate",
+            "risk_factors": ["Professional evaluation recommended"],
+            "body_regions": ["General assessment"],
+        },
+    ),
+    "medical": ImageAnalysis(
+        endpoint="extract-medical-readings",
+        response_model=MedicalDeviceReadingResponse,
+        system_prompt=MEDICAL_READINGS_SYSTEM_PROMPT,
+        user_prompt="""Please analyze this medical device photo and extract all visible numerical readings.""",
+        fallback={
+            "device_type": "unknown",
+            "extracted_values": {"error": "Could not extract readings"},
+            "confidence": 0.0,
+            "recommendations": ["Please ensure the device display is clearly visible in the photo"],
+            "reading_quality": "error",
+            "units": {},
+            "timestamp": "",
+            "is_normal_range": False,
+            "alert_level": "unknown",
+        },
+        temperature=0.1,  # Lower temperature for more accurate extraction
+        prepare_result=fill_missing_timestamp,
+    ),
+}
+# Analyses that share one kind of photo; device readings never come from the same shot
+COMBINED_SECTIONS = ("skin", "facial", "posture")
 
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy", "service": "health-assessment-api"}
+def combined_quality_gate(sections: tuple) -> Optional[QualityGate]:
+    """The strictest gate of the combined analyses, so no section sees a photo its own endpoint would reject"""
+    gates = [QUALITY_GATES[IMAGE_ANALYSES[name].endpoint] for name in sections if IMAGE_ANALYSES[name].endpoint in QUALITY_GATES]
+    if not gates:
+        return None
+    return QualityGate(
+        min_sharpness=max(gate.min_sharpness for gate in gates),
+        max_glare=min(gate.max_glare for gate in gates),
+    )
 
-@app.get("/config")
-async def get_config():
-    """
-    Get current configuration (without sensitive data)
-    """
+def image_message(text: str, base64_image: str) -> dict:
     return {
-        "azure_endpoint": endpoint,
-        "model": model_name,
-        "deployment": deployment,
-        "api_version": api_version,
-        "api_key_configured": bool(subscription_key and subscription_key != "your-azure-openai-api-key-here"),
-        "video_indexer_configured": bool(video_indexer_key),
-        "video_indexer_location": video_indexer_location,
-        "server_host": host,
-        "server_port": port,
-        "debug_mode": debug
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": text
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{base64_image}"
+                }
+            }
+        ]
     }
 
+async def run_image_analysis(analysis: ImageAnalysis, base64_image: str, bypass_cache: bool = False):
+    """Answer one analysis of a normalized image from the result cache or one (coalesced) model call"""
+    # Serve repeated uploads of the same image from the result cache
+    cache_key = assessment_cache_key(analysis.endpoint, base64_image, analysis.system_prompt)
+    if bypass_cache:
+        assessment_cache.record_bypass()
+    else:
+        cached_result = await assessment_cache.get(cache_key)
+        if cached_result is not None:
+            return analysis.response_model(**cached_result)
+
+    # Call Azure OpenAI, sharing the reply with identical requests already waiting on it
+    assessment, response_text = await llm_single_flight.run(analysis.endpoint, cache_key, lambda: complete_structured(
+        analysis.endpoint,
+        analysis.response_model,
+        messages=[
+            {
+                "role": "system",
+                "content": analysis.system_prompt,
+            },
+            image_message(analysis.user_prompt, base64_image)
+        ],
+        temperature=analysis.temperature,
+        prepare_result=analysis.prepare_result,
+        max_tokens=analysis.max_tokens
+    ))
+
+    if assessment is not None:
+        await assessment_cache.set(cache_key, assessment.model_dump())
+        return assessment
+
+    # If the reply could not be parsed or repaired, create a structured response
+    api_log.warning("⚠️ Using fallback response structure", extra={"endpoint": analysis.endpoint})
+    return analysis.fallback_response(response_text)
+
+@functools.lru_cache(maxsize=None)
+def merged_image_analysis(sections: tuple) -> ImageAnalysis:
+    """One analysis answering several IMAGE_ANALYSES sections from a single look at the image"""
+    system_prompt = "\n\n".join([
+        f"You are a team of pediatric specialists reviewing one infant photo. Complete each of the {len(sections)} "
+        "assessments below independently, following that section's own instructions.",
+        *(f'=== Section "{name}" ===\n{IMAGE_ANALYSES[name].system_prompt}' for name in sections),
+        f"Reply with one JSON object whose keys are {', '.join(json.dumps(name) for name in sections)}, "
+        "each holding the JSON object that section asks for.",
+    ])
+    user_prompt = "\n".join([
+        "Please analyze this image for every section:",
+        *(f"- {name}: {IMAGE_ANALYSES[name].user_prompt}" for name in sections),
+    ])
+    return ImageAnalysis(
+        endpoint="analyze-combined",
+        response_model=create_model(
+            f"CombinedAnalysis_{'_'.join(sections)}",
+            **{name: (IMAGE_ANALYSES[name].response_model, ...) for name in sections}
+        ),
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        fallback={},
+        sections=sections,
+        # One reply holds every section
+        max_tokens=1024 * (len(sections) + 1),
+    )
+
 @app.post("/assess-skin", response_model=AssessmentResponse)
-async def assess_skin_condition(file: UploadFile = File(...)):
+async def assess_skin_condition(file: UploadFile = File(...), bypass_cache: bool = False):
     """
     Assess infant skin condition from uploaded image
     """
@@ -617,92 +3464,13 @@ async def assess_skin_condition(file: UploadFile = File(...)):
         # Read image data
         image_data = await file.read()
         
-        # Process image to base64
-        base64_image = process_image(image_data)
-        
-        # Create system prompt for skin assessment
-        system_prompt = """You are a specialized pediatric dermatologist AI assistant. Your task is to analyze infant skin conditions from images and provide accurate assessments.
-
-Please analyze the image and provide:
-1. The most likely skin condition (e.g., rash, jaundice, eczema, diaper rash, etc.)
-2. Confidence level (0-100%)
-3. Detailed description of what you observe
-4. Specific recommendations for parents/caregivers
-5. Severity level (mild, moderate, severe)
-
-Important guidelines:
-- Be thorough but use simple language
-- Focus on common infant skin conditions
-- Always recommend consulting a pediatrician for serious concerns
-- Consider the infant's age and skin sensitivity
-- Mention any urgent signs that require immediate medical attention
-
-Format your response as JSON with these fields:
-{
-    "condition": "identified condition",
-    "confidence": confidence_percentage,
-    "description": "detailed observation",
-    "recommendations": ["recommendation1", "recommendation2", ...],
-    "severity": "mild/moderate/severe"
-}"""
-
-        # Create user prompt with image
-        user_prompt = f"""Please analyze this infant skin image and provide a comprehensive assessment. The image is encoded in base64: {base64_image}"""
-
-        # Call Azure OpenAI
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2048,
-            temperature=0.3,
-            top_p=0.9,
-            model=deployment
-        )
-
-        # Parse the response
-        response_text = response.choices[0].message.content
-        
-        # Try to extract JSON from response
-        import json
-        import re
-        
-        # Find JSON in the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            try:
-                result = json.loads(json_match.group())
-                return AssessmentResponse(**result)
-            except json.JSONDecodeError:
-                pass
+        # Process image to base64 (off the event loop so concurrent requests keep flowing)
+        base64_image = await asyncio.to_thread(process_image, image_data, "assess-skin")
         
-        # If JSON parsing fails, create a structured response
-        return AssessmentResponse(
-            condition="Analysis completed",
-            confidence=0.8,
-            description=response_text,
-            recommendations=["Please consult a pediatrician for professional assessment"],
-            severity="moderate"
-        )
+        return await run_image_analysis(IMAGE_ANALYSES["skin"], base64_image, bypass_cache)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
@@ -790,15 +3558,16 @@ async def test_video_indexer():
                 "details": "Please set AZURE_VIDEO_INDEXER_ACCOUNT_ID in your .env file"
             }
         
-        print(f"🔧 Testing Video Indexer Configuration:")
-        print(f"   - Key configured: {'✅' if video_indexer_key else '❌'}")
-        print(f"   - Account ID configured: {'✅' if video_indexer_account_id else '❌'}")
-        print(f"   - Location: {video_indexer_location}")
+        video_indexer_log.info("🔧 Testing Video Indexer configuration", extra={
+            "key_configured": bool(video_indexer_key),
+            "account_id_configured": bool(video_indexer_account_id),
+            "location": video_indexer_location,
+        })
         
         # Test getting access token
         try:
             access_token = get_video_indexer_access_token()
-            print(f"✅ Access token obtained successfully")
+            video_indexer_log.info("✅ Access token obtained successfully")
             
             return {
                 "status": "success",
@@ -815,7 +3584,7 @@ async def test_video_indexer():
             }
             
         except Exception as e:
-            print(f"❌ Access token test failed: {str(e)}")
+            video_indexer_log.error(f"❌ Access token test failed: {str(e)}")
             return {
                 "status": "error",
                 "message": "Video Indexer access token test failed",
@@ -832,7 +3601,7 @@ async def test_video_indexer():
             }
         
     except Exception as e:
-        print(f"❌ Video Indexer test error: {str(e)}")
+        video_indexer_log.error(f"❌ Video Indexer test error: {str(e)}")
         return {
             "status": "error",
             "message": f"Video Indexer test failed: {str(e)}",
@@ -840,8 +3609,28 @@ async def test_video_indexer():
             "details": "Check your configuration and network connectivity"
         }
 
+@app.get("/video-indexer/stats")
+async def get_video_indexer_stats():
+    """
+    Get Video Indexer token cache, connection reuse and poller counters
+    """
+    return {
+        "token": video_indexer_token_cache.snapshot(),
+        "connections": video_indexer_connection_stats(),
+        "poller": {**video_indexer_poller.stats, "pending_videos": len(video_indexer_poller.pending)},
+    }
+
+@app.post("/video-indexer/callback")
+async def video_indexer_callback(id: str, state: Optional[str] = None):
+    """
+    Receive Video Indexer state-change callbacks and wake the poller for that video
+    """
+    video_indexer_log.info(f"📬 Video Indexer callback: {id} -> {state}")
+    video_indexer_poller.notify(id)
+    return {"status": "received"}
+
 @app.post("/analyze-facial-dysmorphology", response_model=FacialDysmorphologyResponse)
-async def analyze_facial_dysmorphology(file: UploadFile = File(...)):
+async def analyze_facial_dysmorphology(file: UploadFile = File(...), bypass_cache: bool = False):
     """
     Analyze facial features for potential genetic conditions and dysmorphology
     """
@@ -860,119 +3649,24 @@ async def analyze_facial_dysmorphology(file: UploadFile = File(...)):
         # Read image data
         image_data = await file.read()
         
-        # Process image to base64
-        base64_image = process_image(image_data)
-        
-        # Create system prompt for facial dysmorphology analysis
-        system_prompt = """You are a specialized clinical geneticist AI assistant. Your task is to analyze facial features in images to screen for potential genetic conditions and dysmorphology.
-
-CRITICAL: You MUST identify and name the specific genetic condition or issue. If you detect any facial features that suggest a genetic condition, you MUST provide the specific name of the condition (e.g., "Down syndrome", "Williams syndrome", "Noonan syndrome", "Fragile X syndrome", etc.). Do not be vague - if you see features that suggest a condition, name it explicitly.
-
-Please analyze the facial features and provide:
-1. The SPECIFIC NAME of the genetic condition detected (e.g., "Down syndrome", "Williams syndrome", "Noonan syndrome") or "No specific genetic condition detected" if none are apparent
-2. Confidence level (0-100%)
-3. Specific facial features observed that are relevant to genetic assessment
-4. Detailed description of facial morphology analysis
-5. Recommendations for further evaluation
-6. Urgency level (low, moderate, high, critical)
-7. Risk factors and associated conditions
+        # Process image to base64 (off the event loop so concurrent requests keep flowing)
+        base64_image = await asyncio.to_thread(process_image, image_data, "analyze-facial-dysmorphology")
 
-Important guidelines:
-- ALWAYS name the specific genetic condition if you detect features suggesting one
-- Focus on clinically significant facial features
-- Consider common genetic syndromes (Down syndrome, Williams syndrome, Noonan syndrome, Fragile X syndrome, etc.)
-- Be thorough but use accessible language
-- Always recommend professional genetic evaluation
-- Consider age-appropriate facial development
-- Mention any urgent features requiring immediate attention
-- Include both common and rare genetic conditions when relevant
-- If you see features suggesting a condition, DO NOT be hesitant to name it
-
-Format your response as JSON with these fields:
-{
-    "genetic_condition": "SPECIFIC CONDITION NAME (e.g., 'Down syndrome', 'Williams syndrome') or 'No specific genetic condition detected'",
-    "confidence": confidence_percentage,
-    "facial_features": ["feature1", "feature2", ...],
-    "description": "detailed analysis of facial morphology",
-    "recommendations": ["recommendation1", "recommendation2", ...],
-    "urgency_level": "low/moderate/high/critical",
-    "risk_factors": ["risk_factor1", "risk_factor2", ...]
-}"""
-
-        # Create user prompt with image
-        user_prompt = f"""Please analyze this facial image for potential genetic conditions and dysmorphology. The image is encoded in base64: {base64_image}"""
-
-        print(f"🔍 Processing facial analysis for file: {file.filename}")
-        print(f"📏 Image size: {len(image_data)} bytes")
-        print(f"🔄 Base64 length: {len(base64_image)} characters")
-
-        # Call Azure OpenAI
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2048,
-            temperature=0.3,
-            top_p=0.9,
-            model=deployment
-        )
+        api_log.debug(f"🔍 Processing facial analysis for file: {file.filename}", extra={
+            "image_bytes": len(image_data),
+            "base64_chars": len(base64_image),
+        })
 
-        # Parse the response
-        response_text = response.choices[0].message.content
-        print(f"📝 Raw response length: {len(response_text)} characters")
-        
-        # Try to extract JSON from response
-        import json
-        import re
-        
-        # Find JSON in the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            try:
-                result = json.loads(json_match.group())
-                print(f"✅ Successfully parsed JSON response")
-                return FacialDysmorphologyResponse(**result)
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON parsing failed: {str(e)}")
-                print(f"📄 Raw response: {response_text[:500]}...")
-                pass
-        
-        # If JSON parsing fails, create a structured response
-        print(f"⚠️ Using fallback response structure")
-        return FacialDysmorphologyResponse(
-            genetic_condition="Analysis completed",
-            confidence=0.8,
-            facial_features=["Analysis performed"],
-            description=response_text,
-            recommendations=["Please consult a geneticist for professional evaluation"],
-            urgency_level="moderate",
-            risk_factors=["Professional evaluation recommended"]
-        )
+        return await run_image_analysis(IMAGE_ANALYSES["facial"], base64_image, bypass_cache)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Facial analysis error: {str(e)}")
+        api_log.error(f"❌ Facial analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing facial analysis: {str(e)}")
 
 @app.post("/analyze-posture", response_model=PostureAnalysisResponse)
-async def analyze_posture(file: UploadFile = File(...)):
+async def analyze_posture(file: UploadFile = File(...), bypass_cache: bool = False):
     """
     Analyze posture and detect spine, head, or postural abnormalities
     """
@@ -991,157 +3685,364 @@ async def analyze_posture(file: UploadFile = File(...)):
         # Read image data
         image_data = await file.read()
         
-        # Process image to base64
-        base64_image = process_image(image_data)
+        # Process image to base64 (off the event loop so concurrent requests keep flowing)
+        base64_image = await asyncio.to_thread(process_image, image_data, "analyze-posture")
+
+        api_log.debug(f"🔍 Processing posture analysis for file: {file.filename}", extra={
+            "image_bytes": len(image_data),
+            "base64_chars": len(base64_image),
+        })
+
+        return await run_image_analysis(IMAGE_ANALYSES["posture"], base64_image, bypass_cache)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        api_log.error(f"❌ Posture analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing posture analysis: {str(e)}")
+
+@app.post("/analyze-combined", response_model=CombinedAnalysisResponse)
+async def analyze_combined(file: UploadFile = File(...), analyses: str = "skin,facial,posture", mode: Optional[str] = None,
+                           bypass_cache: bool = False):
+    """
+    Run several image analyses (skin, facial, posture) on one photo, decoding and normalizing it once
+
+    mode=fanout sends one model call per analysis concurrently; mode=merged asks for all of
+    them in one multi-section call. Defaults to COMBINED_ANALYSIS_MODE.
+    """
+    try:
+        start_time = time.time()
+
+        # Check if Azure OpenAI is properly configured
+        if not subscription_key or subscription_key == "your-azure-openai-api-key-here":
+            raise HTTPException(
+                status_code=500, 
+                detail="Azure OpenAI API key not configured. Please set AZURE_OPENAI_API_KEY in your .env file."
+            )
         
-        # Create system prompt for posture analysis
-        system_prompt = """You are a specialized pediatric orthopedic AI assistant. Your task is to analyze posture and detect spine, head, or postural abnormalities from images.
+        # Validate file type
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
 
-Please analyze the posture and provide:
-1. Potential posture condition(s) or abnormalities detected
-2. Confidence level (0-100%)
-3. Specific postural abnormalities observed
-4. Detailed description of posture analysis
-5. Recommendations for further evaluation or intervention
-6. Severity level (mild, moderate, severe)
-7. Risk factors and associated conditions
-8. Body regions affected
+        sections = tuple(dict.fromkeys(name.strip() for name in analyses.split(",") if name.strip()))
+        unknown = [name for name in sections if name not in COMBINED_SECTIONS]
+        if not sections or unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown analyses: {', '.join(unknown) or '(none given)'}. Choose from {', '.join(COMBINED_SECTIONS)}"
+            )
+        mode = (mode or combined_analysis_mode).lower()
+        if mode not in ("fanout", "merged"):
+            raise HTTPException(status_code=400, detail="mode must be fanout or merged")
+
+        image_data = await file.read()
+        stage_timings = {}
+        
+        # One decode and normalization shared by every section, held to the strictest section's quality gate
+        stage_start = time.time()
+        base64_image = await asyncio.to_thread(process_image, image_data, "analyze-combined", combined_quality_gate(sections))
+        stage_timings["image"] = round(time.time() - stage_start, 3)
+
+        results, errors, section_timings = {}, {}, {}
+        stage_start = time.time()
+        if mode == "merged":
+            combined = await run_image_analysis(merged_image_analysis(sections), base64_image, bypass_cache)
+            results = {name: getattr(combined, name) for name in sections}
+            section_timings = {name: round(time.time() - stage_start, 3) for name in sections}
+        else:
+            failures = []
+
+            async def run_section(name: str):
+                section_start = time.time()
+                try:
+                    results[name] = await run_image_analysis(IMAGE_ANALYSES[name], base64_image, bypass_cache)
+                except Exception as e:
+                    # A failed section does not throw away the others
+                    failures.append(e)
+                    errors[name] = str(e.detail) if isinstance(e, HTTPException) else str(e)
+                    api_log.error(f"❌ Combined analysis section {name} failed: {errors[name]}")
+                finally:
+                    section_timings[name] = round(time.time() - section_start, 3)
+
+            await asyncio.gather(*(run_section(name) for name in sections))
+            if not results:
+                raise failures[0]
+        stage_timings["llm"] = round(time.time() - stage_start, 3)
+
+        processing_time = time.time() - start_time
+        stage_timings["total"] = round(processing_time, 3)
+        api_log.info(f"🧩 Combined analysis ({mode}) of {', '.join(sections)} took {processing_time:.2f}s", extra={
+            "section_timings": section_timings,
+            "errors": len(errors),
+        })
+
+        return CombinedAnalysisResponse(
+            mode=mode,
+            **results,
+            errors=errors,
+            section_timings={name: section_timings[name] for name in sections},
+            stage_timings=stage_timings,
+            processing_time=processing_time
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        api_log.error(f"❌ Combined analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing combined analysis: {str(e)}")
+
+# Leading bytes of the container formats phones and cameras produce
+VIDEO_SIGNATURES = (
+    (4, b"ftyp"), (4, b"moov"), (4, b"mdat"), (4, b"free"), (4, b"wide"),  # MP4 / MOV / 3GP
+    (0, b"\x1a\x45\xdf\xa3"),  # Matroska / WebM
+    (0, b"\x00\x00\x01\xba"),  # MPEG program stream
+    (0, b"FLV"),
+)
+# Multipart boundaries and part headers on top of the file itself
+VIDEO_UPLOAD_OVERHEAD = 64 * 1024
+VIDEO_UPLOAD_PATHS = ("/analyze-video-health", "/analyze-video-health/jobs")
+
+def looks_like_video(head: bytes) -> bool:
+    """Check the first bytes of an upload against known video container signatures"""
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return True
+    # MPEG transport stream: 188-byte packets, each starting with the 0x47 sync byte
+    if len(head) > 188 and head[0] == head[188] == 0x47:
+        return True
+    return any(head[offset:offset + len(magic)] == magic for offset, magic in VIDEO_SIGNATURES)
+
+def memory_usage_snapshot() -> dict:
+    """Current resident set size of this process in MB, and its high-water mark since the process started
+
+    The peak is process-wide (ru_maxrss), so it cannot be attributed to one
+    request; compare rss_mb before and after a request for that.
+    """
+    with open("/proc/self/statm") as statm:
+        current_pages = int(statm.read().split()[1])
+    rss_mb = current_pages * resource.getpagesize() / (1024 * 1024)
+    process_peak_rss_mb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, rss_mb)
+    return {"rss_mb": round(rss_mb, 1), "process_peak_rss_mb": round(process_peak_rss_mb, 1)}
+
+class VideoUploadLimitMiddleware:
+    """Cap video upload bodies and refuse non-video parts before they are fully received"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].rstrip("/") not in VIDEO_UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        limit = video_max_upload_bytes + VIDEO_UPLOAD_OVERHEAD
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            await self.reject(send, 413, f"Video exceeds the {video_max_upload_bytes // (1024 * 1024)} MB upload limit")
+            return
+
+        is_multipart = headers.get(b"content-type", b"").startswith(b"multipart/form-data")
+        received = 0
+        head = b""
+
+        async def limited_receive():
+            nonlocal received, head
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=f"Video exceeds the {video_max_upload_bytes // (1024 * 1024)} MB upload limit")
+                if is_multipart and head is not None:
+                    # Buffer just enough of the body to see the first part's headers
+                    head += body[:4096]
+                    if b"\r\n\r\n" in head or len(head) >= 4096:
+                        part_type = re.search(rb"content-type:\s*([^\r\n;]+)", head, re.IGNORECASE)
+                        head = None
+                        if part_type and not part_type.group(1).strip().lower().startswith(b"video/"):
+                            raise HTTPException(status_code=415, detail="File must be a video")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def reject(send, status_code: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+# Registered innermost first, so request ids, metrics and traces also cover upload rejections.
+# Tracing is only installed when enabled: untraced requests pay one contextvar lookup per stage.
+app.add_middleware(VideoUploadLimitMiddleware)
+if tracing_enabled:
+    app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+# CORS is outermost so responses sent by the middlewares above (e.g. an early 413) carry its headers too
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=False,  # Changed to False for public API
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["*"],
+    expose_headers=["*"],
+    max_age=3600,
+)
 
-Important guidelines:
-- Focus on clinically significant postural abnormalities
-- Consider common conditions like scoliosis, kyphosis, lordosis, torticollis, etc.
-- Be thorough but use accessible language
-- Always recommend professional orthopedic evaluation
-- Consider age-appropriate postural development
-- Mention any urgent features requiring immediate attention
-- Include both common and rare postural conditions when relevant
-- Pay attention to spine alignment, head position, shoulder level, pelvic tilt
+@dataclass
+class SpooledVideo:
+    """A video upload copied to its own file on disk"""
+    path: str
+    filename: str
+    size: int
 
-Format your response as JSON with these fields:
-{
-    "posture_condition": "identified condition or 'Normal posture'",
-    "confidence": confidence_percentage,
-    "abnormalities": ["abnormality1", "abnormality2", ...],
-    "description": "detailed analysis of posture and alignment",
-    "recommendations": ["recommendation1", "recommendation2", ...],
-    "severity": "mild/moderate/severe",
-    "risk_factors": ["risk_factor1", "risk_factor2", ...],
-    "body_regions": ["region1", "region2", ...]
-}"""
+    def cleanup(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
 
-        # Create user prompt with image
-        user_prompt = f"""Please analyze this image for posture and detect any spine, head, or postural abnormalities. The image is encoded in base64: {base64_image}"""
+@traced("upload")
+async def spool_video_upload(file: UploadFile) -> SpooledVideo:
+    """Copy an upload to disk in fixed-size chunks, enforcing the size cap and a container sniff"""
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    spool_file = tempfile.NamedTemporaryFile(dir=video_spool_dir, suffix=suffix, delete=False)
+    size = 0
+    try:
+        with spool_file:
+            while True:
+                chunk = await file.read(VIDEO_SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not looks_like_video(chunk[:512]):
+                    raise HTTPException(status_code=415, detail="File content is not a recognised video container")
+                size += len(chunk)
+                if size > video_max_upload_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Video exceeds the {video_max_upload_bytes // (1024 * 1024)} MB upload limit"
+                    )
+                await asyncio.to_thread(spool_file.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded video is empty")
+    except BaseException:
+        os.unlink(spool_file.name)
+        raise
+    finally:
+        await file.close()
 
-        print(f"🔍 Processing posture analysis for file: {file.filename}")
-        print(f"📏 Image size: {len(image_data)} bytes")
-        print(f"🔄 Base64 length: {len(base64_image)} characters")
+    return SpooledVideo(path=spool_file.name, filename=file.filename, size=size)
 
-        # Call Azure OpenAI
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2048,
-            temperature=0.3,
-            top_p=0.9,
-            model=deployment
+def validate_video_request(file: UploadFile, local_only: bool = False):
+    """Check GCP configuration and upload type before accepting a video"""
+    # Check if GCP is properly configured (local-only analysis does not use it)
+    if not gcp_project_id and not local_only:
+        raise HTTPException(
+            status_code=500,
+            detail="GCP Project ID not configured. Please set GCP_PROJECT_ID in your .env file."
         )
+    
+    gcp_log.debug("🔧 GCP configuration", extra={
+        "project_id": gcp_project_id,
+        "bucket": gcp_bucket_name,
+        "credentials": bool(gcp_credentials_path),
+    })
+    
+    # Validate file type
+    if not file.content_type.startswith('video/'):
+        raise HTTPException(status_code=400, detail="File must be a video")
 
-        # Parse the response
-        response_text = response.choices[0].message.content
-        print(f"📝 Raw response length: {len(response_text)} characters")
-        
-        # Try to extract JSON from response
-        import json
-        import re
-        
-        # Find JSON in the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            try:
-                result = json.loads(json_match.group())
-                print(f"✅ Successfully parsed JSON response")
-                return PostureAnalysisResponse(**result)
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON parsing failed: {str(e)}")
-                print(f"📄 Raw response: {response_text[:500]}...")
-                pass
-        
-        # If JSON parsing fails, create a structured response
-        print(f"⚠️ Using fallback response structure")
-        return PostureAnalysisResponse(
-            posture_condition="Analysis completed",
-            confidence=0.8,
-            abnormalities=["Analysis performed"],
-            description=response_text,
-            recommendations=["Please consult an orthopedic specialist for professional evaluation"],
-            severity="moderate",
-            risk_factors=["Professional evaluation recommended"],
-            body_regions=["General assessment"]
-        )
+def breathing_signals_stage(video: Union[bytes, str], gray: Optional[GrayPass] = None) -> dict:
+    """Local signal extraction that never fails the analysis it feeds"""
+    try:
+        return extract_breathing_signals(video, gray)
+    except Exception as e:
+        video_log.warning(f"⚠️ Local motion analysis failed: {str(e)}")
+        return {"status": "failed", "reason": str(e)}
 
+def shared_gray_pass(video: Union[bytes, str]) -> Optional[GrayPass]:
+    """The downscaled pass for both motion scoring and breathing, or None so each decodes its own"""
+    try:
+        return decode_gray_pass(video, max(video_motion_sample_fps, video_signals_sample_fps), video_motion_width)
     except Exception as e:
-        print(f"❌ Posture analysis error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing posture analysis: {str(e)}")
+        video_log.warning(f"⚠️ Shared downscaled decode failed: {str(e)}")
+        return None
 
-@app.post("/analyze-video-health", response_model=VideoAnalysisResponse)
-async def analyze_video_health(file: UploadFile = File(...)):
-    """
-    Analyze video for eye/vision issues, neurological issues, and breathing difficulties using GCP
+def describe_local_signals(signals: dict) -> str:
+    """Prompt section for the locally measured breathing and movement signals"""
+    if signals.get("status") != "ok":
+        return f"Local Motion Analysis: not available ({signals.get('status', 'disabled')})"
+    reliability = (
+        "reliable" if signals["reliable"]
+        else "NOT reliable (weak breathing signal or too much body movement), do not base findings on the rate"
+    )
+    return f"""Local Motion Analysis (chest/abdomen motion over {signals['seconds_analyzed']} seconds):
+- Estimated respiratory rate: {signals['respiratory_rate_bpm']} breaths/min ({reliability})
+- Breathing signal quality: {signals['signal_quality']:.2f} (0-1, share of motion at the breathing frequency)
+- Breathing regularity: {signals['regularity']:.2f} (0-1, 1 = perfectly regular)
+- Share of the clip with gross body movement: {signals['gross_motion_fraction']:.0%}"""
+
+async def run_video_health_analysis(video: SpooledVideo, start_time: float, stage_timings: dict, notify_stage=None,
+                                    local_only: bool = False) -> VideoAnalysisResponse:
+    """Run the GCP annotation, local signal extraction, frame extraction and GPT-4o pipeline on a spooled video upload
+
+    With local_only the GCP annotation is skipped and only the local stages feed the model.
     """
-    try:
-        start_time = time.time()
-        
-        # Check if GCP is properly configured
-        if not gcp_project_id:
-            raise HTTPException(
-                status_code=500,
-                detail="GCP Project ID not configured. Please set GCP_PROJECT_ID in your .env file."
-            )
-        
-        print(f"🔧 GCP Configuration:")
-        print(f"   - Project ID: {gcp_project_id}")
-        print(f"   - Bucket Name: {gcp_bucket_name}")
-        print(f"   - Credentials: {'✅' if gcp_credentials_path else '❌'}")
-        
-        # Validate file type
-        if not file.content_type.startswith('video/'):
-            raise HTTPException(status_code=400, detail="File must be a video")
-        
-        # Read video data
-        video_data = await file.read()
-        
-        print(f"🎥 Processing video analysis for file: {file.filename}")
-        print(f"📏 Video size: {len(video_data)} bytes")
-        
-        # Analyze video with GCP Video Intelligence API
-        print("🔍 Starting GCP video analysis...")
-        gcp_insights = analyze_video_with_gcp(video_data, file.filename)
-        
-        # Extract video frames for detailed analysis
-        print("🎬 Extracting video frames for detailed analysis...")
-        video_frames = extract_video_frames(video_data, num_frames=5)
-        
-        # Create system prompt for video health analysis
-        system_prompt = """You are a specialized pediatric neurologist and ophthalmologist AI assistant. Your task is to analyze video data for potential health issues in infants, specifically focusing on:
+    def notify(stage: str):
+        if notify_stage:
+            notify_stage(stage)
+
+    filename = video.filename
+    memory_usage = {"start": memory_usage_snapshot()}
+    video_log.info(f"🎥 Processing video analysis for file: {filename}", extra={"bytes": video.size})
+    
+    # GCP annotation, local signals and frame extraction are independent: run
+    # them in worker threads at the same time, all reading the spooled file from disk
+    video_log.debug(f"🔍 Starting {'local' if local_only else 'GCP'} video analysis and frame extraction...")
+    if not local_only:
+        notify("annotating")
+    if video_signals_enabled:
+        notify("signals")
+    notify("frames")
+    stage_start = time.time()
+    frame_selection = {}
+
+    async def local_stages():
+        gray = None
+        if video_signals_enabled and video_frame_mode == "motion" and av is not None:
+            # Motion frame selection and breathing estimation read the same downscaled pass
+            gray = await run_timed_stage(stage_timings, "gray_decode", shared_gray_pass, video.path)
+        return await asyncio.gather(
+            run_timed_stage(stage_timings, "local_signals", breathing_signals_stage, video.path, gray) if video_signals_enabled else asyncio.sleep(0, {"status": "disabled"}),
+            run_timed_stage(stage_timings, "frame_extraction", extract_video_frames, video.path, num_frames=5, max_frames=video_llm_frames, selection=frame_selection, gray=gray),
+        )
+
+    gcp_insights, (local_signals, video_frames) = await asyncio.gather(
+        run_timed_stage(stage_timings, "gcp_annotation", analyze_video_with_gcp, video.path, filename) if not local_only else asyncio.sleep(0, None),
+        local_stages(),
+    )
+    stage_timings["annotation_and_frames"] = round(time.time() - stage_start, 3)
+
+    if local_only:
+        # Same shape as the GCP insights so clients need not special-case it
+        gcp_insights = {
+            "faces": [], "persons": [], "shots": [], "labels": [],
+            "duration": local_signals.get("video_duration", 0),
+            "source": "local",
+        }
+    gcp_insights["local_signals"] = local_signals
+    if local_signals.get("status") == "ok":
+        video_log.info(
+            f"🫁 Local motion analysis: {local_signals['respiratory_rate_bpm']} breaths/min "
+            f"({'reliable' if local_signals['reliable'] else 'unreliable'}) in {local_signals['analysis_seconds']:.2f}s"
+        )
+    
+    # Create system prompt for video health analysis
+    system_prompt = """You are a specialized pediatric neurologist and ophthalmologist AI assistant. Your task is to analyze video data for potential health issues in infants, specifically focusing on:
 
 1. EYE/VISION ISSUES:
    - Abnormal eye movements (nystagmus, strabismus)
@@ -1208,113 +4109,340 @@ Format your response as JSON with these fields:
     "processing_time": processing_time_in_seconds
 }"""
 
-        # Create user prompt with GCP video insights
-        user_prompt = f"""Please analyze this video data for potential health issues in an infant. Focus on eye/vision issues, neurological issues, and breathing difficulties.
-
-GCP Video Analysis Data:
+    # Create user prompt with GCP video insights and the local signals
+    gcp_section = f"""GCP Video Analysis Data:
 - Duration: {gcp_insights['duration']} seconds
 - Faces detected: {len(gcp_insights['faces'])}
 - Persons detected: {len(gcp_insights['persons'])}
 - Shot changes: {len(gcp_insights['shots'])}
 - Labels detected: {len(gcp_insights['labels'])}
 
+""" if not local_only else f"""Video duration: {gcp_insights['duration']} seconds (quick triage: no cloud video annotation)
+
+"""
+    user_prompt = f"""Please analyze this video data for potential health issues in an infant. Focus on eye/vision issues, neurological issues, and breathing difficulties.
+
+{gcp_section}{describe_local_signals(local_signals)}
+
 Video Frames Extracted: {len(video_frames)} frames
 
 Please provide a comprehensive health assessment based on this video data."""
 
-        # Prepare messages for GPT-4V
-        messages = [
+    # Prepare messages for GPT-4V
+    messages = [
+        {
+            "role": "system",
+            "content": system_prompt,
+        }
+    ]
+    
+    # Add user message with video frames if available
+    if video_frames:
+        # Add text content
+        content = [
             {
-                "role": "system",
-                "content": system_prompt,
+                "type": "text",
+                "text": user_prompt
             }
         ]
         
-        # Add user message with video frames if available
-        if video_frames:
-            # Add text content
-            content = [
-                {
-                    "type": "text",
-                    "text": user_prompt
+        # Add video frames as images
+        for i, frame in enumerate(video_frames):  # Already limited to video_llm_frames
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{frame['image']}"
                 }
-            ]
-            
-            # Add video frames as images
-            for i, frame in enumerate(video_frames[:3]):  # Limit to 3 frames
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{frame['image']}"
-                    }
-                })
-            
-            messages.append({
-                "role": "user",
-                "content": content
-            })
-        else:
-            messages.append({
-                "role": "user",
-                "content": user_prompt
             })
+        
+        messages.append({
+            "role": "user",
+            "content": content
+        })
+    else:
+        messages.append({
+            "role": "user",
+            "content": user_prompt
+        })
 
-        # Call Azure OpenAI for analysis
-        response = client.chat.completions.create(
-            messages=messages,
-            max_tokens=2048,
-            temperature=0.3,
-            top_p=0.9,
-            model=deployment
-        )
+    # Call Azure OpenAI for analysis
+    notify("llm")
+    stage_start = time.time()
+    def prepare_result(result: dict):
+        result["video_insights"] = gcp_insights
+        result["processing_time"] = 0.0
 
-        # Parse the response
-        response_text = response.choices[0].message.content
-        processing_time = time.time() - start_time
-        
-        print(f"📝 Raw response length: {len(response_text)} characters")
-        print(f"⏱️ Processing time: {processing_time:.2f} seconds")
+    analysis, response_text = await complete_structured(
+        "analyze-video-health",
+        VideoAnalysisResponse,
+        messages=messages,
+        server_fields=("video_insights", "processing_time", "stage_timings", "memory_usage", "frame_selection"),
+        prepare_result=prepare_result
+    )
+    stage_timings["llm"] = round(time.time() - stage_start, 3)
+
+    processing_time = time.time() - start_time
+    stage_timings["total"] = round(processing_time, 3)
+    memory_usage["end"] = memory_usage_snapshot()
+    # Concurrent requests share the process, so this also includes their allocations
+    memory_usage["rss_delta_mb"] = round(memory_usage["end"]["rss_mb"] - memory_usage["start"]["rss_mb"], 1)
+    
+    video_log.info(f"⏱️ Video analysis took {processing_time:.2f} seconds", extra={
+        "stage_timings": stage_timings,
+        "rss_delta_mb": memory_usage["rss_delta_mb"],
+    })
+    
+    if analysis is not None:
+        analysis.processing_time = processing_time
+        analysis.stage_timings = stage_timings
+        analysis.memory_usage = memory_usage
+        analysis.frame_selection = frame_selection
+        return analysis
+    
+    # If the reply could not be parsed or repaired, create a structured response
+    video_log.warning("⚠️ Using fallback response structure")
+    return VideoAnalysisResponse(
+        analysis_type="video_health_analysis",
+        detected_issues=["Analysis completed"],
+        confidence=0.8,
+        description=response_text,
+        recommendations=["Please consult a pediatrician for professional evaluation"],
+        severity="moderate",
+        video_insights=gcp_insights,
+        processing_time=processing_time,
+        stage_timings=stage_timings,
+        memory_usage=memory_usage,
+        frame_selection=frame_selection
+    )
+
+@app.post("/analyze-video-health", response_model=VideoAnalysisResponse)
+async def analyze_video_health(file: UploadFile = File(...), local_only: bool = False):
+    """
+    Analyze video for eye/vision issues, neurological issues, and breathing difficulties using GCP
+
+    local_only=true skips the GCP annotation for a quick triage from local motion signals and frames.
+    """
+    try:
+        start_time = time.time()
+        local_only = local_only or video_analysis_mode == "local"
         
-        # Try to extract JSON from response
-        import json
-        import re
+        validate_video_request(file, local_only)
         
-        # Find JSON in the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            try:
-                result = json.loads(json_match.group())
-                result["processing_time"] = processing_time
-                result["video_insights"] = gcp_insights
-                print(f"✅ Successfully parsed JSON response")
-                return VideoAnalysisResponse(**result)
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON parsing failed: {str(e)}")
-                print(f"📄 Raw response: {response_text[:500]}...")
-                pass
+        stage_timings = {}
+
+        # Spool the upload to disk instead of holding it in memory
+        stage_start = time.time()
+        video = await spool_video_upload(file)
+        stage_timings["upload"] = round(time.time() - stage_start, 3)
         
-        # If JSON parsing fails, create a structured response
-        print(f"⚠️ Using fallback response structure")
-        return VideoAnalysisResponse(
-            analysis_type="video_health_analysis",
-            detected_issues=["Analysis completed"],
-            confidence=0.8,
-            description=response_text,
-            recommendations=["Please consult a pediatrician for professional evaluation"],
-            severity="moderate",
-            video_insights=gcp_insights,
-            processing_time=processing_time
-        )
+        try:
+            return await run_video_health_analysis(video, start_time, stage_timings, local_only=local_only)
+        finally:
+            video.cleanup()
 
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        print(f"❌ Video analysis error: {str(e)}")
-        print(f"🔍 Full traceback:")
-        print(traceback.format_exc())
+        video_log.exception(f"❌ Video analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing video analysis: {str(e)}")
 
+@dataclass
+class VideoJob:
+    """State of one queued /analyze-video-health job"""
+    job_id: str
+    filename: str
+    created_at: float
+    video: Optional[SpooledVideo] = None
+    request_id: str = "-"
+    status: str = "queued"  # queued / running / completed / failed
+    stage: str = "uploaded"
+    events: list = field(default_factory=list)
+    stage_timings: dict = field(default_factory=dict)
+    local_only: bool = False
+    result: Optional[VideoAnalysisResponse] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def record_stage(self, stage: str):
+        now = time.time()
+        self.stage = stage
+        self.events.append({"stage": stage, "timestamp": now, "elapsed": round(now - self.created_at, 3)})
+        # Wake every SSE stream waiting on this job, then arm a fresh event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def snapshot(self) -> VideoJobStatus:
+        return VideoJobStatus(
+            job_id=self.job_id,
+            filename=self.filename,
+            status=self.status,
+            stage=self.stage,
+            events=self.events,
+            stage_timings=self.stage_timings,
+            result=self.result,
+            error=self.error,
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            expires_at=self.finished_at + video_job_retention if self.finished_at else None
+        )
+
+video_jobs: dict[str, VideoJob] = {}
+video_job_queue: Optional[asyncio.Queue] = None
+video_job_worker_tasks: list = []
+
+async def video_job_worker():
+    """Take queued video jobs and run the full analysis pipeline for each"""
+    while True:
+        job = await video_job_queue.get()
+        # Log under the id of the request that submitted the job
+        request_id_token = request_id_var.set(job.request_id)
+        job_trace = start_trace("video_job", job_id=job.job_id, request_id=job.request_id) if tracing_enabled else None
+        try:
+            job.status = "running"
+            job.result = await run_video_health_analysis(
+                job.video,
+                job.created_at,
+                job.stage_timings,
+                notify_stage=job.record_stage,
+                local_only=job.local_only
+            )
+            job.status = "completed"
+            job.finished_at = time.time()
+            job.record_stage("done")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            job.finished_at = time.time()
+            jobs_log.error(f"❌ Video job {job.job_id} failed: {job.error}")
+            job.record_stage("failed")
+        finally:
+            # The upload is no longer needed once the pipeline has run
+            job.video.cleanup()
+            job.video = None
+            if job_trace:
+                finish_trace(*job_trace)
+            request_id_var.reset(request_id_token)
+            video_job_queue.task_done()
+
+def ensure_video_job_workers():
+    """Start the bounded worker pool on first use"""
+    global video_job_queue
+    if video_job_queue is None:
+        video_job_queue = asyncio.Queue(maxsize=video_job_queue_size)
+        for _ in range(video_job_workers):
+            video_job_worker_tasks.append(asyncio.create_task(video_job_worker(), context=contextvars.Context()))
+        jobs_log.info(f"🧵 Started {video_job_workers} video job workers")
+
+def prune_video_jobs():
+    """Forget finished jobs whose retention window has passed"""
+    now = time.time()
+    expired = [
+        job_id for job_id, job in video_jobs.items()
+        if job.finished_at and job.finished_at + video_job_retention <= now
+    ]
+    for job_id in expired:
+        del video_jobs[job_id]
+
+def get_video_job(job_id: str) -> VideoJob:
+    prune_video_jobs()
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found or expired")
+    return job
+
+@app.on_event("shutdown")
+async def stop_video_job_workers():
+    """Cancel the video job worker pool"""
+    for task in video_job_worker_tasks:
+        task.cancel()
+
+@app.post("/analyze-video-health/jobs", status_code=202)
+async def submit_video_health_job(file: UploadFile = File(...), local_only: bool = False):
+    """
+    Queue a video for analysis and return a job id immediately
+    """
+    local_only = local_only or video_analysis_mode == "local"
+    validate_video_request(file, local_only)
+    ensure_video_job_workers()
+    prune_video_jobs()
+
+    job = VideoJob(
+        job_id=uuid.uuid4().hex,
+        filename=file.filename,
+        created_at=time.time(),
+        request_id=request_id_var.get(),
+        local_only=local_only
+    )
+
+    stage_start = time.time()
+    job.video = await spool_video_upload(file)
+    job.stage_timings["upload"] = round(time.time() - stage_start, 3)
+
+    try:
+        video_job_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        job.video.cleanup()
+        raise HTTPException(
+            status_code=503,
+            detail="Video analysis queue is full, please retry later",
+            headers={"Retry-After": "30"}
+        )
+
+    video_jobs[job.job_id] = job
+    job.record_stage("uploaded")
+    jobs_log.info(f"📥 Queued video job {job.job_id} for {file.filename} ({video_job_queue.qsize()} waiting)")
+
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/analyze-video-health/jobs/{job.job_id}",
+        "events_url": f"/analyze-video-health/jobs/{job.job_id}/events"
+    }
+
+@app.get("/analyze-video-health/jobs/{job_id}", response_model=VideoJobStatus)
+async def get_video_health_job(job_id: str):
+    """
+    Get the status, progress events and (when finished) result of a video job
+    """
+    return get_video_job(job_id).snapshot()
+
+@app.get("/analyze-video-health/jobs/{job_id}/events")
+async def stream_video_health_job_events(job_id: str):
+    """
+    Stream stage progress of a video job as Server-Sent Events
+    """
+    job = get_video_job(job_id)
+
+    async def event_stream():
+        sent = 0
+        while True:
+            changed = job.changed
+            while sent < len(job.events):
+                event = job.events[sent]
+                sent += 1
+                yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+            if job.finished:
+                yield f"event: result\ndata: {job.snapshot().model_dump_json()}\n\n"
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/extract-medical-readings", response_model=MedicalDeviceReadingResponse)
-async def extract_medical_readings(file: UploadFile = File(...)):
+async def extract_medical_readings(file: UploadFile = File(...), bypass_cache: bool = False):
     """
     Extract medical device readings from photos (glucometer, blood pressure, thermometer, etc.)
     """
@@ -1333,157 +4461,121 @@ async def extract_medical_readings(file: UploadFile = File(...)):
         # Read image data
         image_data = await file.read()
         
-        # Process image to base64
-        base64_image = process_image(image_data)
-        
-        # Create system prompt for medical device reading extraction
-        system_prompt = """You are a specialized medical device reading extraction AI assistant. Your task is to analyze photos of medical devices and extract accurate numerical readings and values.
+        # Process image to base64 (off the event loop so concurrent requests keep flowing)
+        base64_image = await asyncio.to_thread(process_image, image_data, "extract-medical-readings")
 
-SUPPORTED DEVICES:
-1. GLUCOMETER (Blood Glucose Monitor):
-   - Extract blood glucose level (mg/dL or mmol/L)
-   - Look for numbers like 120, 85, 200, etc.
-   - Note if it's fasting or post-meal reading
+        api_log.debug(f"🔍 Processing medical device reading extraction for file: {file.filename}", extra={
+            "image_bytes": len(image_data),
+            "base64_chars": len(base64_image),
+        })
 
-2. BLOOD PRESSURE MONITOR:
-   - Extract systolic pressure (top number)
-   - Extract diastolic pressure (bottom number)
-   - Extract pulse/heart rate if shown
-   - Look for numbers like 120/80, 140/90, etc.
+        return await run_image_analysis(IMAGE_ANALYSES["medical"], base64_image, bypass_cache)
 
-3. THERMOMETER:
-   - Extract temperature reading (Fahrenheit or Celsius)
-   - Look for numbers like 98.6°F, 37°C, etc.
+    except HTTPException:
+        raise
+    except Exception as e:
+        api_log.error(f"❌ Medical reading extraction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing medical reading extraction: {str(e)}")
 
-4. PULSE OXIMETER:
-   - Extract oxygen saturation percentage
-   - Extract pulse rate
-   - Look for numbers like 98%, 95%, etc.
+async def run_batch(files: list[UploadFile], handler, **handler_kwargs) -> BatchResponse:
+    """Run a single-image endpoint over many uploads with bounded concurrency, keeping errors per item"""
+    if not files:
+        raise HTTPException(status_code=400, detail="At least one file is required")
 
-5. WEIGHT SCALE:
-   - Extract weight measurement
-   - Note units (kg, lbs, etc.)
+    if len(files) > batch_max_files:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files in batch: {len(files)} (maximum {batch_max_files})"
+        )
 
-6. OTHER MEDICAL DEVICES:
-   - Extract any numerical readings visible
-   - Note device type and units
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(batch_max_concurrency)
 
-CRITICAL REQUIREMENTS:
-- Extract ONLY numerical values that are clearly visible
-- Do NOT guess or estimate values
-- If a reading is unclear or partially visible, mark it as such
-- Always specify the units (mg/dL, mmHg, °F, °C, %, etc.)
-- Determine if readings are within normal ranges
-- Provide appropriate medical recommendations based on readings
-- For timestamp field: If a timestamp is visible on the device, extract it as a string; if not visible, use an empty string ""
+    async def run_item(index: int, file: UploadFile) -> BatchItemResult:
+        async with semaphore:
+            item_start = time.time()
+            try:
+                result = await handler(file=file, **handler_kwargs)
+                return BatchItemResult(
+                    index=index,
+                    filename=file.filename,
+                    status="success",
+                    status_code=200,
+                    result=result.model_dump(),
+                    processing_time=time.time() - item_start
+                )
+            except HTTPException as e:
+                retry_after = (e.headers or {}).get("Retry-After")
+                return BatchItemResult(
+                    index=index,
+                    filename=file.filename,
+                    status="error",
+                    status_code=e.status_code,
+                    error=e.detail["message"] if isinstance(e.detail, dict) else str(e.detail),
+                    error_detail=e.detail if isinstance(e.detail, dict) else None,
+                    retry_after=int(retry_after) if retry_after else None,
+                    processing_time=time.time() - item_start
+                )
+            except Exception as e:
+                return BatchItemResult(
+                    index=index,
+                    filename=file.filename,
+                    status="error",
+                    status_code=500,
+                    error=str(e),
+                    processing_time=time.time() - item_start
+                )
 
-NORMAL RANGES:
-- Blood Glucose: 70-140 mg/dL (fasting: 70-100 mg/dL)
-- Blood Pressure: <120/80 mmHg (normal), 120-129/<80 (elevated), 130-139/80-89 (stage 1), ≥140/≥90 (stage 2)
-- Temperature: 97-99°F (36.1-37.2°C)
-- Oxygen Saturation: 95-100%
-- Pulse: 60-100 bpm (adults), 80-120 bpm (children)
+    results = await asyncio.gather(*(run_item(i, file) for i, file in enumerate(files)))
+    succeeded = sum(1 for item in results if item.status == "success")
 
-Format your response as JSON with these fields:
-{
-    "device_type": "glucometer/blood_pressure/thermometer/pulse_oximeter/weight_scale/other",
-    "extracted_values": {
-        "primary_reading": "numerical_value",
-        "secondary_reading": "numerical_value_if_applicable",
-        "additional_readings": {}
-    },
-    "confidence": confidence_percentage,
-    "description": "detailed description of what was extracted",
-    "recommendations": ["recommendation1", "recommendation2", ...],
-    "reading_quality": "clear/unclear/partial/error",
-    "units": {
-        "primary_unit": "mg/dL/mmHg/°F/°C/%/kg/lbs",
-        "secondary_unit": "unit_if_applicable"
-    },
-    "timestamp": "extracted_timestamp_if_visible_or_empty_string",
-    "is_normal_range": true/false,
-    "alert_level": "normal/elevated/high/critical/low"
-}"""
+    api_log.info(f"📦 Batch of {len(files)} via {handler.__name__}: {succeeded} succeeded, {len(files) - succeeded} failed")
 
-        # Create user prompt with image
-        user_prompt = f"""Please analyze this medical device photo and extract all visible numerical readings. The image is encoded in base64: {base64_image}"""
+    # Nothing got through the rate limit or the limiter's queue: tell the client when to retry the whole batch
+    if all(item.status_code in (429, 503) for item in results):
+        raise throttled_error(
+            429 if any(item.status_code == 429 for item in results) else 503,
+            max(item.retry_after or 0 for item in results),
+            "Azure OpenAI capacity exhausted for every item in the batch, retry later"
+        )
 
-        print(f"🔍 Processing medical device reading extraction for file: {file.filename}")
-        print(f"📏 Image size: {len(image_data)} bytes")
-        print(f"🔄 Base64 length: {len(base64_image)} characters")
+    return BatchResponse(
+        total=len(files),
+        succeeded=succeeded,
+        failed=len(files) - succeeded,
+        results=results,
+        processing_time=time.time() - start_time
+    )
 
-        # Call Azure OpenAI
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2048,
-            temperature=0.1,  # Lower temperature for more accurate extraction
-            top_p=0.9,
-            model=deployment
-        )
+@app.post("/assess-skin/batch", response_model=BatchResponse)
+async def assess_skin_condition_batch(files: list[UploadFile] = File(...), bypass_cache: bool = False):
+    """
+    Assess infant skin condition for many images in one request
+    """
+    return await run_batch(files, assess_skin_condition, bypass_cache=bypass_cache)
 
-        # Parse the response
-        response_text = response.choices[0].message.content
-        print(f"📝 Raw response length: {len(response_text)} characters")
-        
-        # Try to extract JSON from response
-        import json
-        import re
-        
-        # Find JSON in the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            try:
-                result = json.loads(json_match.group())
-                
-                # Ensure timestamp is a string, not None
-                if result.get("timestamp") is None:
-                    result["timestamp"] = ""
-                
-                print(f"✅ Successfully parsed JSON response")
-                return MedicalDeviceReadingResponse(**result)
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON parsing failed: {str(e)}")
-                print(f"📄 Raw response: {response_text[:500]}...")
-                pass
-        
-        # If JSON parsing fails, create a structured response
-        print(f"⚠️ Using fallback response structure")
-        return MedicalDeviceReadingResponse(
-            device_type="unknown",
-            extracted_values={"error": "Could not extract readings"},
-            confidence=0.0,
-            description=response_text,
-            recommendations=["Please ensure the device display is clearly visible in the photo"],
-            reading_quality="error",
-            units={},
-            timestamp="",
-            is_normal_range=False,
-            alert_level="unknown"
-        )
+@app.post("/analyze-facial-dysmorphology/batch", response_model=BatchResponse)
+async def analyze_facial_dysmorphology_batch(files: list[UploadFile] = File(...), bypass_cache: bool = False):
+    """
+    Analyze facial features for many images in one request
+    """
+    return await run_batch(files, analyze_facial_dysmorphology, bypass_cache=bypass_cache)
 
-    except Exception as e:
-        print(f"❌ Medical reading extraction error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing medical reading extraction: {str(e)}")
+@app.post("/analyze-posture/batch", response_model=BatchResponse)
+async def analyze_posture_batch(files: list[UploadFile] = File(...), bypass_cache: bool = False):
+    """
+    Analyze posture for many images in one request
+    """
+    return await run_batch(files, analyze_posture, bypass_cache=bypass_cache)
+
+@app.post("/extract-medical-readings/batch", response_model=BatchResponse)
+async def extract_medical_readings_batch(files: list[UploadFile] = File(...), bypass_cache: bool = False):
+    """
+    Extract medical device readings from many photos in one request
+    """
+    return await run_batch(files, extract_medical_readings, bypass_cache=bypass_cache)
+
+record_startup_milestone("import")
 
 if __name__ == "__main__":
     import uvicorn
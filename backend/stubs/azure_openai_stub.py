@@ -0,0 +1,143 @@
+"""
+Local stand-in for the Azure OpenAI chat completions API.
+
+Returns a canned GPT-4o style response after a configurable delay so the
+API can be exercised without spending real Azure quota. A fraction of calls
+can be answered with Azure-style 429s to exercise throttling paths.
+
+Usage:
+    python stubs/azure_openai_stub.py --port 9100 --latency 1.0 --jitter 0.2 --rate-limit-ratio 0.05
+    python stubs/azure_openai_stub.py --canned my_reply.json
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:9100/ python main.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# One JSON object carrying the fields of every response model, so the same
+# canned answer parses for all analysis endpoints (extra fields are ignored).
+CANNED_ANALYSIS = {
+    "condition": "No visible skin condition",
+    "genetic_condition": "No specific genetic condition detected",
+    "posture_condition": "Normal posture",
+    "analysis_type": "video_health_analysis",
+    "device_type": "thermometer",
+    "confidence": 0.9,
+    "description": "Canned response from the local Azure OpenAI stub",
+    "recommendations": ["Continue regular pediatric checkups"],
+    "severity": "mild",
+    "urgency_level": "low",
+    "facial_features": ["Normal facial proportions"],
+    "abnormalities": [],
+    "risk_factors": ["None identified"],
+    "body_regions": [],
+    "detected_issues": [],
+    "video_insights": {},
+    "processing_time": 0.0,
+    "extracted_values": {"primary_reading": "98.6", "secondary_reading": "", "additional_readings": {}},
+    "reading_quality": "clear",
+    "units": {"primary_unit": "°F", "secondary_unit": ""},
+    "timestamp": "",
+    "is_normal_range": True,
+    "alert_level": "normal",
+}
+# /analyze-combined in merged mode asks for one object per section
+CANNED_ANALYSIS.update({section: dict(CANNED_ANALYSIS) for section in ("skin", "facial", "posture")})
+
+stub_latency = float(os.getenv("STUB_LATENCY", "1.0"))
+stub_jitter = float(os.getenv("STUB_LATENCY_JITTER", "0"))
+stub_rate_limit_ratio = float(os.getenv("STUB_RATE_LIMIT_RATIO", "0"))
+stub_retry_after = int(os.getenv("STUB_RETRY_AFTER", "1"))
+stub_stats = {"completions": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def load_canned(path: str):
+    """Replace the canned analysis with the JSON object in path"""
+    global CANNED_ANALYSIS
+    with open(path) as canned_file:
+        CANNED_ANALYSIS = json.load(canned_file)
+
+
+if os.getenv("STUB_CANNED_FILE"):
+    load_canned(os.getenv("STUB_CANNED_FILE"))
+
+app = FastAPI(title="Azure OpenAI Stub")
+
+
+@app.middleware("http")
+async def collapse_slashes(request: Request, call_next):
+    """The SDK joins a trailing-slash endpoint into '//openai/...'; accept it like Azure does"""
+    request.scope["path"] = "/" + "/".join(part for part in request.scope["path"].split("/") if part)
+    return await call_next(request)
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    """Sleep for the configured latency, then return the canned analysis or a 429"""
+    body = await request.body()
+    if random.random() < stub_rate_limit_ratio:
+        stub_stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(stub_retry_after)},
+            content={"error": {
+                "code": "429",
+                "message": f"Requests to the ChatCompletions_Create Operation have exceeded the rate limit. Please retry after {stub_retry_after} second.",
+            }},
+        )
+
+    await asyncio.sleep(max(0.0, stub_latency + random.uniform(-stub_jitter, stub_jitter)))
+    # Roughly what Azure charges: text tokens plus a flat cost per image
+    prompt_tokens = len(body) // 4 if b"image_url" not in body else 850
+    stub_stats["completions"] += 1
+    stub_stats["prompt_tokens"] += prompt_tokens
+    stub_stats["completion_tokens"] += 150
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": json.dumps(CANNED_ANALYSIS)},
+            }
+        ],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 150, "total_tokens": prompt_tokens + 150},
+    }
+
+
+@app.get("/stub-stats")
+async def get_stub_stats():
+    """Completions served and 429s injected so far"""
+    return stub_stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local Azure OpenAI stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=stub_latency, help="Seconds to wait per completion")
+    parser.add_argument("--jitter", type=float, default=stub_jitter, help="Uniform +/- seconds added to the latency")
+    parser.add_argument("--rate-limit-ratio", type=float, default=stub_rate_limit_ratio, help="Fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=stub_retry_after, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--canned", help="JSON file with the analysis object to return")
+    args = parser.parse_args()
+
+    stub_latency = args.latency
+    stub_jitter = args.jitter
+    stub_rate_limit_ratio = args.rate_limit_ratio
+    stub_retry_after = args.retry_after
+    if args.canned:
+        load_canned(args.canned)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
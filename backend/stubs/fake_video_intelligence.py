@@ -0,0 +1,95 @@
+"""
+In-process stand-in for the Google Cloud Video Intelligence client.
+
+The real client talks gRPC and long-running operations, so instead of a
+network stub main.py loads this class through GCP_VIDEO_INTELLIGENCE_FACTORY.
+annotate_video returns an operation whose result() sleeps for the configured
+latency and returns a synthetic AnnotateVideoResponse built from real protos,
+so extract_gcp_insights runs exactly as it does in production.
+
+Usage:
+    GCP_PROJECT_ID=load-test \
+    GCP_VIDEO_INTELLIGENCE_FACTORY=stubs.fake_video_intelligence:FakeVideoIntelligenceClient \
+    FAKE_GCP_LATENCY=2.0 FAKE_GCP_ERROR_RATE=0.05 python main.py
+"""
+import datetime
+import os
+import random
+import threading
+import time
+
+fake_gcp_latency = float(os.getenv("FAKE_GCP_LATENCY", "2.0"))
+fake_gcp_error_rate = float(os.getenv("FAKE_GCP_ERROR_RATE", "0"))
+fake_gcp_tracks = int(os.getenv("FAKE_GCP_TRACKS", "40"))
+fake_gcp_labels = int(os.getenv("FAKE_GCP_LABELS", "30"))
+fake_gcp_shots = int(os.getenv("FAKE_GCP_SHOTS", "10"))
+
+
+def make_annotate_response(tracks: int, labels: int, shots: int):
+    """Build an AnnotateVideoResponse with the given number of face/person tracks, labels and shots"""
+    from google.cloud import videointelligence_v1 as vi
+
+    def track(i: int):
+        return vi.Track(
+            confidence=0.9,
+            timestamped_objects=[
+                vi.TimestampedObject(
+                    normalized_bounding_box=vi.NormalizedBoundingBox(left=0.1 * (j % 10), top=0.2),
+                    time_offset=datetime.timedelta(seconds=i + j * 0.1),
+                )
+                for j in range(5)
+            ],
+        )
+
+    def segment(start: float, end: float):
+        return vi.VideoSegment(
+            start_time_offset=datetime.timedelta(seconds=start),
+            end_time_offset=datetime.timedelta(seconds=end),
+        )
+
+    annotation = vi.VideoAnnotationResults(
+        face_detection_annotations=[vi.FaceDetectionAnnotation(tracks=[track(i) for i in range(tracks)])],
+        person_detection_annotations=[vi.PersonDetectionAnnotation(tracks=[track(i) for i in range(tracks)])],
+        shot_annotations=[segment(i * 2.0, i * 2.0 + 2.0) for i in range(shots)],
+        segment_label_annotations=[
+            vi.LabelAnnotation(
+                entity=vi.Entity(description=f"label {i}"),
+                segments=[vi.LabelSegment(segment=segment(0, 10), confidence=0.8) for _ in range(3)],
+            )
+            for i in range(labels)
+        ],
+    )
+    return vi.AnnotateVideoResponse(annotation_results=[annotation])
+
+
+class FakeOperation:
+    """Long-running operation that completes after a fixed delay"""
+
+    def __init__(self, response, latency: float):
+        self._response = response
+        self._latency = latency
+
+    def result(self, timeout=None):
+        time.sleep(self._latency)
+        return self._response
+
+
+class FakeVideoIntelligenceClient:
+    """Drop-in for VideoIntelligenceServiceClient.annotate_video"""
+
+    def __init__(self):
+        self._response = make_annotate_response(fake_gcp_tracks, fake_gcp_labels, fake_gcp_shots)
+        self._lock = threading.Lock()
+        self.stats = {"annotate_calls": 0, "errors_injected": 0}
+
+    def annotate_video(self, request=None, **kwargs):
+        with self._lock:
+            self.stats["annotate_calls"] += 1
+            fail = random.random() < fake_gcp_error_rate
+            if fail:
+                self.stats["errors_injected"] += 1
+        if fail:
+            from google.api_core.exceptions import ResourceExhausted
+
+            raise ResourceExhausted("Quota exceeded for quota metric 'Requests' (injected by fake client)")
+        return FakeOperation(self._response, fake_gcp_latency)
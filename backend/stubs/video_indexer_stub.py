@@ -0,0 +1,127 @@
+"""
+Local stand-in for the Azure Video Indexer REST API.
+
+Implements the calls main.py makes: trial access tokens (JWT-shaped, with an
+exp claim), video upload, the Search state check and the full Index. Uploaded
+videos report Processing until the configured processing time has passed, then
+Processed; if the upload carried a callbackUrl it is POSTed to at that point.
+
+Usage:
+    python stubs/video_indexer_stub.py --port 9200 --processing-time 5
+    AZURE_VIDEO_INDEXER_ENDPOINT=http://127.0.0.1:9200 AZURE_VIDEO_INDEXER_KEY=stub \
+        AZURE_VIDEO_INDEXER_ACCOUNT_ID=stub-account python main.py
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, Request
+
+app = FastAPI(title="Azure Video Indexer stub")
+
+stub_processing_time = float(os.getenv("STUB_PROCESSING_TIME", "5.0"))
+stub_token_lifetime = int(os.getenv("STUB_TOKEN_LIFETIME", "3600"))
+stub_videos: dict[str, dict] = {}
+stub_stats = {"tokens": 0, "uploads": 0, "searches": 0, "index_fetches": 0, "callbacks": 0}
+
+
+def make_token() -> str:
+    """Unsigned JWT with the exp claim main.py reads to schedule refreshes"""
+    def encode(part: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=").decode()
+
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode({'exp': int(time.time()) + stub_token_lifetime})}.stub"
+
+
+def video_state(video: dict) -> str:
+    return "Processed" if time.time() >= video["ready_at"] else "Processing"
+
+
+async def send_callback(video_id: str, callback_url: str):
+    await asyncio.sleep(stub_processing_time)
+    async with httpx.AsyncClient() as client:
+        try:
+            await client.post(callback_url, params={"id": video_id, "state": "Processed"})
+            stub_stats["callbacks"] += 1
+        except httpx.HTTPError:
+            pass
+
+
+@app.get("/auth/{location}/Accounts/{account_id}/AccessToken")
+async def access_token(location: str, account_id: str):
+    stub_stats["tokens"] += 1
+    # The real API returns the token as a JSON string
+    return make_token()
+
+
+@app.post("/{location}/Accounts/{account_id}/Videos")
+async def upload_video(location: str, account_id: str, request: Request):
+    """Accept an upload and start the simulated processing clock"""
+    body = await request.body()
+    video_id = uuid.uuid4().hex[:10]
+    stub_videos[video_id] = {
+        "name": request.query_params.get("name", "video.mp4"),
+        "bytes": len(body),
+        "ready_at": time.time() + stub_processing_time,
+    }
+    stub_stats["uploads"] += 1
+    callback_url = request.query_params.get("callbackUrl")
+    if callback_url:
+        asyncio.create_task(send_callback(video_id, callback_url))
+    return {"id": video_id, "name": stub_videos[video_id]["name"], "state": "Uploaded"}
+
+
+@app.get("/{location}/Accounts/{account_id}/Videos/Search")
+async def search_videos(location: str, account_id: str, id: str):
+    stub_stats["searches"] += 1
+    video = stub_videos.get(id)
+    if video is None:
+        return {"results": []}
+    return {"results": [{"id": id, "name": video["name"], "state": video_state(video)}]}
+
+
+@app.get("/{location}/Accounts/{account_id}/Videos/{video_id}/Index")
+async def video_index(location: str, account_id: str, video_id: str):
+    stub_stats["index_fetches"] += 1
+    video = stub_videos.get(video_id, {"name": "video.mp4", "ready_at": 0})
+    return {
+        "id": video_id,
+        "name": video["name"],
+        "state": video_state(video),
+        "summarizedInsights": {
+            "faces": [{"id": 1, "name": "Unknown #1", "confidence": 0.92}],
+            "labels": [{"id": 1, "name": "baby"}, {"id": 2, "name": "crib"}],
+        },
+        "videos": [{
+            "id": video_id,
+            "state": video_state(video),
+            "insights": {
+                "faces": [{"id": 1, "confidence": 0.92, "instances": [{"start": "0:00:00", "end": "0:00:05"}]}],
+                "labels": [{"id": 1, "name": "baby", "instances": [{"confidence": 0.9, "start": "0:00:00", "end": "0:00:10"}]}],
+                "shots": [{"id": 1, "instances": [{"start": "0:00:00", "end": "0:00:10"}]}],
+            },
+        }],
+    }
+
+
+@app.get("/stub-stats")
+async def get_stub_stats():
+    return {**stub_stats, "videos": len(stub_videos)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Azure Video Indexer stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--processing-time", type=float, default=stub_processing_time, help="Seconds before an upload reports Processed")
+    args = parser.parse_args()
+
+    stub_processing_time = args.processing_time
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,69 @@
+"""
+Shared fixtures for the API tests.
+
+main.py is pointed at the Azure OpenAI stub (stubs/azure_openai_stub.py),
+served from a background thread, and requests go to the app in-process
+through httpx's ASGI transport. Everything runs offline. One event loop is
+shared by the whole session because main.py keeps loop-bound clients.
+
+Usage:
+    python -m pytest -q
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """The Azure OpenAI stub module; tests may change its latency and 429 ratio"""
+    from bench_async_openai import start_stub
+    from stubs import azure_openai_stub
+
+    stub_port = start_stub(0.05)
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{stub_port}/",
+        "AZURE_OPENAI_API_KEY": "test",
+        "AZURE_OPENAI_MAX_RETRIES": "0",
+        "ASSESSMENT_CACHE_DIR": tempfile.mkdtemp(prefix="assessment-cache-"),
+        "LOG_LEVEL": "WARNING",
+    })
+    return azure_openai_stub
+
+
+@pytest.fixture(scope="session")
+def main(stub):
+    import main as main_module
+
+    return main_module
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Run a coroutine on the session's event loop"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def client(main, run):
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test", timeout=30)
+    yield http
+    run(http.aclose())
+
+
+@pytest.fixture(scope="session")
+def photo() -> bytes:
+    """A textured 1280x960 JPEG that passes the image quality gate"""
+    from load_test import make_photo
+
+    return make_photo()
@@ -0,0 +1,36 @@
+import os
+import threading
+
+
+def test_disk_tier_is_read_off_the_event_loop(main, run, tmp_path, monkeypatch):
+    # No memory tier, so every lookup goes to disk
+    cache = main.AssessmentCache(str(tmp_path), memory_entries=0, disk_entries=100, ttl=60)
+    read_threads = []
+    real_read = cache._read
+
+    def recording_read(*args):
+        read_threads.append(threading.get_ident())
+        return real_read(*args)
+
+    monkeypatch.setattr(cache, "_read", recording_read)
+
+    async def store_and_load():
+        await cache.set("key", {"answer": 42})
+        return await cache.get("key"), await cache.get("missing")
+
+    assert run(store_and_load()) == ({"answer": 42}, None)
+    assert cache.stats["disk_hits"] == cache.stats["misses"] == 1
+    assert threading.get_ident() not in read_threads
+
+
+def test_sweep_bounds_the_disk_tier_in_the_background(main, run, tmp_path):
+    cache = main.AssessmentCache(str(tmp_path), memory_entries=10, disk_entries=20, ttl=60)
+
+    async def fill():
+        for index in range(50):
+            await cache.set(f"key-{index}", {"index": index})
+        await cache._sweep_task
+
+    run(fill())
+    assert len(os.listdir(tmp_path)) == 20
+    assert cache.stats["evictions"] == 30
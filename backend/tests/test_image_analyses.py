@@ -0,0 +1,34 @@
+def upload(photo: bytes) -> dict:
+    return {"file": ("photo.jpg", photo, "image/jpeg")}
+
+
+def test_medical_readings_run_through_the_shared_analysis_path(client, run, photo, stub):
+    before = stub.stub_stats["completions"]
+    first = run(client.post("/extract-medical-readings", files=upload(photo)))
+    second = run(client.post("/extract-medical-readings", files=upload(photo)))
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["device_type"] == "thermometer"
+    assert second.json() == first.json()
+    # The repeat is answered from the result cache
+    assert stub.stub_stats["completions"] - before == 1
+
+
+def test_combined_gate_is_the_strictest_of_its_sections(main):
+    gate = main.combined_quality_gate(("skin", "posture"))
+    assert gate.min_sharpness == max(main.QUALITY_GATES["assess-skin"].min_sharpness, main.QUALITY_GATES["analyze-posture"].min_sharpness)
+    assert gate.max_glare == min(main.QUALITY_GATES["assess-skin"].max_glare, main.QUALITY_GATES["analyze-posture"].max_glare)
+    # Facial analysis has no gate of its own
+    assert main.combined_quality_gate(("facial",)) is None
+
+
+def test_combined_rejects_what_a_section_endpoint_rejects(client, run, photo, main, monkeypatch):
+    monkeypatch.setitem(main.QUALITY_GATES, "assess-skin", main.QualityGate(min_sharpness=1e9, max_glare=0.15))
+
+    rejected = run(client.post("/analyze-combined", files=upload(photo), params={"analyses": "skin,posture"}))
+    assert rejected.status_code == 422
+    assert rejected.json()["detail"]["problems"][0]["check"] == "blur"
+
+    accepted = run(client.post("/analyze-combined", files=upload(photo), params={"analyses": "posture"}))
+    assert accepted.status_code == 200
+    assert accepted.json()["posture"]["posture_condition"] == "Normal posture"
@@ -0,0 +1,57 @@
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def upload(photo: bytes) -> dict:
+    return {"file": ("photo.jpg", photo, "image/jpeg")}
+
+
+def test_repeat_upload_is_served_from_the_cache(client, run, photo, stub):
+    before = stub.stub_stats["completions"]
+    first = run(client.post("/analyze-facial-dysmorphology", files=upload(photo), params={"bypass_cache": True}))
+    second = run(client.post("/analyze-facial-dysmorphology", files=upload(photo)))
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert stub.stub_stats["completions"] - before == 1
+
+
+def test_concurrent_identical_requests_share_one_model_call(client, run, photo, stub, monkeypatch):
+    # Slow enough that every request arrives while the first call is in flight
+    monkeypatch.setattr(stub, "stub_latency", 0.5)
+    before = stub.stub_stats["completions"]
+
+    async def burst():
+        return await asyncio.gather(*(
+            client.post("/assess-skin", files=upload(photo), params={"bypass_cache": True}) for _ in range(4)
+        ))
+
+    responses = run(burst())
+    assert [response.status_code for response in responses] == [200] * 4
+    assert stub.stub_stats["completions"] - before == 1
+
+
+def test_unusable_photo_is_rejected_before_the_model_call(client, run, stub):
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((960, 1280, 3), 128, dtype=np.uint8)).save(buffer, format="JPEG")
+    before = stub.stub_stats["completions"]
+
+    response = run(client.post("/assess-skin", files=upload(buffer.getvalue())))
+    assert response.status_code == 422
+    assert "blur" in [problem["check"] for problem in response.json()["detail"]["problems"]]
+    assert stub.stub_stats["completions"] == before
+
+
+def test_rejected_photo_is_not_re_encoded(client, run, monkeypatch):
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((3000, 4000, 3), 128, dtype=np.uint8)).save(buffer, format="PNG")
+    saved = []
+    real_save = Image.Image.save
+    monkeypatch.setattr(Image.Image, "save", lambda image, *args, **kwargs: saved.append(image.size) or real_save(image, *args, **kwargs))
+
+    response = run(client.post("/assess-skin", files={"file": ("photo.png", buffer.getvalue(), "image/png")}))
+    assert response.status_code == 422
+    assert saved == []
@@ -0,0 +1,28 @@
+def requests_total(metrics_text: str, endpoint: str, method: str) -> int:
+    prefix = f'http_requests_total{{endpoint="{endpoint}",method="{method}",'
+    return sum(int(float(line.rsplit(" ", 1)[1])) for line in metrics_text.splitlines() if line.startswith(prefix))
+
+
+def test_preflight_does_not_relabel_route(client, run, photo):
+    labels = [("/assess-skin", "POST"), ("/{full_path:path}", "OPTIONS"), ("/{full_path:path}", "POST")]
+    before = run(client.get("/metrics")).text
+
+    assert run(client.options("/assess-skin")).status_code == 200
+    response = run(client.post("/assess-skin", files={"file": ("photo.jpg", photo, "image/jpeg")}, params={"bypass_cache": True}))
+    assert response.status_code == 200
+
+    after = run(client.get("/metrics")).text
+    counted = [requests_total(after, *label) - requests_total(before, *label) for label in labels]
+    assert counted == [1, 1, 0]
+
+
+def test_label_cache_is_per_method_and_skips_unmatched(main):
+    middleware = main.MetricsMiddleware(None)
+
+    def label(method: str, path: str) -> str:
+        return middleware.endpoint_label({"type": "http", "method": method, "path": path})
+
+    assert label("OPTIONS", "/assess-skin") == "/{full_path:path}"
+    assert label("POST", "/assess-skin") == "/assess-skin"
+    assert label("GET", "/no-such-route") == "unmatched"
+    assert ("GET", "/no-such-route") not in middleware.route_labels
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def rate_limited(stub, monkeypatch):
+    """Every stub completion answers 429 with a one-second Retry-After"""
+    monkeypatch.setattr(stub, "stub_rate_limit_ratio", 1.0)
+    monkeypatch.setattr(stub, "stub_retry_after", 1)
+
+
+def upload(photo: bytes, name: str = "photo.jpg") -> tuple:
+    return ("files", (name, photo, "image/jpeg"))
+
+
+def test_rate_limit_is_passed_through_with_retry_after(client, run, photo, rate_limited):
+    response = run(client.post("/assess-skin", files={"file": ("photo.jpg", photo, "image/jpeg")}, params={"bypass_cache": True}))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_fully_rate_limited_batch_gets_429(client, run, photo, rate_limited):
+    response = run(client.post("/assess-skin/batch", files=[upload(photo, "a.jpg"), upload(photo, "b.jpg")], params={"bypass_cache": True}))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_partly_rate_limited_batch_keeps_retry_after_per_item(client, run, photo, rate_limited):
+    files = [upload(photo, "a.jpg"), ("files", ("notes.txt", b"not an image", "text/plain"))]
+    response = run(client.post("/assess-skin/batch", files=files, params={"bypass_cache": True}))
+    assert response.status_code == 200
+
+    rate_limited_item, rejected_item = response.json()["results"]
+    assert rate_limited_item["status_code"] == 429
+    assert rate_limited_item["retry_after"] == 1
+    assert rejected_item["status_code"] != 429
+    assert rejected_item["retry_after"] is None
+
+
+def test_batch_refused_by_the_limiter_queue_gets_503(client, run, photo, main, monkeypatch):
+    # Paused for longer than any call may queue, so the limiter refuses every item with a 503
+    monkeypatch.setattr(main.llm_rate_limiter, "_paused_until", time.monotonic() + 120)
+    response = run(client.post("/assess-skin/batch", files=[upload(photo, "a.jpg"), upload(photo, "b.jpg")], params={"bypass_cache": True}))
+    assert response.status_code == 503
+    assert 115 <= int(response.headers["Retry-After"]) <= 120
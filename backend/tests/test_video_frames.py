@@ -0,0 +1,73 @@
+import av
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def static_clip(tmp_path_factory) -> str:
+    """10 s of one unchanging picture with a keyframe every second, so every sampled frame is a near-duplicate"""
+    path = str(tmp_path_factory.mktemp("clips") / "static.mp4")
+    picture = np.random.default_rng(0).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    with av.open(path, "w") as container:
+        stream = container.add_stream("h264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 320, 240, "yuv420p"
+        stream.codec_context.gop_size = 30
+        for _ in range(300):
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(picture, format="rgb24")))
+        container.mux(stream.encode())
+    return path
+
+
+@pytest.fixture
+def opened(main, monkeypatch) -> list:
+    """Paths passed to av.open while the test runs"""
+    opened = []
+    real_open = main.av.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(main.av, "open", counting_open)
+    return opened
+
+
+def test_keyframe_backfill_reuses_the_first_decode_pass(main, monkeypatch, static_clip, opened):
+    monkeypatch.setattr(main, "video_frame_dedup_enabled", True)
+    selection = {}
+    frames = main.extract_video_frames(static_clip, num_frames=5, max_frames=3, mode="keyframe", selection=selection)
+
+    # Every later sampling point was tried as a backfill candidate, all from one open container
+    assert len(frames) == 1
+    assert selection["candidates_decoded"] == 5
+    assert selection["duplicates_dropped"] == 4
+    assert len(opened) == 1
+
+
+def test_motion_mode_and_breathing_share_one_downscaled_pass(main, client, run, monkeypatch, static_clip, opened):
+    monkeypatch.setattr(main, "video_frame_mode", "motion")
+    monkeypatch.setattr(main, "video_signals_enabled", True)
+    with open(static_clip, "rb") as clip_file:
+        files = {"file": ("static.mp4", clip_file.read(), "video/mp4")}
+    response = run(client.post("/analyze-video-health", files=files, params={"local_only": True}))
+
+    assert response.status_code == 200
+    assert response.json()["video_insights"]["local_signals"]["status"] == "ok"
+    # One downscaled pass for motion scoring and breathing, one seek pass for the chosen frames
+    assert len(opened) == 2
+
+
+def test_motion_mode_without_dedup_decodes_only_the_frame_budget(main, monkeypatch, static_clip):
+    requested = []
+    real_decode_frames_at = main.decode_frames_at
+
+    def recording_decode_frames_at(video, pts_list, fps):
+        requested.append(len(pts_list))
+        return real_decode_frames_at(video, pts_list, fps)
+
+    monkeypatch.setattr(main, "video_frame_dedup_enabled", False)
+    monkeypatch.setattr(main, "decode_frames_at", recording_decode_frames_at)
+    frames = main.extract_video_frames(static_clip, num_frames=5, max_frames=2, mode="motion")
+
+    assert len(frames) == 2
+    assert requested == [2]
@@ -0,0 +1,59 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+def poller_answering(main, monkeypatch, handler):
+    """A VideoIndexerPoller whose Video Indexer calls are answered by handler"""
+    monkeypatch.setattr(main, "get_video_indexer_access_token", lambda: "token")
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://video-indexer.test")
+    return main.VideoIndexerPoller(base_delay=0.01, max_delay=0.05, http_client=http)
+
+
+@pytest.mark.parametrize("response, message", [
+    (httpx.Response(200, text="<html>Service Unavailable</html>"), "Service Unavailable"),
+    (httpx.Response(200, json={"results": [{"id": "video-1"}]}), "video-1"),
+])
+def test_unreadable_state_response_fails_the_wait(main, run, monkeypatch, response, message):
+    poller = poller_answering(main, monkeypatch, lambda request: response)
+
+    async def wait():
+        try:
+            with pytest.raises(main.HTTPException) as failure:
+                # Well inside the deadline: the poll must fail, not time out
+                await asyncio.wait_for(poller.wait("video-1", max_wait_time=30), timeout=5)
+        finally:
+            poller._task.cancel()
+            await poller._http.aclose()
+        return failure.value
+
+    error = run(wait())
+    assert error.status_code == 500
+    assert message in error.detail
+
+
+
+def test_unexpected_check_error_keeps_the_backoff(main, run, monkeypatch):
+    poller = poller_answering(main, monkeypatch, lambda request: httpx.Response(200, json={"results": []}))
+
+    def broken_token():
+        raise RuntimeError("token cache corrupted")
+
+    monkeypatch.setattr(main, "get_video_indexer_access_token", broken_token)
+    # Always wait the longest backoff, so the schedule is 0.1, 0.2, 0.4, 0.8 s
+    monkeypatch.setattr(main.random, "uniform", lambda low, high: high)
+    poller.base_delay, poller.max_delay = 0.05, 10
+
+    async def wait():
+        try:
+            with pytest.raises(main.HTTPException) as failure:
+                await poller.wait("video-1", max_wait_time=1)
+        finally:
+            poller._task.cancel()
+            await poller._http.aclose()
+        return failure.value
+
+    assert run(wait()).status_code == 408
+    # Polled at 0, 0.1, 0.3 and 0.7 s rather than every base_delay
+    assert poller.stats["state_checks"] == 4
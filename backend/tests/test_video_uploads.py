@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def clip() -> bytes:
+    from bench_frame_extraction import make_clip
+
+    with open(make_clip(6, 320, 240, 30, "h264", 30), "rb") as clip_file:
+        return clip_file.read()
+
+
+def test_oversized_video_gets_413(client, run, main, monkeypatch):
+    monkeypatch.setattr(main, "video_max_upload_bytes", 1024)
+    body = b"\x00\x00\x00\x18ftypmp42" + b"\x00" * (main.VIDEO_UPLOAD_OVERHEAD + 4096)
+    response = run(client.post("/analyze-video-health", files={"file": ("big.mp4", body, "video/mp4")}, headers={"Origin": "https://app.example"}))
+    assert response.status_code == 413
+    # Browsers only show the error to a cross-origin frontend if it carries CORS headers
+    assert response.headers["access-control-allow-origin"] == "*"
+
+
+def test_non_video_part_gets_415(client, run, photo):
+    response = run(client.post("/analyze-video-health", files={"file": ("photo.jpg", photo, "image/jpeg")}))
+    assert response.status_code == 415
+
+
+def test_non_video_content_gets_415(client, run, photo):
+    response = run(client.post("/analyze-video-health", files={"file": ("fake.mp4", photo, "video/mp4")}, params={"local_only": True}))
+    assert response.status_code == 415
+    assert "video container" in response.json()["detail"]
+
+
+def test_local_only_analysis_reports_memory_per_request(client, run, clip):
+    response = run(client.post("/analyze-video-health", files={"file": ("clip.mp4", clip, "video/mp4")}, params={"local_only": True}))
+    assert response.status_code == 200
+    memory_usage = response.json()["memory_usage"]
+    assert memory_usage["rss_delta_mb"] == round(memory_usage["end"]["rss_mb"] - memory_usage["start"]["rss_mb"], 1)
+    assert memory_usage["end"]["process_peak_rss_mb"] >= memory_usage["end"]["rss_mb"]
+
+
+def test_transport_stream_sniff_needs_two_sync_bytes(main):
+    packet = b"\x47" + b"\x00" * 187
+    assert main.looks_like_video(packet * 2)
+    assert not main.looks_like_video(b"\x47 tiny text file")
+    assert not main.looks_like_video(packet)
+    assert not main.looks_like_video(b"\x47" + b"\x00" * 188)